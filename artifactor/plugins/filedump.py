@@ -9,9 +9,14 @@ artifactor:
         filedump:
             enabled: True
             plugin: filedump
+            store: True #Keep the artifacts in the content addressed store
+            compress: False #Gzip the big logs in the store, they are downloaded then
+
+See :py:mod:`artifactor.store` for the store.
 """
 
 from artifactor import ArtifactorBasePlugin
+from artifactor.store import ArtifactStore
 import base64
 import os
 import re
@@ -19,6 +24,12 @@ import re
 from cfme.utils import normalize_text, safe_string
 import six
 
+# Read back by the reporter or rewritten by the sanitize hook, so kept out of the store
+PLAIN_FILE_TYPES = {
+    "short_tb", "qa_contact", "traceback", "soft_traceback", "soft_short_tb", "rbac"}
+# Bytes from which a log is gzipped, if compressing
+COMPRESS_MIN_SIZE = 1024 * 1024
+
 
 class Filedump(ArtifactorBasePlugin):
 
@@ -29,8 +40,16 @@ class Filedump(ArtifactorBasePlugin):
         self.register_plugin_hook('finish_test', self.finish_test)
 
     def configure(self):
+        self.use_store = self.data.get('store', True)
+        self.compress = self.data.get('compress', False)
+        self.artifact_store = None
         self.configured = True
 
+    def get_store(self, artifact_dir):
+        if self.artifact_store is None:
+            self.artifact_store = ArtifactStore(artifact_dir)
+        return self.artifact_store
+
     def start_test(self, artifact_path, test_name, test_location, slaveid):
         if not slaveid:
             slaveid = "Master"
@@ -48,7 +67,7 @@ class Filedump(ArtifactorBasePlugin):
     def filedump(self, description, contents, slaveid=None, mode="w", contents_base64=False,
                  display_type="primary", display_glyph=None, file_type=None,
                  dont_write=False, os_filename=None, group_id=None, test_name=None,
-                 test_location=None):
+                 test_location=None, artifact_dir=None):
         if not slaveid:
             slaveid = "Master"
         test_ident = "{}/{}".format(self.store[slaveid]['test_location'],
@@ -69,6 +88,22 @@ class Filedump(ArtifactorBasePlugin):
                 os_filename = os_filename + ".ogv"
             else:
                 os_filename = os_filename + ".txt"
+        if not dont_write:
+            if contents_base64:
+                contents = base64.b64decode(contents)
+            if (self.use_store and artifact_dir and mode in {"w", "wb"} and
+                    file_type not in PLAIN_FILE_TYPES):
+                # the browser shows the rest of the artifacts, a .gz it would only download
+                compress = (self.compress and "b" not in mode and file_type == "log" and
+                            len(contents) >= COMPRESS_MIN_SIZE)
+                os_filename = self.get_store(artifact_dir).put(
+                    contents, os_filename, compress=compress, test=test_ident,
+                    description=description, file_type=file_type)
+            else:
+                if os.path.isfile(os_filename):
+                    os.remove(os_filename)
+                with open(os_filename, mode) as f:
+                    f.write(contents)
         artifacts.append({
             "file_type": file_type,
             "display_type": display_type,
@@ -77,13 +112,6 @@ class Filedump(ArtifactorBasePlugin):
             "os_filename": os_filename,
             "group_id": group_id,
         })
-        if not dont_write:
-            if os.path.isfile(os_filename):
-                os.remove(os_filename)
-            with open(os_filename, mode) as f:
-                if contents_base64:
-                    contents = base64.b64decode(contents)
-                f.write(contents)
 
         return None, {'artifacts': {test_ident: {'files': artifacts}}}
 
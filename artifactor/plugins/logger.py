@@ -29,6 +29,7 @@ class Logger(ArtifactorBasePlugin):
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('finish_test', self.finish_test)
         self.register_plugin_hook('log_message', self.log_message)
+        self.register_plugin_hook('log_messages', self.log_messages)
 
     def configure(self):
         self.configured = True
@@ -65,15 +66,42 @@ class Logger(ArtifactorBasePlugin):
             slaveid = "Master"
         self.store[slaveid].in_progress = False
 
-    @ArtifactorBasePlugin.check_configured
-    def log_message(self, log_record, slaveid):
+    @staticmethod
+    def make_record(log_record):
         # json transport fallout: args must be a dict or a tuple, json makes a tuple into a list
         args = log_record['args']
         log_record['args'] = tuple(args) if isinstance(args, list) else args
-        record = makeLogRecord(log_record)
+        return makeLogRecord(log_record)
+
+    @ArtifactorBasePlugin.check_configured
+    def log_message(self, log_record, slaveid):
+        record = self.make_record(log_record)
         if not slaveid:
             slaveid = "Master"
         if slaveid in self.store:
             handler = self.store[slaveid].handler
             if handler and record.levelno >= handler.level:
                 handler.handle(record)
+
+    @ArtifactorBasePlugin.check_configured
+    def log_messages(self, log_records, slaveid):
+        """Writes a batch of records from the ``ArtifactorHandler`` to the log of the test"""
+        if not slaveid:
+            slaveid = "Master"
+        if slaveid not in self.store:
+            return
+        handler = self.store[slaveid].handler
+        if not handler:
+            return
+        records = (self.make_record(log_record) for log_record in log_records)
+        lines = [
+            handler.format(record) + '\n' for record in records
+            if record.levelno >= handler.level and handler.filter(record)]
+        if not lines:
+            return
+        handler.acquire()
+        try:
+            handler.stream.write(''.join(lines))
+            handler.flush()
+        finally:
+            handler.release()
@@ -10,6 +10,8 @@ artifactor:
             enabled: False
             plugin: merkyl
             port: 8192
+            workers: 4 #Logs fetched from the appliance at once
+            compress: True #Store the logs gzipped
             log_files:
                 - /var/www/miq/vmdb/log/evm.log
                 - /var/www/miq/vmdb/log/production.log
@@ -17,9 +19,19 @@ artifactor:
 """
 
 from artifactor import ArtifactorBasePlugin
+from concurrent import futures
+from contextlib import closing
+import gzip
 import os.path
 import requests
 
+# Timeout of a request to merkyl
+MERKYL_TIMEOUT = 15
+# Default for the number of logs fetched from the appliance at once
+MERKYL_WORKERS = 4
+# Bytes of a log written to the artifact at once
+CHUNK_SIZE = 64 * 1024
+
 
 class Merkyl(ArtifactorBasePlugin):
 
@@ -42,9 +54,47 @@ class Merkyl(ArtifactorBasePlugin):
     def configure(self):
         self.files = self.data.get('log_files', [])
         self.port = self.data.get('port', '8192')
+        self.workers = self.data.get('workers', MERKYL_WORKERS)
+        self.compress = self.data.get('compress', True)
         self.tests = {}
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
         self.configured = True
 
+    def _get(self, ip, path, **kwargs):
+        url = "http://{}:{}/{}".format(ip, self.port, path)
+        return self.session.get(url, timeout=MERKYL_TIMEOUT, **kwargs)
+
+    def _log_sizes(self, ip):
+        """Returns the sizes of the logs merkyl collected, None if it can't tell them"""
+        try:
+            doc = self._get(ip, "sizes")
+            doc.raise_for_status()
+            return doc.json()
+        except (requests.RequestException, ValueError):
+            # older merkyl without the sizes
+            return None
+
+    def _fetch_log(self, ip, tail, os_filename, delete=False):
+        """Streams the log to the file, returns whether there was anything in it"""
+        try:
+            with closing(self._get(ip, "get/{}".format(tail), stream=True)) as doc:
+                doc.raise_for_status()
+                chunks = doc.iter_content(CHUNK_SIZE)
+                first_chunk = next(chunks, b'')
+                if first_chunk:
+                    opener = gzip.open if self.compress else open
+                    with opener(os_filename, 'wb') as f:
+                        f.write(first_chunk)
+                        for chunk in chunks:
+                            f.write(chunk)
+        finally:
+            # merkyl stops following the log even if it couldn't be fetched
+            if delete:
+                self._get(ip, "delete/{}".format(tail))
+        return bool(first_chunk)
+
     @ArtifactorBasePlugin.check_configured
     def start_test(self, test_name, test_location, ip):
         test_ident = "{}/{}".format(test_location, test_name)
@@ -54,8 +104,7 @@ class Merkyl(ArtifactorBasePlugin):
                 return None
         else:
             self.tests[test_ident] = self.Test(test_ident, ip, self.port)
-        url = "http://{}:{}/resetall".format(ip, self.port)
-        requests.get(url, timeout=15)
+        self._get(ip, "resetall")
 
         self.tests[test_ident].in_progress = True
 
@@ -65,8 +114,7 @@ class Merkyl(ArtifactorBasePlugin):
         ip = self.tests[test_ident].ip
 
         base, tail = os.path.split(filename)
-        url = "http://{}:{}/get/{}".format(ip, self.port, tail)
-        doc = requests.get(url, timeout=15)
+        doc = self._get(ip, "get/{}".format(tail))
         content = doc.content
         return {'merkyl_content': content}, None
 
@@ -78,47 +126,55 @@ class Merkyl(ArtifactorBasePlugin):
         if filename not in self.files:
             if filename not in self.tests[test_ident].extra_files:
                 self.tests[test_ident].extra_files.add(filename)
-                url = "http://{}:{}/setup{}".format(ip, self.port, filename)
-                requests.get(url, timeout=15)
+                self._get(ip, "setup{}".format(filename))
 
     @ArtifactorBasePlugin.check_configured
     def finish_test(self, artifact_path, test_name, test_location, ip, slaveid):
         test_ident = "{}/{}".format(test_location, test_name)
-        artifacts = []
-        for filename in self.files:
-            _, tail = os.path.split(filename)
-            url = "http://{}:{}/get/{}".format(ip, self.port, tail)
-            doc = requests.get(url, timeout=15)
-            artifacts.append((tail, doc.content))
-
-        for filename in self.tests[test_ident].extra_files:
-            _, tail = os.path.split(filename)
-            url = "http://{}:{}/get/{}".format(ip, self.port, tail)
-            doc = requests.get(url, timeout=15)
-            artifacts.append((tail, doc.content))
-
-            url = "http://{}:{}/delete/{}".format(ip, self.port, tail)
-            requests.get(url, timeout=15)
-
+        # tail -> whether merkyl stops following the log after the test
+        logs = [(os.path.split(filename)[1], False) for filename in self.files]
+        logs.extend(
+            (os.path.split(filename)[1], True) for filename in self.tests[test_ident].extra_files)
         del self.tests[test_ident]
-        for filename, contents in artifacts:
+
+        sizes = self._log_sizes(ip)
+        suffix = ".gz" if self.compress else ""
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            log_futures = []
+            for tail, delete in logs:
+                if sizes is not None and sizes.get(tail) == 0:
+                    # empty, no need to ask for it
+                    if delete:
+                        executor.submit(self._get, ip, "delete/{}".format(tail))
+                    continue
+                os_filename = os.path.join(
+                    artifact_path, "{}-merkyl-{}{}".format(self.ident, tail, suffix))
+                log_futures.append((tail, os_filename, executor.submit(
+                    self._fetch_log, ip, tail, os_filename, delete)))
+
+        for filename, os_filename, future in log_futures:
+            try:
+                if not future.result():
+                    continue
+            except requests.RequestException as e:
+                print("Merkyl failed to get {}: {}".format(filename, e))
+                continue
             self.fire_hook('filedump', test_location=test_location, test_name=test_name,
                 description="Merkyl: {}".format(filename), slaveid=slaveid,
-                contents=contents, file_type="log", display_type="danger",
-                display_glyph="align-justify", group_id="merkyl")
+                contents="", file_type="log", display_type="danger",
+                display_glyph="align-justify", dont_write=True, os_filename=os_filename,
+                group_id="merkyl")
         return None, None
 
     @ArtifactorBasePlugin.check_configured
     def start_session(self, ip):
         """Session started"""
         for file_name in self.files:
-            url = "http://{}:{}/setup{}".format(ip, self.port, file_name)
-            requests.get(url, timeout=15)
+            self._get(ip, "setup{}".format(file_name))
 
     @ArtifactorBasePlugin.check_configured
     def finish_session(self, ip):
         """Session finished"""
         for filename in self.files:
             base, tail = os.path.split(filename)
-            url = "http://{}:{}/delete/{}".format(ip, self.port, tail)
-            requests.get(url, timeout=15)
+            self._get(ip, "delete/{}".format(tail))
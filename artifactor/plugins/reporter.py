@@ -11,13 +11,23 @@ artifactor:
             enabled: True
             plugin: reporter
             only_failed: False #Only show faled tests in the report
+            report_interval: 60 #Seconds between renders of the report during the session
+
+The report is kept up to date test by test as the results come, and rendered at most once
+every ``report_interval`` seconds, and at the end of the session.
+
+The tracebacks of the failed tests are clustered for the top 10 exceptions of the report, all
+of the clusters are written to ``tracebacks.json`` next to the report.
 """
 import csv
 import datetime
-import difflib
+import json
 import math
+import random
 import shutil
 import time
+import zlib
+from collections import OrderedDict, defaultdict
 from copy import deepcopy
 
 import os
@@ -26,6 +36,7 @@ from jinja2 import Environment, FileSystemLoader
 from py.path import local
 
 from artifactor import ArtifactorBasePlugin
+from artifactor.store import index_summary
 from cfme.utils import process_pytest_path
 from cfme.utils.conf import cfme_data  # Only for the provider specific reports
 from cfme.utils.path import template_path
@@ -44,10 +55,115 @@ _tests_tpl = {
     '_duration': 0
 }
 
+# Default for seconds between renders of the report while the tests are running
+REPORT_INTERVAL = 60
+
 # Regexp, that finds all URLs in a string
 # Does not cover all the cases, but rather only those we can
 URL = re.compile(r"https?://[^/\s]+(?:/[^/\s?]+)*/?(?:\?(?:[^&\s=]+(?:=[^&\s]+)?&?)*)?")
 
+# Parts of a traceback which differ between the failures of the same problem
+TB_NOISE = [
+    (re.compile(r'\b[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}\b'), '<uuid>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<addr>'),
+    (re.compile(r'\b(?=[0-9a-fA-F]*[0-9])[0-9a-fA-F]{8,}\b'), '<id>'),
+    (re.compile(r'\d+(?:\.\d+)*'), '<n>'),
+    (re.compile(r'\s+'), ' '),
+]
+# Tracebacks whose signatures are at least this similar end up in the same cluster
+TB_SIMILARITY = 0.8
+# MinHash of the signatures, split to bands of rows for the candidates of similar signatures
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_random = random.Random(0)
+MINHASH_SEEDS = [
+    (_minhash_random.randint(1, _MINHASH_PRIME - 1), _minhash_random.randint(0, _MINHASH_PRIME - 1))
+    for _ in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+
+def traceback_signature(traceback):
+    """Returns the traceback with ids, addresses and numbers replaced by placeholders"""
+    signature = traceback.strip()
+    for regexp, placeholder in TB_NOISE:
+        signature = regexp.sub(placeholder, signature)
+    return signature
+
+
+def minhash(signature):
+    """Returns the MinHash of the word trigrams of the signature"""
+    words = signature.split()
+    shingles = set(
+        zlib.crc32(' '.join(words[i:i + 3]).encode('utf-8')) & 0xffffffff
+        for i in range(max(len(words) - 2, 1)))
+    return tuple(
+        min((a * shingle + b) % _MINHASH_PRIME for shingle in shingles)
+        for a, b in MINHASH_SEEDS)
+
+
+def cluster_tracebacks(tb_errors):
+    """Clusters the tracebacks of the tests by their signatures
+
+    The tests with the same signature are clustered right away, the distinct signatures are then
+    merged when their MinHashes estimate them to be similar enough. Only the signatures sharing
+    a band of the MinHash are compared, so this stays about linear in the number of failures.
+
+    Args:
+        tb_errors: list of ``(traceback, test_name)``
+    Returns:
+        list of the clusters as lists of ``(traceback, test_name)``, the biggest first
+    """
+    by_signature = OrderedDict()
+    for entry in tb_errors:
+        by_signature.setdefault(traceback_signature(entry[0]), []).append(entry)
+    signatures = list(by_signature)
+    hashes = [minhash(signature) for signature in signatures]
+    # Union-find of the signature indices
+    parents = list(range(len(signatures)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for band in range(MINHASH_BANDS):
+        buckets = defaultdict(list)
+        rows = slice(band * MINHASH_ROWS, (band + 1) * MINHASH_ROWS)
+        for i, signature_hash in enumerate(hashes):
+            buckets[signature_hash[rows]].append(i)
+        for candidates in buckets.values():
+            first = candidates[0]
+            for i in candidates[1:]:
+                if find(i) == find(first):
+                    continue
+                same = sum(1 for x, y in zip(hashes[first], hashes[i]) if x == y)
+                if same >= TB_SIMILARITY * len(MINHASH_SEEDS):
+                    parents[find(i)] = find(first)
+    clusters = OrderedDict()
+    for i, signature in enumerate(signatures):
+        clusters.setdefault(find(i), []).extend(by_signature[signature])
+    return sorted(clusters.values(), key=len, reverse=True)
+
+
+def write_tb_clusters(clusters, log_dir):
+    """Writes all of the traceback clusters to ``tracebacks.json`` in the log dir"""
+    data = [
+        {'signature': traceback_signature(cluster[0][0]), 'count': len(cluster),
+         'traceback': cluster[0][0], 'tests': [test_name for _, test_name in cluster]}
+        for cluster in clusters]
+    with open(os.path.join(log_dir, 'tracebacks.json'), 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def get_traceback(test):
+    """Returns the traceback of the test from its ``tb_info``, None if it has none"""
+    exception = test.get('exception')
+    if not exception:
+        return None
+    return exception.get('short_tb') or '{} at {}'.format(
+        exception.get('exception'), exception.get('file_line'))
+
 
 def overall_test_status(statuses):
     # Handle some logic for when to count certain tests as which state
@@ -74,6 +190,7 @@ class ReporterBase(object):
                                   if x['outcomes']['overall'] not in ['passed']]
 
         self.render_report(template_data, 'report', artifact_dir, 'test_report.html')
+        write_tb_clusters(template_data['tb_clusters'], artifact_dir)
 
     def _run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
         for mgmt in cfme_data['management_systems'].keys():
@@ -103,6 +220,7 @@ class ReporterBase(object):
         template_data = {'tests': [], 'qa': []}
         template_data['version'] = version
         template_data['fw_version'] = fw_version
+        template_data['artifact_storage'] = index_summary(log_dir)
         log_dir = local(log_dir).strpath + "/"
         counts = {
             'passed': 0,
@@ -118,99 +236,27 @@ class ReporterBase(object):
             'error': 0,
             'xfailed': 0,
             'xpassed': 0}
-        colors = {
-            'passed': 'success',
-            'failed': 'warning',
-            'error': 'danger',
-            'xpassed': 'danger',
-            'xfailed': 'success',
-            'skipped': 'info'}
         # Iterate through the tests and process the counts and durations
         for test_name, test in artifacts.items():
-            if not test.get('statuses'):
+            test_data = self.process_test(test_name, test, log_dir)
+            if test_data is None:
                 continue
-            overall_status = overall_test_status(test['statuses'])
+            overall_status = test_data['outcomes']['overall']
             counts[overall_status] += 1
-            if not test.get('old', False):
+            if not test_data.get('old', False):
                 current_counts[overall_status] += 1
-            color = colors[overall_status]
-            # This was removed previously but is needed as the overall is not generated
-            # until the test finishes. So this is here as a shim.
-            test['statuses']['overall'] = overall_status
-            test_data = {'name': test_name, 'outcomes': test['statuses'],
-                         'slaveid': test.get('slaveid', "Unknown"), 'color': color}
-            if 'composite' in test:
-                test_data['composite'] = test['composite']
-
-            if 'skipped' in test:
-                if test['skipped'].get('type') == 'provider':
-                    provider_skip_count += 1
-                    test_data['skip_provider'] = test['skipped'].get('reason')
-                if test['skipped'].get('type') == 'blocker':
-                    blocker_skip_count += 1
-                    test_data['skip_blocker'] = test['skipped'].get('reason')
-
+            if 'skip_provider' in test_data:
+                provider_skip_count += 1
             if 'skip_blocker' in test_data:
-                # Fix the inconveniently long list of repeated blockers until we sort out sets
-                # in riggerlib somehow.
-                test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
-
-            if test.get('old', False):
-                test_data['old'] = True
-
-            if test.get('start_time'):
-                if test.get('finish_time'):
-                    test_data['in_progress'] = False
-                    test_data['duration'] = test['finish_time'] - test['start_time']
-                else:
-                    test_data['duration'] = time.time() - test['start_time']
-                    test_data['in_progress'] = True
-
-            # Set up destinations for the files
-            test_data["file_groups"] = []
-            test_data['qa_contact'] = []
-            processed_groups = {}
-            order = 0
-            for file_dict in test.get('files', []):
-                group = file_dict["group_id"]
-                if group not in processed_groups:
-                    processed_groups[group] = (order, [])
-                    order += 1
-                processed_groups[group][-1].append(file_dict)
-            # Current structure:
-            # {groupid: (group_order, [{filedict1}, {filedict2}])}
-            # Sorting by group_order
-            processed_groups = sorted(processed_groups.items(), key=lambda kv: kv[1][0])
-            # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
-            processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
-            for group_name, file_dicts in processed_groups:
-                group_file_list = []
-                for file_dict in file_dicts:
-                    if file_dict["file_type"] == "qa_contact":
-                        with open(file_dict["os_filename"], 'rb') as qafile:
-                            qareader = csv.reader(qafile, delimiter=',', quotechar='"')
-                            for qacontact in qareader:
-                                test_data['qa_contact'].append(qacontact)
-                                if qacontact[0] not in template_data['qa']:
-                                    template_data['qa'].append(qacontact[0])
-                        continue  # Do not store, handled a different way :)
-                    elif file_dict["file_type"] == "short_tb":
-                        with open(file_dict["os_filename"], 'r') as short_tb:
-                            test_data["short_tb"] = short_tb.read()
-                        continue
-                    file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
-                    group_file_list.append(file_dict)
-
-                test_data["file_groups"].append((group_name, group_file_list))
-            # Snd remove groups that are left empty because of eg. traceback or qa contact
-            test_data["file_groups"] = filter(
-                lambda group: len(group[1]) > 0, test_data["file_groups"])
-            if "short_tb" in test_data and test_data["short_tb"]:
-                urls = [url for url in URL.findall(test_data["short_tb"])]
-                if urls:
-                    test_data["urls"] = urls
+                blocker_skip_count += 1
+            for qacontact in test_data['qa_contact']:
+                if qacontact[0] not in template_data['qa']:
+                    template_data['qa'].append(qacontact[0])
             template_data['tests'].append(test_data)
-        template_data['top10'] = self.top10(tb_errors)
+            if test_data.get('traceback'):
+                tb_errors.append((test_data['traceback'], test_name))
+        template_data['tb_clusters'] = cluster_tracebacks(tb_errors)
+        template_data['top10'] = template_data['tb_clusters'][:10]
         template_data['counts'] = counts
         template_data['current_counts'] = current_counts
         template_data['blocker_skip_count'] = blocker_skip_count
@@ -237,24 +283,102 @@ class ReporterBase(object):
 
         return template_data
 
-    def top10(self, tb_errors):
-        sets = []
-        for entry in tb_errors:
-            for tset in sets:
-                if difflib.SequenceMatcher(a=entry[0][:10], b=tset[0][0][:10]).ratio() > .8:
-                    if difflib.SequenceMatcher(a=entry[0][:20], b=tset[0][0][:20]).ratio() > .75:
-                        if difflib.SequenceMatcher(a=entry[0][:30], b=tset[0][0][:30]).ratio() > .7:
-                            tset.append(entry)
-                            break
+    def process_test(self, test_name, test, log_dir):
+        """Returns the data of a test for the report, None if it has no results yet"""
+        colors = {
+            'passed': 'success',
+            'failed': 'warning',
+            'error': 'danger',
+            'xpassed': 'danger',
+            'xfailed': 'success',
+            'skipped': 'info'}
+        if not test.get('statuses'):
+            return None
+        overall_status = overall_test_status(test['statuses'])
+        color = colors[overall_status]
+        # This was removed previously but is needed as the overall is not generated
+        # until the test finishes. So this is here as a shim.
+        test['statuses']['overall'] = overall_status
+        test_data = {'name': test_name, 'outcomes': test['statuses'],
+                     'slaveid': test.get('slaveid', "Unknown"), 'color': color}
+        if 'composite' in test:
+            test_data['composite'] = test['composite']
+
+        if 'skipped' in test:
+            if test['skipped'].get('type') == 'provider':
+                test_data['skip_provider'] = test['skipped'].get('reason')
+            if test['skipped'].get('type') == 'blocker':
+                test_data['skip_blocker'] = test['skipped'].get('reason')
+
+        if 'skip_blocker' in test_data:
+            # Fix the inconveniently long list of repeated blockers until we sort out sets
+            # in riggerlib somehow.
+            test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
+
+        if test.get('old', False):
+            test_data['old'] = True
+
+        traceback = get_traceback(test)
+        if traceback:
+            test_data['traceback'] = traceback
+
+        if test.get('start_time'):
+            if test.get('finish_time'):
+                test_data['in_progress'] = False
+                test_data['duration'] = test['finish_time'] - test['start_time']
             else:
-                sets.append([entry])
-
-        return sorted(sets, lambda p, q: cmp(len(p), len(q)), reverse=True)[:10]
-
-    def build_dict(self, path, container, contents):
+                test_data['duration'] = time.time() - test['start_time']
+                test_data['in_progress'] = True
+
+        # Set up destinations for the files
+        test_data["file_groups"] = []
+        test_data['qa_contact'] = []
+        processed_groups = {}
+        order = 0
+        for file_dict in test.get('files', []):
+            group = file_dict["group_id"]
+            if group not in processed_groups:
+                processed_groups[group] = (order, [])
+                order += 1
+            processed_groups[group][-1].append(file_dict)
+        # Current structure:
+        # {groupid: (group_order, [{filedict1}, {filedict2}])}
+        # Sorting by group_order
+        processed_groups = sorted(processed_groups.items(), key=lambda kv: kv[1][0])
+        # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
+        processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
+        for group_name, file_dicts in processed_groups:
+            group_file_list = []
+            for file_dict in file_dicts:
+                if file_dict["file_type"] == "qa_contact":
+                    with open(file_dict["os_filename"], 'rb') as qafile:
+                        qareader = csv.reader(qafile, delimiter=',', quotechar='"')
+                        for qacontact in qareader:
+                            test_data['qa_contact'].append(qacontact)
+                    continue  # Do not store, handled a different way :)
+                elif file_dict["file_type"] == "short_tb":
+                    with open(file_dict["os_filename"], 'r') as short_tb:
+                        test_data["short_tb"] = short_tb.read()
+                    continue
+                file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
+                group_file_list.append(file_dict)
+
+            test_data["file_groups"].append((group_name, group_file_list))
+        # Snd remove groups that are left empty because of eg. traceback or qa contact
+        test_data["file_groups"] = filter(
+            lambda group: len(group[1]) > 0, test_data["file_groups"])
+        if "short_tb" in test_data and test_data["short_tb"]:
+            urls = [url for url in URL.findall(test_data["short_tb"])]
+            if urls:
+                test_data["urls"] = urls
+        return test_data
+
+    def build_dict(self, path, container, contents, count=1):
         """
         Build a hierarchical dictionary including information about the stats at each level
         and the duration.
+
+        With ``count=-1``, the test is taken out of the dictionary again.
         """
 
         if isinstance(path, six.string_types):
@@ -267,17 +391,20 @@ class ReporterBase(object):
 
         # If we are at the end node, ie a test.
         if not end:
-            container['_sub'][head] = contents
-            container['_stats'][contents['outcomes']['overall']] += 1
-            container['_duration'] += contents['duration']
+            if count > 0:
+                container['_sub'][head] = contents
+            else:
+                container['_sub'].pop(head, None)
+            container['_stats'][contents['outcomes']['overall']] += count
+            container['_duration'] += count * contents['duration']
         # If we are in a module.
         else:
             if head not in container['_sub']:
                 container['_sub'][head] = deepcopy(_tests_tpl)
             # Call again to recurse down the tree.
-            self.build_dict(end, container['_sub'][head], contents)
-            container['_stats'][contents['outcomes']['overall']] += 1
-            container['_duration'] += contents['duration']
+            self.build_dict(end, container['_sub'][head], contents, count)
+            container['_stats'][contents['outcomes']['overall']] += count
+            container['_duration'] += count * contents['duration']
 
     def build_li(self, lev):
         """
@@ -338,11 +465,96 @@ class ReporterBase(object):
         return list_string
 
 
+class ReportBuilder(object):
+    """Keeps the data of the report up to date test by test, so it can be rendered at any time
+
+    Only the tests which changed are processed again, and taken out of and put back into the
+    counts and the tree of the report.
+    """
+    def __init__(self, reporter, log_dir):
+        self.reporter = reporter
+        self.log_dir = local(log_dir).strpath + "/"
+        # test name -> data of the test for the report, in the order they came
+        self.tests = OrderedDict()
+        # names of all the tests seen, including those without results
+        self.known = set()
+        self.in_progress = set()
+        self.counts = {status: 0 for status in _tests_tpl['_stats']}
+        self.current_counts = {status: 0 for status in _tests_tpl['_stats']}
+        self.blocker_skip_count = 0
+        self.provider_skip_count = 0
+        self.qa = []
+        self.tree = deepcopy(_tests_tpl)
+        self.tree['_sub']['tests'] = deepcopy(_tests_tpl)
+        self.last_render = 0
+
+    def update(self, test_name, test):
+        """Process the test again"""
+        self.known.add(test_name)
+        old_data = self.tests.pop(test_name, None)
+        if old_data is not None:
+            self._count(old_data, -1)
+        test_data = self.reporter.process_test(test_name, test, self.log_dir)
+        if test_data is None:
+            return
+        self.tests[test_name] = test_data
+        self._count(test_data, 1)
+        for qacontact in test_data['qa_contact']:
+            if qacontact[0] not in self.qa:
+                self.qa.append(qacontact[0])
+        if test_data.get('in_progress'):
+            self.in_progress.add(test_name)
+        else:
+            self.in_progress.discard(test_name)
+
+    def _count(self, test_data, count):
+        overall_status = test_data['outcomes']['overall']
+        self.counts[overall_status] += count
+        if not test_data.get('old', False):
+            self.current_counts[overall_status] += count
+        if 'skip_provider' in test_data:
+            self.provider_skip_count += count
+        if 'skip_blocker' in test_data:
+            self.blocker_skip_count += count
+        self.reporter.build_dict(
+            test_data['name'].replace('cfme/', ''), self.tree, test_data, count)
+
+    def template_data(self, artifacts, version, fw_version, only_failed=False):
+        """Returns the data for the report template, like :py:meth:`ReporterBase.process_data`"""
+        # The tests still running take longer and longer
+        for test_name in list(self.in_progress):
+            self.update(test_name, artifacts[test_name])
+        tests = []
+        for test_data in self.tests.values():
+            if test_data.get('duration'):
+                test_data = dict(test_data, duration=str(datetime.timedelta(
+                    seconds=math.ceil(test_data['duration']))))
+            tests.append(test_data)
+        if only_failed:
+            tests = [x for x in tests if x['outcomes']['overall'] not in ['passed']]
+        tb_clusters = cluster_tracebacks([
+            (test_data['traceback'], test_name) for test_name, test_data in self.tests.items()
+            if test_data.get('traceback')])
+        return {
+            'tests': tests,
+            'qa': list(self.qa),
+            'version': version,
+            'fw_version': fw_version,
+            'artifact_storage': index_summary(self.log_dir),
+            'tb_clusters': tb_clusters,
+            'top10': tb_clusters[:10],
+            'counts': dict(self.counts),
+            'current_counts': dict(self.current_counts),
+            'blocker_skip_count': self.blocker_skip_count,
+            'provider_skip_count': self.provider_skip_count,
+            'ndata': self.reporter.build_li(self.tree),
+        }
+
+
 class Reporter(ArtifactorBasePlugin, ReporterBase):
     def plugin_initialize(self):
         self.register_plugin_hook('report_test', self.report_test)
-        self.register_plugin_hook('finish_session', self.run_report)
-        self.register_plugin_hook('finish_session', self.run_provider_report)
+        self.register_plugin_hook('finish_session', self.finish_session)
         self.register_plugin_hook('build_report', self.run_report)
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('skip_test', self.skip_test)
@@ -353,6 +565,10 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
 
     def configure(self):
         self.only_failed = self.data.get('only_failed', False)
+        self.report_interval = self.data.get('report_interval', REPORT_INTERVAL)
+        self.builder = None
+        # tests whose artifacts changed since the report was last updated
+        self.changed_tests = set()
         self.configured = True
 
     @ArtifactorBasePlugin.check_configured
@@ -362,6 +578,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
     @ArtifactorBasePlugin.check_configured
     def skip_test(self, test_location, test_name, skip_data):
         test_ident = "{}/{}".format(test_location, test_name)
+        self.changed_tests.add(test_ident)
         return None, {'artifacts': {test_ident: {'skipped': skip_data}}}
 
     @ArtifactorBasePlugin.check_configured
@@ -371,6 +588,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
         if not param_dict:
             param_dict = {}
         test_ident = "{}/{}".format(test_location, test_name)
+        self.changed_tests.add(test_ident)
         return None, {'artifacts': {test_ident: {
             'start_time': time.time(), 'slaveid': slaveid, 'tier': tier or "N/A",
             'params': param_dict, 'requirement': requirement or "None",
@@ -381,6 +599,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
     @ArtifactorBasePlugin.check_configured
     def finish_test(self, artifacts, test_location, test_name, slaveid):
         test_ident = "{}/{}".format(test_location, test_name)
+        self.changed_tests.add(test_ident)
         overall_status = overall_test_status(artifacts[test_ident]['statuses'])
         return None, {'artifacts': {test_ident: {
             'finish_time': time.time(), 'slaveid': slaveid,
@@ -391,6 +610,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
     def report_test(self, artifacts, test_location, test_name, test_xfail, test_when, test_outcome,
                     test_phase_duration):
         test_ident = "{}/{}".format(test_location, test_name)
+        self.changed_tests.add(test_ident)
         ret_dict = {
             'artifacts': {
                 test_ident: {
@@ -410,6 +630,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
     @ArtifactorBasePlugin.check_configured
     def tb_info(self, test_location, test_name, exception, file_line, short_tb):
         test_ident = "{}/{}".format(test_location, test_name)
+        self.changed_tests.add(test_ident)
         return None, {'artifacts': {test_ident: {
             'exception':
                 {'file_line': file_line, 'exception': exception, 'short_tb': short_tb}
@@ -417,8 +638,40 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
 
     @ArtifactorBasePlugin.check_configured
     def run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
-        self._run_report(old_artifacts, artifact_dir, version, fw_version)
+        self.update_report(old_artifacts, artifact_dir)
+        if time.time() - self.builder.last_render >= self.report_interval:
+            self.render_incremental_report(old_artifacts, artifact_dir, version, fw_version)
+
+    @ArtifactorBasePlugin.check_configured
+    def finish_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        self.update_report(old_artifacts, artifact_dir, everything=True)
+        self.render_incremental_report(old_artifacts, artifact_dir, version, fw_version)
+
+    def update_report(self, artifacts, artifact_dir, everything=False):
+        """Process the tests which changed since the last update, or all of them"""
+        if self.builder is None:
+            self.builder = ReportBuilder(self, artifact_dir)
+        if everything:
+            changed = set(artifacts)
+        else:
+            changed = self.changed_tests
+            # tests which came without any of the hooks, like old ones from a composite run
+            if len(artifacts) != len(self.builder.known):
+                changed = changed.union(set(artifacts) - self.builder.known)
+        for test_ident in changed:
+            if test_ident in artifacts:
+                self.builder.update(test_ident, artifacts[test_ident])
+        self.changed_tests = set()
+
+    def render_incremental_report(self, artifacts, artifact_dir, version, fw_version):
+        template_data = self.builder.template_data(
+            artifacts, version, fw_version, only_failed=self.only_failed)
+        self.render_report(template_data, 'report', artifact_dir, 'test_report.html')
+        write_tb_clusters(template_data['tb_clusters'], artifact_dir)
+        self.builder.last_render = time.time()
 
     @ArtifactorBasePlugin.check_configured
-    def run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+    def finish_session(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        # riggerlib keeps one callback per hook and plugin, so both reports are done here
+        self.finish_report(old_artifacts, artifact_dir, version, fw_version)
         self._run_provider_report(old_artifacts, artifact_dir, version, fw_version)
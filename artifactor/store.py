@@ -0,0 +1,148 @@
+"""Content addressed store for the artifacts of the tests
+
+Every artifact is written once, as a blob named after the sha1 of its contents, under ``blobs``
+in the artifact dir. The artifacts put compressed are gzipped on the way. The file of the
+artifact in the directory of the test is a hard link to its blob, so the screenshots which are
+the same for every soft assert and retry of a test take the space of one.
+
+The artifacts stored during the session are listed in ``artifact_index.json`` in the artifact
+dir, one json object per line::
+
+    {"test": "cfme/tests/test_foo.py/test_bar", "description": "Screenshot",
+     "file_type": "screenshot", "os_filename": "/.../screenshot.png", "blob": "ab/ab12...png",
+     "size": 102400, "stored_size": 0, "compressed": false}
+
+``size`` is the size of the artifact, ``stored_size`` the bytes it added to the store, which is
+0 for a duplicate. The store keeps the totals of the index as it goes, so the reports rendered
+during the session don't read it again and again.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from threading import Lock
+
+import six
+
+BLOB_DIR = 'blobs'
+INDEX_FILENAME = 'artifact_index.json'
+
+# artifact dir -> the store of the session in this process
+_stores = {}
+
+
+class ArtifactStore(object):
+    """Stores the artifacts in the artifact dir, see the module docs
+
+    Args:
+        artifact_dir: the root of the artifacts
+    """
+    def __init__(self, artifact_dir):
+        self.artifact_dir = artifact_dir
+        self.blob_dir = os.path.join(artifact_dir, BLOB_DIR)
+        self.index_filename = os.path.join(artifact_dir, INDEX_FILENAME)
+        self._lock = Lock()
+        self._summary = {'files': 0, 'size': 0, 'stored_size': 0}
+        # the index lists the artifacts of this session only
+        with open(self.index_filename, 'w'):
+            pass
+        _stores[os.path.abspath(artifact_dir)] = self
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.blob_dir, digest[:2], digest + ext)
+
+    def _write_blob(self, path, contents, compress):
+        """Writes the blob unless it's there already, returns the bytes it took"""
+        if os.path.isfile(path):
+            return 0
+        blob_dir = os.path.dirname(path)
+        if not os.path.isdir(blob_dir):
+            try:
+                os.makedirs(blob_dir)
+            except OSError:
+                # made by another hook meanwhile
+                if not os.path.isdir(blob_dir):
+                    raise
+        # written aside and renamed, so a blob is never seen half written
+        fd, tmp_path = tempfile.mkstemp(dir=blob_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if compress:
+                    with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                        gz.write(contents)
+                else:
+                    f.write(contents)
+            # mkstemp makes it private
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return os.path.getsize(path)
+
+    def put(self, contents, os_filename, compress=False, test=None, description=None,
+            file_type=None):
+        """Stores the artifact and links it to ``os_filename``
+
+        Returns:
+            the name of the artifact file, ``os_filename`` with ``.gz`` appended if compressed
+        """
+        if isinstance(contents, six.text_type):
+            contents = contents.encode('utf-8')
+        digest = hashlib.sha1(contents).hexdigest()
+        ext = os.path.splitext(os_filename)[1]
+        if compress:
+            ext += '.gz'
+            os_filename += '.gz'
+        path = self.blob_path(digest, ext)
+        stored_size = self._write_blob(path, contents, compress)
+        if os.path.lexists(os_filename):
+            os.remove(os_filename)
+        try:
+            os.link(path, os_filename)
+        except OSError:
+            # no hard links on the filesystem
+            shutil.copyfile(path, os_filename)
+        entry = {
+            'test': test, 'description': description, 'file_type': file_type,
+            'os_filename': os_filename, 'blob': os.path.relpath(path, self.blob_dir),
+            'size': len(contents), 'stored_size': stored_size, 'compressed': compress}
+        with self._lock:
+            with open(self.index_filename, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self._summary['files'] += 1
+            self._summary['size'] += entry['size']
+            self._summary['stored_size'] += stored_size
+        return os_filename
+
+    def summary(self):
+        """Returns the totals of the index, like :py:func:`index_summary`"""
+        with self._lock:
+            return dict(self._summary)
+
+
+def read_index(artifact_dir):
+    """Returns the entries of the artifact index of the session, see the module docs"""
+    try:
+        with open(os.path.join(artifact_dir, INDEX_FILENAME)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except IOError:
+        return []
+
+
+def index_summary(artifact_dir):
+    """Returns the number of artifacts of the session, their size and the size they took
+
+    The totals come from the store if it's open in this process, from the index otherwise.
+    """
+    store = _stores.get(os.path.abspath(artifact_dir))
+    if store is not None:
+        return store.summary()
+    entries = read_index(artifact_dir)
+    return {
+        'files': len(entries),
+        'size': sum(entry['size'] for entry in entries),
+        'stored_size': sum(entry['stored_size'] for entry in entries),
+    }
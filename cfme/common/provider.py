@@ -3,6 +3,7 @@ import datetime
 from collections import Iterable
 
 from manageiq_client.api import APIException
+from manageiq_client.filters import Q
 from widgetastic.widget import View, Text
 from widgetastic_patternfly import Button, Input
 
@@ -23,6 +24,11 @@ from cfme.utils.varmeth import variable
 from cfme.utils.wait import wait_for, RefreshTimer
 from . import PolicyProfileAssignable
 
+# Resources requested at once from a REST collection
+REST_PAGE_SIZE = 1000
+# Names looked up in a single REST request, they all go to the query string
+REST_NAMES_PER_REQUEST = 50
+
 
 # TODO: Move to collection when it happens
 def base_types():
@@ -826,6 +832,56 @@ class BaseProvider(Taggable, Updateable, Navigatable, BaseEntity):
     def get_console_fullscreen_btn(self):
         raise NotImplementedError("This method is not implemented for given provider")
 
+    def get_rest_resources(self, collection, attributes, filters=None):
+        """
+        Returns all resources of a REST collection with the attributes filled in, getting them in
+        as few requests as the pagination allows instead of one per resource.
+
+        Args:
+            collection: Name of the REST collection, like ``vms``
+            attributes: Names of the attributes to get for each resource
+            filters: ``filter[]`` expressions the resources have to match, see
+                :py:class:`manageiq_client.filters.Q`
+        """
+        collection = getattr(self.appliance.rest_api.collections, collection)
+        params = {
+            'expand': 'resources',
+            'attributes': ','.join(attributes),
+            'sort_by': 'id',
+            'sort_order': 'asc',
+            'limit': REST_PAGE_SIZE,
+        }
+        if filters:
+            params['filter[]'] = filters
+        resources = []
+        while True:
+            # the resources are complete, reading their attributes doesn't make any more requests
+            page = collection.query_string(offset=len(resources), **params).resources
+            resources.extend(page)
+            if len(page) < REST_PAGE_SIZE:
+                return resources
+
+    def get_rest_name_id_map(self, collection, names=None):
+        """
+        Returns a dictionary mapping names of resources of a REST collection to their ids, for
+        just the given names, or all of the resources. The lowest id wins for duplicate names.
+        """
+        if names is None:
+            filters = [None]
+        else:
+            names = list(names)
+            filters = []
+            for start in range(0, len(names), REST_NAMES_PER_REQUEST):
+                q = None
+                for name in names[start:start + REST_NAMES_PER_REQUEST]:
+                    q = Q('name', '=', name) if q is None else q | Q('name', '=', name)
+                filters.append(q.as_filters)
+        id_map = {}
+        for name_filters in filters:
+            for resource in self.get_rest_resources(collection, ['id', 'name'], name_filters):
+                id_map.setdefault(resource.name, resource.id)
+        return id_map
+
     def get_all_provider_ids(self):
         """
         Returns an integer list of provider ID's via the REST API
@@ -833,15 +889,11 @@ class BaseProvider(Taggable, Updateable, Navigatable, BaseEntity):
         # TODO: Move to ProviderCollection
         logger.debug('Retrieving the list of provider ids')
 
-        provider_ids = []
         try:
-            for prov in self.appliance.rest_api.collections.providers.all:
-                provider_ids.append(prov.id)
+            return [prov.id for prov in self.get_rest_resources('providers', ['id'])]
         except APIException:
             return None
 
-        return provider_ids
-
     def get_all_vm_ids(self):
         """
         Returns an integer list of vm ID's via the REST API
@@ -849,15 +901,11 @@ class BaseProvider(Taggable, Updateable, Navigatable, BaseEntity):
         # TODO: Move to VMCollection or BaseVMCollection
         logger.debug('Retrieving the list of vm ids')
 
-        vm_ids = []
         try:
-            for vm in self.appliance.rest_api.collections.vms.all:
-                vm_ids.append(vm.id)
+            return [vm.id for vm in self.get_rest_resources('vms', ['id'])]
         except APIException:
             return None
 
-        return vm_ids
-
     def get_all_host_ids(self):
         """
         Returns an integer list of host ID's via the Rest API
@@ -865,26 +913,20 @@ class BaseProvider(Taggable, Updateable, Navigatable, BaseEntity):
         # TODO: Move to HostCollection
         logger.debug('Retrieving the list of host ids')
 
-        host_ids = []
         try:
-            for host in self.appliance.rest_api.collections.hosts.all:
-                host_ids.append(host.id)
+            return [host.id for host in self.get_rest_resources('hosts', ['id'])]
         except APIException:
             return None
-        return host_ids
 
     def get_all_template_ids(self):
         """Returns an integer list of template ID's via the Rest API"""
         # TODO: Move to TemplateCollection
         logger.debug('Retrieving the list of template ids')
 
-        template_ids = []
         try:
-            for template in self.appliance.rest_api.collections.templates.all:
-                template_ids.append(template.id)
+            return [template.id for template in self.get_rest_resources('templates', ['id'])]
         except APIException:
             return None
-        return template_ids
 
     def get_provider_details(self, provider_id):
         """Returns the name, and type associated with the provider_id"""
@@ -949,10 +991,11 @@ class BaseProvider(Taggable, Updateable, Navigatable, BaseEntity):
         Returns a dictionary mapping template ids to their name, type, and guid
         """
         # TODO: Move to TemplateCollection.all
-        all_details = {}
-        for id in self.get_all_template_ids():
-            all_details[id] = self.get_template_details(id)
-        return all_details
+        logger.debug('Retrieving the details of all templates')
+        templates = self.get_rest_resources('templates', ['id', 'name', 'type', 'guid'])
+        return {
+            template.id: {'name': template.name, 'type': template.type, 'guid': template.guid}
+            for template in templates}
 
     def get_vm_id(self, vm_name):
         """
@@ -960,27 +1003,15 @@ class BaseProvider(Taggable, Updateable, Navigatable, BaseEntity):
         """
         # TODO: Get Provider object from VMCollection.find, then use VM.id to get the id
         logger.debug('Retrieving the ID for VM: {}'.format(vm_name))
-        for vm_id in self.get_all_vm_ids():
-            details = self.get_vm_details(vm_id)
-            if details['name'] == vm_name:
-                return vm_id
+        return self.get_rest_name_id_map('vms', [vm_name]).get(vm_name)
 
     def get_vm_ids(self, vm_names):
         """
         Returns a dictionary mapping each VM name to it's id
         """
         # TODO: Move to VMCollection.find or VMCollection.all
-        name_list = vm_names[:]
-        logger.debug('Retrieving the IDs for {} VM(s)'.format(len(name_list)))
-        id_map = {}
-        for vm_id in self.get_all_vm_ids():
-            if not name_list:
-                break
-            vm_name = self.get_vm_details(vm_id)['name']
-            if vm_name in name_list:
-                id_map[vm_name] = vm_id
-                name_list.remove(vm_name)
-        return id_map
+        logger.debug('Retrieving the IDs for {} VM(s)'.format(len(vm_names)))
+        return self.get_rest_name_id_map('vms', vm_names)
 
     def get_template_guids(self, template_dict):
         """
@@ -31,7 +31,8 @@ import pytest
 from artifactor import ArtifactorClient
 from cfme.utils.blockers import BZ, Blocker
 from cfme.utils.conf import env, credentials
-from cfme.utils.log import logger
+from cfme.utils.db import pop_query_report
+from cfme.utils.log import artifactor_handler, logger
 from cfme.utils.net import random_port, net_check
 from cfme.utils.wait import wait_for
 from cfme.fixtures.pytest_store import write_line, store
@@ -133,7 +134,6 @@ def pytest_configure(config):
         art_client.ready = True
     else:
         config._art_proc = None
-    from cfme.utils.log import artifactor_handler
     artifactor_handler.artifactor = art_client
     if store.slave_manager:
         artifactor_handler.slaveid = store.slaveid
@@ -150,6 +150,8 @@ def fire_art_hook(config, hook, **hook_args):
     if client is None:
         assert UNDER_TEST, 'missing artifactor is only valid for inprocess tests'
     else:
+        # the log records shipped in batches go before the hook, like when sent one by one
+        artifactor_handler.flush()
         client.fire_hook(hook, **hook_args)
 
 
@@ -231,6 +233,12 @@ def pytest_runtest_teardown(item, nextitem):
     name, location = get_test_idents(item)
     app = find_appliance(item)
     ip = app.hostname
+    query_report = pop_query_report()
+    if query_report is not None:
+        fire_art_test_hook(
+            item, 'filedump',
+            description="Database queries", contents=query_report, file_type="db_queries",
+            group_id="database", slaveid=store.slaveid)
     fire_art_test_hook(
         item, 'finish_test',
         slaveid=store.slaveid, ip=ip, wait_for_task=True)
@@ -10,8 +10,9 @@ The Workflow
 - Master runs collection, blocks until slaves report their collections
 - Slaves each run collection and submit them to the master, then block inside their runtest loop,
   waiting for tests to run
-- Master diffs slave collections against its own; the test ids are verified to match
-  across all nodes
+- Master publishes its collection and its hash in the pytest cache; slaves with the same
+  hash only report the hash, the others send their collection for the master to diff against
+  its own; the test ids are verified to match across all nodes
 - Master enters main runtest loop, uses a generator to build lists of test groups which are then
   sent to slaves, one group at a time
 - For each phase of each test, the slave serializes test reports, which are then unserialized on
@@ -22,6 +23,10 @@ The Workflow
   - If more tests are received, they are run
   - If no tests are received, the slave will shut down after running its final test
 
+- Once all tests are sent out, a slave asking for more tests steals the tail of the longest
+  queue of not yet started tests from another slave. The master asks the busy slave to give
+  them up in reply to its next message, and passes on only the tests it confirms to have dropped
+
 - After all slaves are shut down, the master will do its end-of-session reporting as usual, and
   shut down
 
@@ -30,11 +35,10 @@ from itertools import groupby
 
 
 import difflib
-import json
 import os
 import signal
 import subprocess
-from collections import defaultdict, deque, namedtuple
+from collections import OrderedDict, defaultdict, deque, namedtuple
 from datetime import datetime
 from itertools import count
 
@@ -49,6 +53,7 @@ from _pytest import runner
 
 from cfme.fixtures import terminalreporter
 from cfme.fixtures.parallelizer import remote
+from cfme.fixtures.parallelizer.template import SlaveTemplate
 from cfme.fixtures.pytest_store import store
 from cfme.utils import at_exit, conf
 from cfme.utils.log import create_sublogger
@@ -64,11 +69,37 @@ if not conf.runtime['env'].get('ts'):
     conf.runtime['env']['ts'] = ts
 
 
+# config.cache key for the per-test durations recorded by the master
+DURATIONS_CACHE_KEY = 'miq-parallelize/durations'
+
+
 def pytest_addhooks(pluginmanager):
     from . import hooks
     pluginmanager.add_hookspecs(hooks)
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme')
+    group.addoption('--parallel-schedule', dest='parallel_schedule', action='store',
+                    choices=('module', 'duration'), default='module',
+                    help='How the parallelizer orders test groups for the slaves: "module" sends '
+                         'them in collection order, "duration" sends the longest groups first '
+                         'based on the durations recorded by previous parallel runs')
+    group.addoption('--parallel-transport', dest='parallel_transport', action='store',
+                    choices=sorted(remote.TRANSPORTS), default='json',
+                    help='How slaves talk to the master: "json" waits for the master to answer '
+                         'every event, "msgpack" sends test reports without waiting and has '
+                         'the master acknowledge them in batches')
+    group.addoption('--parallel-warm-slaves', dest='parallel_warm_slaves', action='store_true',
+                    default=False,
+                    help='Fork parallelizer slaves from a template process that has already '
+                         'imported the framework, instead of starting them from scratch')
+    group.addoption('--no-work-stealing', dest='parallel_work_stealing', action='store_false',
+                    default=True,
+                    help='Do not let idle parallelizer slaves take not yet started tests from '
+                         'busy slaves once all tests have been sent out')
+
+
 @pytest.mark.trylast
 def pytest_configure(config):
     """Configures the parallel session, then fires pytest_parallel_configured."""
@@ -110,19 +141,30 @@ class SlaveDetail(object):
         lambda: next(SlaveDetail.slaveid_generator)))
     forbid_restart = attr.ib(default=False, init=False)
     tests = attr.ib(default=attr.Factory(set), repr=False)
+    # tests sent to the slave that have not been started yet, in the order they will run
+    queued = attr.ib(default=attr.Factory(OrderedDict), repr=False)
+    # async events received from the slave but not acknowledged yet, pipelined transport only
+    unacked = attr.ib(default=0, init=False, repr=False)
     process = attr.ib(default=None, repr=False)
 
     provider_allocation = attr.ib(default=attr.Factory(list), repr=False)
+    # SlaveTemplate to fork the slave from, if any
+    template = attr.ib(default=None, repr=False)
 
     def start(self):
         if self.forbid_restart:
             return
-        devnull = open(os.devnull, 'w')
-        # worker output redirected to null; useful info comes via messages and logs
-        self.process = subprocess.Popen(
-            ['python', remote.__file__, self.id, self.appliance.as_json, conf.runtime['env']['ts']],
-            stdout=devnull,
-        )
+        if self.template is not None:
+            self.process = self.template.fork(
+                self.id, self.appliance.as_json, conf.runtime['env']['ts'])
+        if self.process is None:
+            devnull = open(os.devnull, 'w')
+            # worker output redirected to null; useful info comes via messages and logs
+            self.process = subprocess.Popen(
+                ['python', remote.__file__, self.id, self.appliance.as_json,
+                 conf.runtime['env']['ts']],
+                stdout=devnull,
+            )
         at_exit(self.process.kill)
 
     def poll(self):
@@ -130,6 +172,16 @@ class SlaveDetail(object):
             return self.process.poll()
 
 
+@attr.s
+class Steal(object):
+    """A pending transfer of not yet started tests from a busy slave to an idle one"""
+    thief = attr.ib()
+    # the thief's process when it asked for tests, to notice if it was respawned meanwhile
+    thief_process = attr.ib()
+    tests = attr.ib()
+    requested = attr.ib(default=False)
+
+
 class ParallelSession(object):
     def __init__(self, config, appliances):
         self.config = config
@@ -146,14 +198,26 @@ class ParallelSession(object):
         self.slaves = {}
         self.test_groups = self._test_item_generator()
 
-        self._pool = []
+        # remaining test groups, keyed by their position in the generated group order
+        self._pool = OrderedDict()
+        # provider key -> deque of pool positions, and pool positions of provider-less groups
+        self._pool_by_prov = defaultdict(deque)
+        self._pool_noprov = deque()
+        self._pool_built = False
         from cfme.utils.conf import cfme_data
-        self.provs = sorted(set(cfme_data['management_systems'].keys()),
-                            key=len, reverse=True)
+        self.provs = frozenset(cfme_data['management_systems'].keys())
         self.used_prov = set()
 
         self.failed_slave_test_groups = deque()
         self.slave_spawn_count = 0
+        # nodeid -> seconds, a test's duration is only recorded once its teardown is reported
+        self.durations = {}
+        self._partial_durations = defaultdict(float)
+        # victim slave id -> Steal
+        self._steals = {}
+
+        self.pipelined = config.getvalue('parallel_transport') != 'json'
+        self._dumps, self._loads = remote.SERIALIZERS[config.getvalue('parallel_transport')]
         self.appliances = appliances
 
         # set up the ipc socket
@@ -181,8 +245,15 @@ class ParallelSession(object):
             conf.runtime['slave_config']["appliance_data"] = self.slave_appliances_data
         conf.save('slave_config')
 
+        # the template warms up while the master collects
+        if config.getvalue('parallel_warm_slaves'):
+            self.template = SlaveTemplate(self.log)
+            at_exit(self.template.close)
+        else:
+            self.template = None
+
         for appliance in self.appliances:
-            slave_data = SlaveDetail(appliance=appliance)
+            slave_data = SlaveDetail(appliance=appliance, template=self.template)
             self.slaves[slave_data.id] = slave_data
 
         for slave in sorted(self.slaves):
@@ -199,11 +270,13 @@ class ParallelSession(object):
             returncode = slave.poll()
             if returncode:
                 slave.process = None
+                slave.unacked = 0
                 if returncode == -9:
                     msg = '{} killed due to error, respawning'.format(slave.id)
                 else:
                     msg = '{} terminated unexpectedly with status {}, respawning'.format(
                         slave.id, returncode)
+                slave.queued.clear()
                 if slave.tests:
                     failed_tests, slave.tests = slave.tests, set()
                     num_failed_tests = len(failed_tests)
@@ -211,6 +284,7 @@ class ParallelSession(object):
                     msg += ' and redistributing {} tests'.format(num_failed_tests)
                     self.failed_slave_test_groups.append(failed_tests)
                 self.print_message(msg, purple=True)
+                self._cancel_steal(slave)
 
         # If a slave was terminated for any reason, kill that slave
         # the terminated flag implies the appliance has died :(
@@ -233,20 +307,35 @@ class ParallelSession(object):
     def send(self, slave, event_data):
         """Send data to slave.
 
-        ``event_data`` will be serialized as JSON, and so must be JSON serializable
+        ``event_data`` will be serialized with the session's transport encoding (JSON or
+        msgpack), and so must be serializable by it
 
         """
-        event_json = json.dumps(event_data)
-        self.sock.send_multipart([slave.id, '', event_json])
+        self.sock.send_multipart([slave.id, '', self._dumps(event_data)])
+
+    def reply(self, slave, event_data):
+        """Answer an event the slave is waiting on"""
+        if self.pipelined:
+            event_data = {'reply': event_data}
+        self.send(slave, event_data)
+
+    def flush_acks(self):
+        """Acknowledge all async events received from pipelined slaves so far"""
+        for slave in self.slaves.values():
+            if slave.unacked:
+                self.send(slave, {'ack': slave.unacked})
+                slave.unacked = 0
 
     def recv(self):
         # poll the zmq socket, populate the recv queue deque with responses
 
         events = zmq.zmq_poll([(self.sock, zmq.POLLIN)], 50)
         if not events:
+            # nothing left to read, so the pipelined slaves get their acks now
+            self.flush_acks()
             return None, None, None
         slaveid, _, event_json = self.sock.recv_multipart(flags=zmq.NOBLOCK)
-        event_data = json.loads(event_json)
+        event_data = self._loads(event_json)
         event_name = event_data.pop('_event_name')
         if slaveid not in self.slaves:
             self.log.error("message from terminated worker %s %s %s",
@@ -274,8 +363,23 @@ class ParallelSession(object):
             '({})[{}] '.format(prefix, stamp), message, **markup)
 
     def ack(self, slave, event_name):
-        """Acknowledge a slave's message"""
-        self.send(slave, 'ack {}'.format(event_name))
+        """Acknowledge a slave's message
+
+        If tests are to be stolen from the slave, the request to give them up is sent
+        in place of the acknowledgement, the slave answers it with a ``stolen`` event.
+
+        """
+        steal = self._steals.get(slave.id)
+        if steal is not None and not steal.requested:
+            steal.requested = True
+            self.send(slave, {'steal': steal.tests})
+        elif self.pipelined and event_name in remote.ASYNC_EVENTS:
+            slave.unacked += 1
+            if slave.unacked >= remote.ACK_BATCH:
+                self.send(slave, {'ack': slave.unacked})
+                slave.unacked = 0
+        else:
+            self.reply(slave, 'ack {}'.format(event_name))
 
     def monitor_shutdown(self, slave):
         # non-daemon so slaves get every opportunity to shut down cleanly
@@ -343,12 +447,17 @@ class ParallelSession(object):
 
     def send_tests(self, slave):
         """Send a slave a group of tests"""
+        dispatch_start = time()
         try:
             tests = list(self.failed_slave_test_groups.popleft())
         except IndexError:
             tests = self.get(slave)
-        self.send(slave, tests)
-        slave.tests.update(tests)
+        self.log.info('dispatched {} tests to {} in {:.3f}ms'.format(
+            len(tests), slave.id, (time() - dispatch_start) * 1000))
+        if not tests and self._steal(slave):
+            # the slave gets its tests once the victim has confirmed which ones it gave up
+            return tests
+        self._assign(slave, tests)
         collect_len = len(self.collection)
         tests_len = len(tests)
         self.sent_tests += tests_len
@@ -359,6 +468,75 @@ class ParallelSession(object):
             ))
         return tests
 
+    def _assign(self, slave, tests):
+        self.reply(slave, tests)
+        slave.tests.update(tests)
+        slave.queued.update((test, None) for test in tests)
+
+    def _steal(self, thief):
+        """Start taking the tail of the longest queue of not yet started tests for ``thief``
+
+        The first queued test is left alone, the slave may already be committed to it.
+
+        Returns:
+            True if a steal was started, False if there was nothing worth stealing
+
+        """
+        if not self.config.getvalue('parallel_work_stealing'):
+            return False
+        busy = set(self._steals)
+        busy.update(steal.thief.id for steal in self._steals.values())
+        busy.add(thief.id)
+        victims = [s for s in self.slaves.values()
+                   if s.id not in busy and s.process is not None and len(s.queued) > 1]
+        if not victims:
+            return False
+        # victims with no providers the thief lacks come first, the thief keeps its appliance
+        victim = max(victims, key=lambda s: (
+            not set(s.provider_allocation) - set(thief.provider_allocation), len(s.queued)))
+        stealable = list(victim.queued)[1:]
+        tests = stealable[len(stealable) // 2:]
+        steal = self._steals[victim.id] = Steal(thief, thief.process, tests)
+        if self.pipelined:
+            # no need to wait for the victim's next event, it reads this with its next send
+            steal.requested = True
+            self.send(victim, {'steal': tests})
+        self.log.info('{} stealing {} of {} queued tests from {}'.format(
+            thief.id, len(tests), len(victim.queued), victim.id))
+        return True
+
+    def _stolen(self, victim, tests):
+        """Hand the tests a victim confirmed to have given up to the waiting thief"""
+        steal = self._steals.pop(victim.id)
+        for test in tests:
+            victim.tests.discard(test)
+            victim.queued.pop(test, None)
+        thief = steal.thief
+        if self.slaves.get(thief.id) is not thief or thief.process is not steal.thief_process:
+            # the thief went away while waiting, let someone else run the tests
+            if tests:
+                self.failed_slave_test_groups.append(tests)
+        elif tests:
+            provs = provs_of_tests(tests, self.provs)
+            if set(provs) - set(thief.provider_allocation):
+                # like get() does when a slave switches providers
+                self._cleanse(thief)
+                thief.provider_allocation = provs
+            self._assign(thief, tests)
+            self.print_message('{} took {} tests from {}'.format(
+                thief.id, len(tests), victim.id))
+        else:
+            self.send_tests(thief)
+
+    def _cancel_steal(self, victim):
+        """Drop a pending steal from a victim that will not answer it, unblocking the thief"""
+        steal = self._steals.pop(victim.id, None)
+        if steal is None:
+            return
+        thief = steal.thief
+        if self.slaves.get(thief.id) is thief and thief.process is steal.thief_process:
+            self.send_tests(thief)
+
     def pytest_sessionstart(self, session):
         """pytest sessionstart hook
 
@@ -389,6 +567,14 @@ class ParallelSession(object):
         """
         # Build master collection for slave diffing and distribution
         self.collection = [item.nodeid for item in self.session.items]
+        self.collection_hash = remote.collection_hash(self.collection, self.config.args)
+        # publish the collection, so slaves only need to send their hash back if it matches
+        self.config.cache.set(remote.COLLECTION_CACHE_KEY, {
+            'ts': conf.runtime['env']['ts'],
+            'hash': self.collection_hash,
+            'node_ids': self.collection,
+        })
+        self._build_pool()
 
         # Fire up the workers after master collection is complete
         # master and the first slave share an appliance, this is a workaround to prevent a slave
@@ -423,11 +609,14 @@ class ParallelSession(object):
                     self.print_message(message, slave, **markup)
                     self.ack(slave, event_name)
                 elif event_name == 'collectionfinish':
-                    slave_collection = event_data['node_ids']
                     # compare slave collection to the master, all test ids must be the same
-                    self.log.debug('diffing {} collection'.format(slave.id))
-                    diff_err = report_collection_diff(
-                        slave.id, self.collection, slave_collection)
+                    if event_data['collection_hash'] == self.collection_hash:
+                        diff_err = None
+                    else:
+                        # the slave sends its node ids along when its hash doesn't match
+                        self.log.debug('diffing {} collection'.format(slave.id))
+                        diff_err = report_collection_diff(
+                            slave.id, self.collection, event_data.get('node_ids', []))
                     if diff_err:
                         self.print_message(
                             'collection differs, respawning', slave.id,
@@ -441,7 +630,11 @@ class ParallelSession(object):
                 elif event_name == 'need_tests':
                     self.send_tests(slave)
                     self.log.info('starting master test distribution')
+                elif event_name == 'stolen':
+                    self._stolen(slave, event_data['node_ids'])
+                    self.ack(slave, event_name)
                 elif event_name == 'runtest_logstart':
+                    slave.queued.pop(event_data['nodeid'], None)
                     self.ack(slave, event_name)
                     self.trdist.runtest_logstart(
                         slave.id,
@@ -452,6 +645,7 @@ class ParallelSession(object):
                     report = unserialize_report(event_data['report'])
                     if report.when in ('call', 'teardown'):
                         slave.tests.discard(report.nodeid)
+                    self._record_duration(report)
                     self.trdist.runtest_logreport(slave.id, report)
                 elif event_name == 'internalerror':
                     self.ack(slave, event_name)
@@ -460,6 +654,7 @@ class ParallelSession(object):
                 elif event_name == 'shutdown':
                     self.config.hook.pytest_miq_node_shutdown(
                         config=self.config, nodeinfo=slave.appliance.url)
+                    self._cancel_steal(slave)
                     self.ack(slave, event_name)
                     del self.slaves[slave.id]
                     self.monitor_shutdown(slave)
@@ -482,8 +677,50 @@ class ParallelSession(object):
         # Suppress other runtestloop calls
         return True
 
+    def pytest_sessionfinish(self):
+        """pytest sessionfinish hook
+
+        - merges the durations of the tests run in this session into the pytest cache
+
+        """
+        if self.durations:
+            durations = self.config.cache.get(DURATIONS_CACHE_KEY, {})
+            durations.update(self.durations)
+            self.config.cache.set(DURATIONS_CACHE_KEY, durations)
+
+    def _record_duration(self, report):
+        self._partial_durations[report.nodeid] += getattr(report, 'duration', 0) or 0
+        if report.when == 'teardown':
+            self.durations[report.nodeid] = self._partial_durations.pop(report.nodeid)
+
     def _test_item_generator(self):
-        for tests in self._modscope_item_generator():
+        if self.config.getvalue('parallel_schedule') == 'duration':
+            generator = self._duration_item_generator
+        else:
+            generator = self._modscope_item_generator
+        for tests in generator():
+            yield tests
+
+    def _duration_item_generator(self):
+        # longest processing time first: the module scoped groups are kept intact, but handed
+        # out longest first, so the long groups start early and the short ones fill the gaps
+        # at the end of the session. Provider affinity is still enforced by get(), which
+        # always picks the first eligible group in this order.
+        durations = self.config.cache.get(DURATIONS_CACHE_KEY, {})
+        known = [durations[nodeid] for nodeid in self.collection if nodeid in durations]
+        # tests that never ran before are assumed to take an average amount of time
+        default = sum(known) / len(known) if known else 0.0
+        self.log.info('scheduling by duration, {} of {} tests have recorded durations'.format(
+            len(known), len(self.collection)))
+
+        def estimate(test_group):
+            return sum(durations.get(nodeid, default) for nodeid in test_group)
+
+        test_groups = list(self._modscope_item_generator())
+        # sorted is stable, groups with the same estimate stay in collection order
+        for tests in sorted(test_groups, key=estimate, reverse=True):
+            self.log.info('sending {} tests estimated at {:.1f}s'.format(
+                len(tests), estimate(tests)))
             yield tests
 
     def _modscope_item_generator(self):
@@ -520,69 +757,132 @@ class ParallelSession(object):
                 self.log.info('sent tests with param {} {!r}'.format(id, tests))
                 yield tests
 
-    def get(self, slave):
+    def _build_pool(self):
+        """Generate all test groups and index them by the provider they are parametrized with
 
-        def provs_of_tests(test_group):
-            found = set()
-            for test in test_group:
-                found.update(pv for pv in self.provs
-                             if '[' in test and pv in test)
-            return sorted(found)
+        This is done once, after the master collection is known, so that handing out
+        tests to a slave costs the same no matter how many tests or providers there are.
 
-        if not self._pool:
-            for test_group in self.test_groups:
-                self._pool.append(test_group)
-                self.used_prov.update(provs_of_tests(test_group))
-            if self.used_prov:
-                self.ratio = float(len(self.slaves)) / len(self.used_prov)
+        """
+        if self._pool_built:
+            return
+        build_start = time()
+        for position, test_group in enumerate(self.test_groups):
+            provs = provs_of_tests(test_group, self.provs)
+            self._pool[position] = (provs[0] if provs else None), test_group
+            if provs:
+                self._pool_by_prov[provs[0]].append(position)
             else:
-                self.ratio = 0.0
+                self._pool_noprov.append(position)
+            self.used_prov.update(provs)
+        if self.used_prov:
+            self.ratio = float(len(self.slaves)) / len(self.used_prov)
+        else:
+            self.ratio = 0.0
+        self._pool_built = True
+        self.log.info('indexed {} test groups across {} providers in {:.3f}s'.format(
+            len(self._pool), len(self.used_prov), time() - build_start))
+
+    def _pool_head(self, positions):
+        # positions may refer to groups that were already handed out, drop those lazily
+        while positions and positions[0] not in self._pool:
+            positions.popleft()
+        return positions[0] if positions else None
+
+    def _pool_take(self, position):
+        prov, test_group = self._pool.pop(position)
+        if prov is None:
+            positions = self._pool_noprov
+        else:
+            positions = self._pool_by_prov[prov]
+        if positions and positions[0] == position:
+            positions.popleft()
+        return prov, test_group
+
+    def get(self, slave):
+        self._build_pool()
         if not self._pool:
             return []
         appliance_num_limit = 1
-        for idx, test_group in enumerate(self._pool):
-            provs = provs_of_tests(test_group)
-            if provs:
-                prov = provs[0]
-                if prov in slave.provider_allocation:
-                    # provider is already with the slave, so just return the tests
-                    self._pool.remove(test_group)
-                    return test_group
-                else:
-                    if len(slave.provider_allocation) >= appliance_num_limit:
-                        continue
-                    else:
-                        # Adding provider to slave since there are not too many
-                        slave.provider_allocation.append(prov)
-                        self._pool.remove(test_group)
-                        return test_group
-            else:
-                # No providers - ie, not a provider parametrized test
-                # or no params, so not parametrized at all
-                self._pool.remove(test_group)
-                return test_group
+        if len(slave.provider_allocation) < appliance_num_limit:
+            # the slave can take on another provider, so the next group in order will do
+            prov, test_group = self._pool_take(next(iter(self._pool)))
+            if prov is not None and prov not in slave.provider_allocation:
+                # Adding provider to slave since there are not too many
+                slave.provider_allocation.append(prov)
+            return test_group
+
+        # only groups without providers, or with providers already on the slave, can be sent
+        candidates = [self._pool_head(self._pool_noprov)]
+        candidates.extend(self._pool_head(self._pool_by_prov[prov])
+                          for prov in slave.provider_allocation)
+        candidates = [position for position in candidates if position is not None]
+        if candidates:
+            prov, test_group = self._pool_take(min(candidates))
+            return test_group
 
         # Here means no tests were able to be sent
-        for test_group in self._pool:
+        # Already too many slaves with provider
+        prov, test_group = self._pool_take(next(iter(self._pool)))
+        self._cleanse(slave)
+        slave.provider_allocation = [prov]
+        return test_group
+
+    def _cleanse(self, slave):
+        """Delete the providers from the slave's appliance, before it gets tests of others"""
+        app = slave.appliance
+        self.print_message(
+            'cleansing appliance', slave, purple=True)
+        try:
+            app.delete_all_providers()
+        except Exception as e:
+            self.print_message(
+                'cloud not cleanse', slave, red=True)
+            self.print_message('error: {}'.format(e), slave, red=True)
 
-            provs = provs_of_tests(test_group)
-            if provs:
-                prov = provs[0]
-                # Already too many slaves with provider
-                app = slave.appliance
-                self.print_message(
-                    'cleansing appliance', slave, purple=True)
-                try:
-                    app.delete_all_providers()
-                except Exception as e:
-                    self.print_message(
-                        'cloud not cleanse', slave, red=True)
-                    self.print_message('error:', e, red=True)
-            slave.provider_allocation = [prov]
-            self._pool.remove(test_group)
-            return test_group
-        assert not self._pool, self._pool
-        return []
+
+def parametrize_id_of(nodeid):
+    """Return the parametrization id of a test node id, or None if it is not parametrized
+
+    ``'test_module.py::test_name[param-id]'`` gives ``'param-id'``
+
+    """
+    if not nodeid.endswith(']') or '[' not in nodeid:
+        return None
+    return nodeid[nodeid.index('[') + 1:-1]
+
+
+def provs_of_tests(test_group, provider_keys):
+    """Find the provider keys used in the parametrization ids of a group of tests
+
+    Parametrization ids are built by py.test joining the individual ids with dashes, and
+    provider keys may contain dashes themselves, so every dash-delimited run of id parts
+    is looked up in ``provider_keys``, longest runs first.
+
+    Args:
+        test_group: iterable of test node ids
+        provider_keys: a set of provider keys to look for
+
+    Returns:
+        sorted list of the provider keys found
+
+    """
+    found = set()
+    for test in test_group:
+        param_id = parametrize_id_of(test)
+        if param_id is None:
+            continue
+        parts = param_id.split('-')
+        start = 0
+        while start < len(parts):
+            for end in range(len(parts), start, -1):
+                if '-'.join(parts[start:end]) in provider_keys:
+                    found.add('-'.join(parts[start:end]))
+                    start = end
+                    break
+            else:
+                start += 1
+    return sorted(found)
 
 
 def report_collection_diff(slaveid, from_collection, to_collection):
@@ -5,9 +5,15 @@ Useful to make sure tests are being parallelized properly, and then reported cor
 This file is named specially to prevent being picked up by py.test's default collector, and should
 not be run during a normal test run.
 
+Running it as a script benchmarks the master/slave transports instead, printing how many test
+report events per second a slave gets through to the master with each of them.
+
 """
+import os
 import random
-from time import sleep
+import tempfile
+from threading import Thread
+from time import sleep, time
 
 import pytest
 from six.moves import range
@@ -72,3 +78,81 @@ def test_fails_teardown(teardown_fail):
 @pytest.mark.skipif('True')
 def test_skipped():
     pass
+
+
+def benchmark_transport(transport, num_events=10000):
+    """Measure how many test report events per second a slave gets through to the master
+
+    A minimal master loop runs in a thread, answering the slave the way
+    :py:class:`cfme.fixtures.parallelizer.ParallelSession` does for the given transport.
+
+    Args:
+        transport: transport name, a key of :py:data:`cfme.fixtures.parallelizer.remote.TRANSPORTS`
+        num_events: how many report events to send
+
+    Returns:
+        events per second
+
+    """
+    import zmq
+    from cfme.fixtures.parallelizer import remote
+    from cfme.utils.log import logger
+
+    # ipc like the real session, so the round trips cost what they do there
+    endpoint = 'ipc://{}'.format(os.path.join(tempfile.mkdtemp(), transport))
+    dumps, loads = remote.SERIALIZERS[transport]
+    pipelined = transport != 'json'
+    master = zmq.Context.instance().socket(zmq.ROUTER)
+    master.bind(endpoint)
+
+    def master_loop():
+        unacked = 0
+        while True:
+            slaveid, _, data = master.recv_multipart()
+            event_name = loads(data)['_event_name']
+            if pipelined and event_name in remote.ASYNC_EVENTS:
+                unacked += 1
+                if unacked >= remote.ACK_BATCH:
+                    master.send_multipart([slaveid, b'', dumps({'ack': unacked})])
+                    unacked = 0
+                continue
+            reply = 'ack {}'.format(event_name)
+            master.send_multipart([slaveid, b'', dumps({'reply': reply} if pipelined else reply)])
+            if event_name == 'shutdown':
+                return
+
+    master_thread = Thread(target=master_loop)
+    master_thread.start()
+    slave = remote.TRANSPORTS[transport](endpoint, 'benchmark', logger, lambda node_ids: None)
+    # roughly what a serialized passing call report looks like
+    report = {
+        'nodeid': 'cfme/tests/test_module.py::test_name[provider-key]',
+        'location': ['cfme/tests/test_module.py', 42, 'test_name[provider-key]'],
+        'keywords': {'test_name[provider-key]': 1, 'provider-key': 1, 'cfme': 1},
+        'outcome': 'passed',
+        'longrepr': None,
+        'when': 'call',
+        'sections': [],
+        'duration': 1.2345,
+        'user_properties': [],
+    }
+    start = time()
+    for _ in range(num_events):
+        slave.send_event('runtest_logreport', report=report)
+    slave.send_event('shutdown')
+    elapsed = time() - start
+    master_thread.join()
+    slave.sock.close()
+    master.close()
+    return num_events / elapsed
+
+
+if __name__ == '__main__':
+    import argparse
+    from cfme.fixtures.parallelizer.remote import TRANSPORTS
+    parser = argparse.ArgumentParser(description='Benchmark the parallelizer transports')
+    parser.add_argument('--events', type=int, default=10000, help='Report events to send')
+    args = parser.parse_args()
+    for transport in sorted(TRANSPORTS):
+        rate = benchmark_transport(transport, args.events)
+        print('{}: {:.0f} messages/sec'.format(transport, rate))
@@ -1,16 +1,175 @@
+import hashlib
 import json
 import signal
+from collections import deque
+from functools import partial
 
+import msgpack
 import zmq
 from py.path import local
 
 import cfme.utils
-from cfme.utils import log
+from cfme.utils import conf, log
 from cfme.utils.appliance import find_appliance
+from cfme.fixtures import terminalreporter
 from cfme.fixtures.log import _test_status, _format_nodeid
+from cfme.fixtures.pytest_store import store
 
 SLAVEID = None
 
+#: Encoders and decoders for the messages between master and slaves, by transport name
+SERIALIZERS = {
+    'json': (lambda data: json.dumps(data).encode('utf-8'), json.loads),
+    'msgpack': (partial(msgpack.packb, use_bin_type=True), partial(msgpack.unpackb, raw=False)),
+}
+
+#: Events a pipelined slave sends without waiting for the master's answer
+ASYNC_EVENTS = frozenset(['message', 'runtest_logstart', 'runtest_logreport', 'internalerror'])
+
+#: config.cache key the master publishes its collection under
+COLLECTION_CACHE_KEY = 'miq-parallelize/collection'
+
+#: How many async events the master acknowledges at once
+ACK_BATCH = 64
+
+#: How many unacknowledged async events a pipelined slave may have in flight
+ACK_WINDOW = 8 * ACK_BATCH
+
+
+def collection_hash(node_ids, args):
+    """Hash a collection, so master and slaves can compare theirs without shipping them
+
+    The hash doesn't depend on the order of ``node_ids``, and covers the py.test ``args``
+    the collection was made with.
+
+    """
+    digest = hashlib.sha1()
+    for value in sorted(args) + [''] + sorted(node_ids):
+        digest.update(value.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class LockstepTransport(object):
+    """Slave side of the default transport
+
+    Every event is JSON encoded and sent over a REQ socket, then the slave blocks until
+    the master answers it.
+
+    """
+    def __init__(self, zmq_endpoint, identity, log, on_steal):
+        self.log = log
+        self.on_steal = on_steal
+        ctx = zmq.Context.instance()
+        self.sock = ctx.socket(zmq.REQ)
+        self.sock.set_hwm(1)
+        self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(identity))
+        self.sock.connect(zmq_endpoint)
+
+    def send_event(self, name, **kwargs):
+        kwargs['_event_name'] = name
+        self.log.trace("sending %s %r", name, kwargs)
+        self.sock.send_json(kwargs)
+        recv = self.sock.recv_json()
+        if recv == 'die':
+            self.log.info('Slave instructed to die by master; shutting down')
+            raise SystemExit()
+        elif isinstance(recv, dict) and 'steal' in recv:
+            self.on_steal(recv['steal'])
+        else:
+            self.log.trace('received "%r" from master', recv)
+            if recv != 'ack':
+                return recv
+
+
+class PipelinedTransport(object):
+    """Slave side of the pipelined transport
+
+    Events are msgpack encoded and sent over a DEALER socket. Events in
+    :py:data:`ASYNC_EVENTS` are sent without waiting, the master acknowledges them in
+    batches and the slave only blocks when :py:data:`ACK_WINDOW` events are unacknowledged.
+    Other events wait for the master's reply as usual. zmq keeps the messages of a
+    connection in order, so the master still sees every slave's events in the order sent.
+
+    Everything the master sends is a dict with one of the keys ``ack`` (number of events
+    acknowledged), ``steal`` (tests to give up) or ``reply`` (answer to a waiting event),
+    or the string ``die``.
+
+    Steals are handled once the event being sent is done with, answering one sends an event
+    of its own, which must not take the reply the current event is waiting for.
+
+    """
+    def __init__(self, zmq_endpoint, identity, log, on_steal):
+        self.log = log
+        self.on_steal = on_steal
+        self.dumps, self.loads = SERIALIZERS['msgpack']
+        self.unacked = 0
+        # node id lists of the steals received, but not handled yet
+        self.steals = deque()
+        ctx = zmq.Context.instance()
+        self.sock = ctx.socket(zmq.DEALER)
+        self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(identity))
+        self.sock.connect(zmq_endpoint)
+
+    def send_event(self, name, **kwargs):
+        kwargs['_event_name'] = name
+        self.log.trace("sending %s %r", name, kwargs)
+        # empty delimiter frame, so the master sees the same framing as from a REQ socket
+        self.sock.send_multipart([b'', self.dumps(kwargs)])
+        reply = None
+        if name in ASYNC_EVENTS:
+            self.unacked += 1
+            self._receive(block=self.unacked >= ACK_WINDOW)
+            while self.unacked >= ACK_WINDOW:
+                self._receive(block=True)
+        else:
+            found = False
+            while not found:
+                found, reply = self._receive(block=True, wait_reply=True)
+            self.log.trace('received "%r" from master', reply)
+        if name == 'shutdown':
+            # the master cancels the steals of a slave that shuts down
+            self.steals.clear()
+        while self.steals:
+            self.on_steal(self.steals.popleft())
+        return reply
+
+    def _receive(self, block, wait_reply=False):
+        """Handle messages from the master
+
+        Handles all waiting messages, and if ``block`` is set, waits for at least one.
+        If ``wait_reply`` is set, stops at a reply.
+
+        Returns:
+            a ``(found, reply)`` tuple, ``found`` is True if a reply was received
+
+        """
+        flags = 0 if block else zmq.NOBLOCK
+        while True:
+            try:
+                _, data = self.sock.recv_multipart(flags=flags)
+            except zmq.Again:
+                return False, None
+            flags = zmq.NOBLOCK
+            recv = self.loads(data)
+            if recv == 'die':
+                self.log.info('Slave instructed to die by master; shutting down')
+                raise SystemExit()
+            elif 'ack' in recv:
+                self.unacked = max(self.unacked - recv['ack'], 0)
+            elif 'steal' in recv:
+                self.steals.append(recv['steal'])
+            elif wait_reply:
+                return True, recv['reply']
+            else:
+                self.log.error('unexpected reply from master: {!r}'.format(recv))
+
+
+TRANSPORTS = {
+    'json': LockstepTransport,
+    'msgpack': PipelinedTransport,
+}
+
 
 class SlaveManager(object):
     """SlaveManager which coordinates with the master process for parallel testing"""
@@ -24,28 +183,30 @@ class SlaveManager(object):
         conf.clear()
         # Override the logger in utils.log
 
-        ctx = zmq.Context.instance()
-        self.sock = ctx.socket(zmq.REQ)
-        self.sock.set_hwm(1)
-        self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(self.slaveid))
-        self.sock.connect(zmq_endpoint)
+        transport = TRANSPORTS[config.getvalue('parallel_transport')]
+        self.transport = transport(zmq_endpoint, self.slaveid, self.log, self._give_up_tests)
 
         self.messages = {}
+        # node ids received from the master that have not been started yet
+        self.pending = deque()
 
         self.quit_signaled = False
 
     def send_event(self, name, **kwargs):
-        kwargs['_event_name'] = name
-        self.log.trace("sending {} {!r}".format(name, kwargs))
-        self.sock.send_json(kwargs)
-        recv = self.sock.recv_json()
-        if recv == 'die':
-            self.log.info('Slave instructed to die by master; shutting down')
-            raise SystemExit()
-        else:
-            self.log.trace('received "{!r}" from master'.format(recv))
-            if recv != 'ack':
-                return recv
+        return self.transport.send_event(name, **kwargs)
+
+    def _give_up_tests(self, node_ids):
+        """Drop the requested tests from the pending ones and tell the master which were dropped
+
+        Tests that were already started (or are about to be) are kept, the master hands
+        only the dropped tests to another slave.
+
+        """
+        steal = set(node_ids)
+        stolen = [nodeid for nodeid in self.pending if nodeid in steal]
+        self.pending = deque(nodeid for nodeid in self.pending if nodeid not in steal)
+        self.log.info('giving up {} tests to another slave'.format(len(stolen)))
+        self.send_event('stolen', node_ids=stolen)
 
     def message(self, message, **kwargs):
         """Send a message to the master, which should get printed to the console"""
@@ -54,14 +215,23 @@ class SlaveManager(object):
     def pytest_collection_finish(self, session):
         """pytest collection hook
 
-        - Sends collected tests to the master for comparison
+        - Sends the hash of the collected tests to the master for comparison
+        - Sends the collected tests as well if the hash doesn't match the one the master
+          published in the pytest cache, so the master can diff them
 
         """
         self.log.debug('collection finished')
         self.session = session
         self.collection = {item.nodeid: item for item in session.items}
         terminalreporter.disable()
-        self.send_event("collectionfinish", node_ids=self.collection.keys())
+        node_ids = list(self.collection)
+        digest = collection_hash(node_ids, self.config.args)
+        published = self.config.cache.get(COLLECTION_CACHE_KEY, {})
+        if published.get('ts') == conf.runtime['env']['ts'] and published.get('hash') == digest:
+            self.send_event("collectionfinish", collection_hash=digest)
+        else:
+            self.log.info('collection does not match the published master collection')
+            self.send_event("collectionfinish", collection_hash=digest, node_ids=node_ids)
 
     def pytest_runtest_logstart(self, nodeid, location):
         """pytest runtest logstart hook
@@ -154,12 +324,15 @@ class SlaveManager(object):
 
     def _iter_nodes(self):
         while True:
-            node_ids = self.send_event('need_tests')
-            if not node_ids:
-                break
-            for nodeid in node_ids:
-                # TODO: take non-unique node ids into account
-                yield self.collection[nodeid]
+            if not self.pending:
+                node_ids = self.send_event('need_tests')
+                if not node_ids:
+                    break
+                self.pending.extend(node_ids)
+            # the master may take pending tests away at any message exchange,
+            # so they're only popped when they're about to be run
+            # TODO: take non-unique node ids into account
+            yield self.collection[self.pending.popleft()]
 
 
 def serialize_report(rep):
@@ -200,14 +373,13 @@ def _init_config(slave_options, slave_args):
     return config
 
 
-if __name__ == '__main__':
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('slaveid', help='The name of this slave')
-    parser.add_argument('appliance_json', help='The json data about the used appliance')
-    parser.add_argument('ts', help='The timestap to use for collections')
-    args = parser.parse_args()
+def main(slaveid, appliance_json, ts):
+    """Run a slave session
 
+    Both ``python remote.py`` and the slaves forked from the warm slave template
+    (see :py:mod:`cfme.fixtures.parallelizer.template`) end up here.
+
+    """
     # TODO: clean the logic up here
 
     from cfme.utils.appliance import IPAppliance, stack
@@ -215,11 +387,11 @@ if __name__ == '__main__':
     # overwrite the default logger before anything else is imported,
     # to get our best chance at having everything import the replaced logger
     import cfme.utils.log
-    cfme.utils.log.setup_for_worker(args.slaveid)
+    cfme.utils.log.setup_for_worker(slaveid)
     slave_log = cfme.utils.log.logger
 
     try:
-        appliance_config = json.loads(args.appliance_json)
+        appliance_config = json.loads(appliance_json)
     except ValueError:
         slave_log.error("Error parsing appliance json")
         raise
@@ -227,12 +399,8 @@ if __name__ == '__main__':
     appliance = IPAppliance(**appliance_config)
     stack.push(appliance)
 
-    from cfme.fixtures import terminalreporter
-    from cfme.fixtures.pytest_store import store
-    from cfme.utils import conf
-
-    conf.runtime['env']['slaveid'] = args.slaveid
-    conf.runtime['env']['ts'] = args.ts
+    conf.runtime['env']['slaveid'] = slaveid
+    conf.runtime['env']['ts'] = ts
     store.parallelizer_role = 'slave'
 
     slave_args = conf.slave_config.pop('args')
@@ -244,8 +412,19 @@ if __name__ == '__main__':
         conf.runtime["cfme_data"]["basic_info"]["appliance_template"] = template_name
         conf.runtime["cfme_data"]["basic_info"]["appliances_provider"] = provider_name
     config = _init_config(slave_options, slave_args)
-    slave_manager = SlaveManager(config, args.slaveid, appliance_config,
+    slave_manager = SlaveManager(config, slaveid, appliance_config,
         conf.slave_config['zmq_endpoint'])
     config.pluginmanager.register(slave_manager, 'slave_manager')
     config.hook.pytest_cmdline_main(config=config)
     signal.signal(signal.SIGQUIT, slave_manager.handle_quit)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('slaveid', help='The name of this slave')
+    parser.add_argument('appliance_json', help='The json data about the used appliance')
+    parser.add_argument('ts', help='The timestap to use for collections')
+    args = parser.parse_args()
+
+    main(args.slaveid, args.appliance_json, args.ts)
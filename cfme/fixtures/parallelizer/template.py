@@ -0,0 +1,261 @@
+"""Warm slave template for the parallelizer
+
+With ``--parallel-warm-slaves``, the master starts this module as a script while it runs its
+own collection. The template imports everything a slave imports before running tests, then
+forks a slave (running :py:func:`cfme.fixtures.parallelizer.remote.main`) for every request
+the master writes to its stdin. Slaves respawned after a crash are forked from the same
+template, so they skip the interpreter start-up and imports altogether.
+
+The master and template talk in JSON lines:
+
+- master to template: ``{"slaveid": ..., "appliance_json": ..., "ts": ...}``
+- template to master: ``{"ready": true}`` once it has warmed up,
+  ``{"forked": slaveid, "pid": pid}`` when a slave was forked, and
+  ``{"exited": pid, "returncode": returncode}`` when it has been reaped
+
+Until the template is ready, and whenever a fork takes longer than :py:data:`FORK_TIMEOUT`,
+the master starts the slave the cold way.
+
+The warm-up only imports, so the modules it imports must not take per-slave state (the
+slave id, the appliance, the runtime configuration) at import time. The configuration
+loaded by the template is dropped after the fork, and the slave loads it again with its
+own runtime overrides. Exit handlers registered in the template are dropped as well, a
+slave only runs the ones it registered itself.
+
+"""
+import atexit
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import select
+import signal
+import subprocess
+import sys
+import traceback
+from threading import Lock, Thread
+
+from six.moves.queue import Empty, Queue
+
+# how long the master waits for the template to fork a slave before starting it cold
+FORK_TIMEOUT = 10
+
+
+class ForkedProcess(object):
+    """A slave forked by the template, with the parts of the Popen API the master uses"""
+    def __init__(self, pid, template):
+        self.pid = pid
+        self.template = template
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not self.template.alive:
+            # nobody is left to report the exit status, so check whether the pid is still there
+            try:
+                os.kill(self.pid, 0)
+            except OSError:
+                self.returncode = -signal.SIGKILL
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except OSError:
+                pass
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class SlaveTemplate(object):
+    """Master side of the warm slave template process"""
+    def __init__(self, log):
+        self.log = log
+        self.alive = True
+        # set once the template has warmed up
+        self.ready = False
+        self._lock = Lock()
+        # slaveid -> Queue the fork response is put into
+        self._requests = {}
+        # pid -> ForkedProcess
+        self._processes = {}
+        self.process = subprocess.Popen(
+            ['python', __file__], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        reader = Thread(target=self._read_responses)
+        reader.daemon = True
+        reader.start()
+
+    def _read_responses(self):
+        for line in iter(self.process.stdout.readline, b''):
+            response = json.loads(line.decode('utf-8'))
+            with self._lock:
+                if 'ready' in response:
+                    self.ready = True
+                elif 'forked' in response:
+                    process = ForkedProcess(response['pid'], self)
+                    self._processes[process.pid] = process
+                    request = self._requests.pop(response['forked'], None)
+                    if request is not None:
+                        request.put(process)
+                    else:
+                        # too late, the master started the slave cold meanwhile
+                        process.kill()
+                elif 'exited' in response:
+                    process = self._processes.pop(response['exited'], None)
+                    if process is not None:
+                        process.returncode = response['returncode']
+        with self._lock:
+            self.alive = False
+            for request in self._requests.values():
+                request.put(None)
+            self._requests.clear()
+        self.log.warning('slave template exited with status {}'.format(self.process.wait()))
+
+    def fork(self, slaveid, appliance_json, ts):
+        """Fork a slave from the template
+
+        Returns:
+            a :py:class:`ForkedProcess`, or None if the template is gone, not warmed up yet
+            or didn't answer in time
+
+        """
+        request = Queue()
+        with self._lock:
+            if not self.alive or not self.ready:
+                return None
+            self._requests[slaveid] = request
+        line = json.dumps({'slaveid': slaveid, 'appliance_json': appliance_json, 'ts': ts})
+        try:
+            self.process.stdin.write(line.encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            return request.get(timeout=FORK_TIMEOUT)
+        except (IOError, Empty):
+            self.log.exception('failed to fork {} from the slave template'.format(slaveid))
+            with self._lock:
+                self._requests.pop(slaveid, None)
+            return None
+
+    def close(self):
+        """Stop the template, slaves forked from it keep running"""
+        if self.process.poll() is None:
+            self.process.stdin.close()
+
+
+def warm_up():
+    """Import everything a slave session imports before it starts running tests
+
+    Only imports, the per-slave setup happens in :py:func:`cfme.fixtures.parallelizer.remote.main`
+    after the fork.
+
+    """
+    from cfme.fixtures.parallelizer import remote  # NOQA
+    from cfme.test_framework import pytest_plugin
+    from cfme.utils.log import logger
+    for plugin in pytest_plugin.pytest_plugins:
+        # blocked in slaves, and importing it would set up a master
+        if plugin == 'cfme.fixtures.parallelizer':
+            continue
+        try:
+            importlib.import_module(plugin)
+        except Exception:
+            logger.exception('slave template failed to import {}'.format(plugin))
+
+
+def report(out, **response):
+    out.write(json.dumps(response) + '\n')
+    out.flush()
+
+
+def reap(out):
+    """Report every slave that exited"""
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            # no children left
+            return
+        if not pid:
+            return
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        report(out, exited=pid, returncode=returncode)
+
+
+def _clear_exit_handlers():
+    if hasattr(atexit, '_clear'):
+        atexit._clear()
+    else:
+        del atexit._exithandlers[:]
+
+
+def reinit_after_fork():
+    """Drop the state a slave must not share with the template and its siblings"""
+    _clear_exit_handlers()
+    # the siblings would draw the same random numbers, ports for one
+    random.seed()
+    from cfme.utils import conf
+    conf.clear()
+
+
+def run_slave(request):
+    """Turn the freshly forked child into a slave, this never returns
+
+    The slave leaves with :py:func:`os._exit`, the template's finalizers are not its own.
+
+    """
+    status = 1
+    try:
+        reinit_after_fork()
+        from cfme.fixtures.parallelizer import remote
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        # the template's pipes belong to the master, slave output goes to null like a cold
+        # slave's
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 0)
+        os.dup2(devnull, 1)
+        remote.main(request['slaveid'], request['appliance_json'], request['ts'])
+        status = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            atexit._run_exitfuncs()
+            logging.shutdown()
+        finally:
+            os._exit(status)
+
+
+def serve():
+    out = sys.stdout
+    # unbuffered, so select sees every request that hasn't been read yet
+    requests = io.open(sys.stdin.fileno(), 'rb', buffering=0)
+    # a ^C on the console is for the master and the slaves, the master closes the template
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    warm_up()
+    report(out, ready=True)
+    while True:
+        readable, _, _ = select.select([requests], [], [], 0.5)
+        reap(out)
+        if not readable:
+            continue
+        line = requests.readline()
+        if not line:
+            # the master went away
+            break
+        request = json.loads(line.decode('utf-8'))
+        pid = os.fork()
+        if pid == 0:
+            run_slave(request)
+        report(out, forked=request['slaveid'], pid=pid)
+
+
+if __name__ == '__main__':
+    serve()
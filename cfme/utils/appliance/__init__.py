@@ -820,9 +820,10 @@ class IPAppliance(object):
             'username': conf.credentials['ssh']['ssh-user'],
             'key_filename': conf_path.join('appliance_private_key').strpath,
         }
-        ssh_client = ssh.SSHClient(**connect_kwargs)
-        # FIXME: properly store ssh clients we made
-        store.ssh_clients_to_close.append(ssh_client)
+        ssh_client, created = ssh.shared_client(**connect_kwargs)
+        if created:
+            # FIXME: properly store ssh clients we made
+            store.ssh_clients_to_close.append(ssh_client)
         return ssh_client
 
     @cached_property
@@ -839,6 +840,7 @@ class IPAppliance(object):
         Note:
 
             The credentials default to those found under ``ssh`` key in ``credentials.yaml``.
+            Appliance objects of the same appliance share the client and its connection.
 
         """
         if not self.is_ssh_running:
@@ -868,7 +870,7 @@ class IPAppliance(object):
             }
         if self.is_dev:
             connect_kwargs.update({'is_dev': True})
-        ssh_client = ssh.SSHClient(**connect_kwargs)
+        ssh_client, created = ssh.shared_client(**connect_kwargs)
         try:
             ssh_client.get_transport().is_active()
             logger.info('default appliance ssh credentials are valid')
@@ -878,9 +880,10 @@ class IPAppliance(object):
             logger.error(e)
             logger.error('default appliance ssh credentials failed, trying establish ssh connection'
                          ' using ssh private key')
-            ssh_client = self.ssh_client_with_privatekey()
-        # FIXME: properly store ssh clients we made
-        store.ssh_clients_to_close.append(ssh_client)
+            return self.ssh_client_with_privatekey()
+        if created:
+            # FIXME: properly store ssh clients we made
+            store.ssh_clients_to_close.append(ssh_client)
         return ssh_client
 
     @property
@@ -941,6 +944,7 @@ class IPAppliance(object):
             # postgres isn't running, try to start it
             cmd = 'systemctl restart {}-postgresql'.format(self.db.postgres_version)
             result = self.db.ssh_client.run_command(cmd)
+            self.db.reset_client()
             if result.failed:
                 return 'postgres failed to start:\n{}'.format(result.output)
             else:
@@ -1466,6 +1470,7 @@ class IPAppliance(object):
                 ssh.run_command(
                     'killall -9 ruby; systemctl restart {}-postgresql'
                     .format(self.db.postgres_version))
+                self.db.reset_client()
                 log_callback('Waiting for database to be available')
                 wait_for(
                     lambda: self.db.is_online, num_sec=90, delay=10, fail_condition=False,
@@ -1496,6 +1501,8 @@ class IPAppliance(object):
 
         wait_for(lambda: client.uptime() < old_uptime, handle_exception=True,
             num_sec=600, message='appliance to reboot', delay=10)
+        # the pooled connections died with the old postgres
+        self.db.reset_client()
 
         if wait_for_web_ui:
             self.wait_for_web_ui()
@@ -2084,6 +2091,7 @@ class IPAppliance(object):
         self.ssh_client.run_command('service collectd stop')
         self.ssh_client.run_command('service {}-postgresql restart'.format(
             self.db.postgres_version))
+        self.db.reset_client()
         self.ssh_client.run_command(
             'cd /var/www/miq/vmdb; bin/rake evm:db:reset')
         self.ssh_client.run_rake_command('db:seed')
@@ -2155,7 +2163,8 @@ class IPAppliance(object):
         """
         if evm_tail is None:
             logger.info('Opening /var/www/miq/vmdb/log/evm.log for tail')
-            evm_tail = SSHTail('/var/www/miq/vmdb/log/evm.log')
+            evm_tail = SSHTail(
+                '/var/www/miq/vmdb/log/evm.log', filters=['MiqServer#wait_for_started_workers'])
             evm_tail.set_initial_file_end()
 
         attempts = 0
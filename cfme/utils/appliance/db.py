@@ -27,9 +27,15 @@ class ApplianceDB(AppliancePlugin):
 
     @cached_property
     def client(self):
-        # slightly crappy: anything that changes self.address should also del(self.client)
+        # slightly crappy: anything that changes self.address should also reset_client()
         return db.Db(self.address)
 
+    def reset_client(self):
+        """Drops the client, closing the pooled connections of its database"""
+        if 'client' in self.__dict__:
+            self.client.dispose()
+        clear_property_cache(self, 'client')
+
     @cached_property
     def address(self):
         # pulls the db address from the appliance by default, falling back to the appliance
@@ -264,6 +270,7 @@ class ApplianceDB(AppliancePlugin):
 
         # restart postgres
         result = client.run_command("systemctl restart {scl}-postgresql".format(scl=scl))
+        self.reset_client()
         return result.rc
 
     def _run_cmd_show_output(self, cmd):
@@ -451,7 +458,7 @@ class ApplianceDB(AppliancePlugin):
         """
         # self.logger.info('Enabling internal DB (region {}) on {}.'.format(region, self.address))
         self.address = self.appliance.hostname
-        clear_property_cache(self, 'client')
+        self.reset_client()
 
         client = self.ssh_client
 
@@ -544,7 +551,7 @@ class ApplianceDB(AppliancePlugin):
             .format(db_address, region, self.address))
         # reset the db address and clear the cached db object if we have one
         self.address = db_address
-        clear_property_cache(self, 'client')
+        self.reset_client()
 
         # default
         db_name = db_name or 'vmdb_production'
@@ -682,6 +689,7 @@ class ApplianceDB(AppliancePlugin):
         with self.ssh_client as ssh:
             result = ssh.run_command('systemctl start {}'.format(self.service_name))
             assert result.success, 'Failed to start {}'.format(self.service_name)
+            self.reset_client()
             self.logger.info('Started service: {}'.format(self.service_name))
 
     def stop_db_service(self):
@@ -691,6 +699,7 @@ class ApplianceDB(AppliancePlugin):
         with self.ssh_client as ssh:
             result = ssh.run_command('systemctl stop {}'.format(self.service_name))
             assert result.success, 'Failed to stop {}'.format(service)
+            self.reset_client()
             self.logger.info('Stopped {}'.format(service))
 
     def restart_db_service(self):
@@ -700,4 +709,5 @@ class ApplianceDB(AppliancePlugin):
         with self.ssh_client as ssh:
             result = ssh.run_command('systemctl restart {}'.format(self.service_name))
             assert result.success, 'Failed to restart {}'.format(service)
+            self.reset_client()
             self.logger.info('Restarted {}'.format(service))
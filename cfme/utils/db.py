@@ -1,8 +1,16 @@
+import atexit
+import os
+import sys
+import tempfile
+import time
 from collections import Mapping
 from contextlib import contextmanager
+from threading import Lock
 
 from cached_property import cached_property
+from six.moves import cPickle
 from sqlalchemy import MetaData, create_engine, event, inspect
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import ArgumentError, DisconnectionError, InvalidRequestError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -11,17 +19,82 @@ from sqlalchemy.pool import Pool
 from cfme.fixtures.pytest_store import store
 from cfme.utils import conf
 from cfme.utils.log import logger
+from cfme.utils.path import project_path
+
+# Reflected tables of the schema with the given latest migration, shared by all sessions
+_reflection_cache_dir = project_path.join('.db_reflection_cache')
+# id -> Db with tables reflected since its reflection cache was saved
+_unsaved_reflections = {}
+
+# Connections kept open per database, and how many more may be opened when they are all in use
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+# Seconds after which a connection is replaced instead of being reused
+POOL_RECYCLE = 3600
+# Seconds a connection may be idle before it is checked to be alive when taken from the pool
+PING_AFTER = 30
+# Queries taking longer than this many seconds are recorded
+SLOW_QUERY_THRESHOLD = 0.5
+# At most this many slow queries are recorded until the records are taken
+SLOW_QUERY_RECORDS = 100
+
+# db url -> Engine shared by all Db objects pointing to the same database
+_engines = {}
+_engines_lock = Lock()
+
+# statement -> [number of queries, seconds spent in them], and the slow queries
+_query_stats = {}
+_slow_queries = []
+_query_stats_lock = Lock()
+
+
+def shared_engine(db_url):
+    """Returns the :py:class:`Engine <sqlalchemy:sqlalchemy.engine.Engine>` for the database
+
+    All of the engines pointing to the same database are the same one, sharing its pool.
+    """
+    with _engines_lock:
+        if db_url not in _engines:
+            _engines[db_url] = create_engine(
+                db_url, echo_pool=True, pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                pool_recycle=POOL_RECYCLE)
+        return _engines[db_url]
+
+
+def dispose_engine(db_url):
+    """Closes the pooled connections to the database, eg. after it was restarted
+
+    The engine stays usable, it opens new connections as needed.
+    """
+    with _engines_lock:
+        engine = _engines.get(db_url)
+    if engine is not None:
+        engine.dispose()
+
+
+@event.listens_for(Pool, "connect")
+@event.listens_for(Pool, "checkin")
+def mark_connection_used(dbapi_connection, connection_record):
+    if connection_record is not None:
+        connection_record.info['last_used'] = time.time()
 
 
 @event.listens_for(Pool, "checkout")
 def ping_connection(dbapi_connection, connection_record, connection_proxy):
     """ping_connection event hook, used to reconnect db sessions that time out
 
+    Only connections which were idle for longer than :py:data:`PING_AFTER` are pinged, the
+    ones used just now are most likely still alive.
+
     Note:
 
         See also: :ref:`Connection Invalidation <sqlalchemy:pool_connection_invalidation>`
 
     """
+    if getattr(dbapi_connection, 'closed', False):
+        raise DisconnectionError
+    if time.time() - connection_record.info.get('last_used', 0) < PING_AFTER:
+        return
     cursor = dbapi_connection.cursor()
     try:
         cursor.execute("SELECT 1")
@@ -30,6 +103,76 @@ def ping_connection(dbapi_connection, connection_record, connection_proxy):
     cursor.close()
 
 
+def _query_caller():
+    """Returns the code outside of sqlalchemy and this module which ran the query
+
+    This walks the stack, so it's only done for the slow queries.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if 'sqlalchemy' not in filename and filename != __file__.rstrip('c'):
+            return '{}:{} {}'.format(filename, frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return 'unknown'
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.time()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        # the timer was started before the event was listened to
+        return
+    duration = time.time() - started
+    slow = duration > SLOW_QUERY_THRESHOLD
+    caller = _query_caller() if slow else None
+    with _query_stats_lock:
+        stats = _query_stats.setdefault(statement, [0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+        if slow and len(_slow_queries) < SLOW_QUERY_RECORDS:
+            _slow_queries.append((duration, caller, statement))
+    if slow:
+        logger.info('[DB] Slow query (%.3fs) from %s: %s', duration, caller, statement)
+
+
+def pop_query_report():
+    """Returns a report of the time spent in queries since the last call, None if there were none
+
+    The statements are sorted by the total time spent in them, followed by the slow queries and
+    the code which ran them.
+    """
+    with _query_stats_lock:
+        stats = sorted(_query_stats.items(), key=lambda item: item[1][1], reverse=True)
+        slow_queries = list(_slow_queries)
+        _query_stats.clear()
+        del _slow_queries[:]
+    if not stats:
+        return None
+    lines = ['Time spent in database queries, by statement:', '']
+    for statement, (count, total) in stats:
+        lines.append('{:10.3f}s {:6d} queries  {}'.format(
+            total, count, ' '.join(statement.split())))
+    if slow_queries:
+        lines.extend(['', 'Queries slower than {}s:'.format(SLOW_QUERY_THRESHOLD)])
+        for duration, caller, statement in slow_queries:
+            lines.extend(['', '{:.3f}s {}'.format(duration, caller), statement])
+    return '\n'.join(lines) + '\n'
+
+
+@atexit.register
+def save_reflection_caches():
+    """Saves the reflection caches of the databases with tables reflected since the last save"""
+    while _unsaved_reflections:
+        _, db = _unsaved_reflections.popitem()
+        db._save_reflection_cache()
+
+
 class Db(Mapping):
     """Helper class for interacting with a CFME database using SQLAlchemy
 
@@ -67,13 +210,18 @@ class Db(Mapping):
         a latent connection, this can be extremely slow, which will affect methods that return
         tables, like the mapping interface or :py:meth:`values`.
 
+        That is why the reflected tables are cached on disk, for the schema with the same latest
+        migration, unless ``reflection_cache`` is False. Tables needed anyway can be reflected
+        at once using :py:meth:`reflect_tables`.
+
     """
-    def __init__(self, hostname=None, credentials=None, port=None):
+    def __init__(self, hostname=None, credentials=None, port=None, reflection_cache=True):
         self._table_cache = {}
         self.hostname = hostname or store.current_appliance.db.address
         self.port = port or store.current_appliance.db_port
 
         self.credentials = credentials or conf.credentials['database']
+        self.reflection_cache = reflection_cache
 
     def __getitem__(self, table_name):
         """Access tables as items contained in this db
@@ -132,7 +280,7 @@ class Db(Mapping):
 
     def copy(self):
         """Copy this database instance, keeping the same credentials and hostname"""
-        return type(self)(self.hostname, self.credentials)
+        return type(self)(self.hostname, self.credentials, reflection_cache=self.reflection_cache)
 
     def __eq__(self, other):
         """Check if this db is equal to another db"""
@@ -150,10 +298,15 @@ class Db(Mapping):
         """The :py:class:`Engine <sqlalchemy:sqlalchemy.engine.Engine>` for this database
 
         It uses pessimistic disconnection handling, checking that the database is still
-        connected before executing commands.
+        connected before executing commands. The engine (and so its connection pool) is shared
+        with the other Db objects for the same database, see :py:func:`shared_engine`.
 
         """
-        return create_engine(self.db_url, echo_pool=True)
+        return shared_engine(self.db_url)
+
+    def dispose(self):
+        """Closes the pooled connections to this database, see :py:func:`dispose_engine`"""
+        dispose_engine(self.db_url)
 
     @cached_property
     def sessionmaker(self):
@@ -182,10 +335,84 @@ class Db(Mapping):
         Note:
 
             Tables that haven't been reflected won't show up in metadata. To reflect a table,
-            use :py:meth:`reflect_table`.
+            use :py:meth:`reflect_table`. Tables loaded from the reflection cache do.
 
         """
-        return MetaData(bind=self.engine)
+        metadata = self._reflection_cache.get('metadata') or MetaData()
+        metadata.bind = self.engine
+        return metadata
+
+    @cached_property
+    def schema_version(self):
+        """The latest migration of the database schema, None if it couldn't be found"""
+        try:
+            return self.engine.scalar('SELECT max(version) FROM schema_migrations')
+        except Exception:
+            logger.exception('[DB] Could not get the schema version')
+            return None
+
+    @property
+    def _reflection_cache_file(self):
+        if not self.reflection_cache or self.schema_version is None:
+            return None
+        return _reflection_cache_dir.join('{}.pickle'.format(self.schema_version))
+
+    def _load_reflection_cache(self):
+        cache_file = self._reflection_cache_file
+        if cache_file is None or not cache_file.check():
+            return {}
+        try:
+            with cache_file.open('rb') as f:
+                return cPickle.load(f)
+        except Exception:
+            logger.exception('[DB] Could not load the reflection cache %s', cache_file)
+            return {}
+
+    @cached_property
+    def _reflection_cache(self):
+        """Reflected metadata and table names loaded from the cache, if there are any"""
+        cache = self._load_reflection_cache()
+        if cache:
+            logger.info('[DB] Loaded %d reflected tables from %s',
+                len(cache['metadata'].tables), self._reflection_cache_file)
+        return cache
+
+    def _reflected(self):
+        """Marks the reflection cache to be saved at exit, see :py:func:`save_reflection_caches`"""
+        if self._reflection_cache_file is not None:
+            _unsaved_reflections[id(self)] = self
+
+    def _save_reflection_cache(self):
+        """Stores the reflected tables for other sessions with the same schema
+
+        The tables other sessions stored meanwhile are kept.
+        """
+        _unsaved_reflections.pop(id(self), None)
+        cache_file = self._reflection_cache_file
+        if cache_file is None:
+            return
+        saved = self._load_reflection_cache().get('metadata')
+        if saved is not None:
+            for table_name, table in saved.tables.items():
+                if table_name not in self.metadata.tables:
+                    table.tometadata(self.metadata)
+        cache = {'metadata': self.metadata}
+        if 'table_names' in self.__dict__:
+            cache['table_names'] = self.table_names
+        try:
+            cache_file.dirpath().ensure(dir=True)
+            # Write it aside and rename, so that parallel sessions never read half of it
+            fd, tmp_path = tempfile.mkstemp(dir=cache_file.dirname)
+            try:
+                # the bind is not pickled
+                with os.fdopen(fd, 'wb') as f:
+                    cPickle.dump(cache, f, 2)
+                os.rename(tmp_path, cache_file.strpath)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except Exception:
+            logger.exception('[DB] Could not save the reflection cache %s', cache_file)
 
     @cached_property
     def db_url(self):
@@ -199,7 +426,11 @@ class Db(Mapping):
     def table_names(self):
         """A sorted list of table names available in this database."""
         # rails table names follow similar rules as pep8 identifiers; expose them as such
-        return sorted(inspect(self.engine).get_table_names())
+        if 'table_names' in self._reflection_cache:
+            return self._reflection_cache['table_names']
+        table_names = sorted(inspect(self.engine).get_table_names())
+        self._reflected()
+        return table_names
 
     @cached_property
     def session(self):
@@ -245,7 +476,27 @@ class Db(Mapping):
             table_name: The name of a table to reflect
 
         """
-        self.metadata.reflect(only=[table_name])
+        self.reflect_tables([table_name])
+
+    def reflect_tables(self, table_names=None):
+        """Populate :py:attr:`metadata` with information on tables, all at once
+
+        Args:
+            table_names: The names of the tables to reflect, all of the tables by default
+
+        The reflection cache is saved right after reflecting all of the tables, otherwise at exit.
+
+        """
+        reflect_all = table_names is None
+        if reflect_all:
+            table_names = self.table_names
+        missing = [name for name in table_names if name not in self.metadata.tables]
+        if missing:
+            self.metadata.reflect(only=missing)
+            if reflect_all:
+                self._save_reflection_cache()
+            else:
+                self._reflected()
 
     def _table(self, table_name):
         """Retrieves, reflects, and caches table objects
@@ -4,6 +4,7 @@
 
 """
 
+from itertools import product
 from time import sleep
 from threading import Thread, Event as ThreadEvent
 
@@ -22,7 +23,7 @@ class EventAttr(object):
         if len(attrs) > 1:
             raise ValueError('event attribute can have only one key=value pair')
 
-        self.name, self.value = attrs.items()[0]
+        self.name, self.value = next(iter(attrs.items()))
         self.type = attr_type or type(self.value)
         self.cmp_func = cmp_func
 
@@ -118,6 +119,77 @@ class Event(object):
         return self
 
 
+class ExpectedEvents(object):
+    """ Expected events of a listener, indexed by the attributes they are usually registered with.
+
+    An incoming event is only compared with the expected events which have the same values of the
+    indexed attributes as the event does, or don't have them (or compare them with ``cmp_func``).
+
+    :var INDEX_ATTRS: Attributes the expected events are indexed by
+    """
+    INDEX_ATTRS = ('event_type', 'target_type', 'target_id')
+
+    def __init__(self):
+        self._events = []
+        self._keys = []
+        self._positions = {}  # id of expected event -> its position
+        self._index = {}  # key -> list of (position, expected event)
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def __len__(self):
+        return len(self._events)
+
+    def append(self, exp_event):
+        """ Adds an expected event, a dict with the ``event`` and what it matched."""
+        self._positions[id(exp_event)] = len(self._events)
+        self._events.append(exp_event)
+        self._keys.append(None)
+        self.reindex(exp_event)
+
+    def reindex(self, exp_event):
+        """ Indexes the expected event again, after its attributes changed."""
+        position = self._positions[id(exp_event)]
+        bucket = self._index.get(self._keys[position])
+        if bucket is not None:
+            bucket.remove((position, exp_event))
+        key = tuple(self.indexed_value(exp_event['event'], name) for name in self.INDEX_ATTRS)
+        self._keys[position] = key
+        self._index.setdefault(key, []).append((position, exp_event))
+
+    @staticmethod
+    def indexed_value(evt, name):
+        """ Returns value of the expected event's attribute to index it by, None if it has none."""
+        attr = evt.event_attrs.get(name)
+        if attr is None or attr.cmp_func or not attr.value:
+            return None
+        try:
+            hash(attr.value)
+        except TypeError:
+            return None
+        return attr.value
+
+    def candidates(self, got_event):
+        """ Returns the expected events which may match the event, in the order they were added."""
+        values = []
+        for name in self.INDEX_ATTRS:
+            attr = got_event.event_attrs.get(name)
+            if attr is None:
+                # any expected event may match it
+                return list(self._events)
+            try:
+                hash(attr.value)
+            except TypeError:
+                return list(self._events)
+            # falsy values only match expected events without a value
+            values.append((None, attr.value) if attr.value else (None,))
+        candidates = []
+        for key in product(*values):
+            candidates.extend(self._index.get(key, []))
+        return [exp_event for position, exp_event in sorted(candidates, key=lambda c: c[0])]
+
+
 class RestEventListener(Thread):
     """ EventListener accepts "expected" events, listens to db events and compares matched events
     with expected events. Runs callback function if expected events have it.
@@ -129,7 +201,7 @@ class RestEventListener(Thread):
     def __init__(self, appliance):
         super(RestEventListener, self).__init__()
         self._appliance = appliance
-        self._events_to_listen = []
+        self._events_to_listen = ExpectedEvents()
         self._last_processed_id = 0  # this is used to filter out old or processed events
         self._stop_event = ThreadEvent()
 
@@ -214,46 +286,56 @@ class RestEventListener(Thread):
         """
         while not self._stop_event.is_set():
             sleep(1)
-            for exp_event in self._events_to_listen:
-
-                # Skip if event has occurred
-                if exp_event['first_event'] and len(exp_event['matched_events']):
-                    continue
-
-                matched_events = self.get_next_portion(exp_event['event'])
-
-                if not matched_events:
-                    continue
-
-                # Match events
-                try:
-                    for event_entity in matched_events:
-                            got_event = Event(self._appliance).build_from_entity(event_entity)
-                            if exp_event['event'].matches(got_event):
-                                if exp_event['callback']:
-                                    exp_event['callback'](exp_event=exp_event['event'],
-                                                          got_event=got_event)
-                                exp_event['matched_events'].append(got_event)
+            events = self.get_next_portion()
+
+            if not events:
+                continue
+
+            # Match events
+            try:
+                for event_entity in events:
+                    got_event = Event(self._appliance).build_from_entity(event_entity)
+                    for exp_event in self._events_to_listen.candidates(got_event):
+                        # Skip if event has occurred
+                        if exp_event['first_event'] and len(exp_event['matched_events']):
+                            continue
+
+                        if exp_event['event'].matches(got_event):
+                            if exp_event['callback']:
+                                exp_event['callback'](exp_event=exp_event['event'],
+                                                      got_event=got_event)
+                            exp_event['matched_events'].append(got_event)
                     self._last_processed_id = got_event.event_attrs['id'].value
-                except Exception:
-                    logger.exception("An exception during matching events occurred.")
 
-                if self._stop_event.is_set():
-                    break
+                    if self._stop_event.is_set():
+                        break
+            except Exception:
+                logger.exception("An exception during matching events occurred.")
+
+    def get_next_portion(self):
+        """ Returns list with new events which may match any of the expected events.
 
-    def get_next_portion(self, evt):
-        """ Returns list with one or more events matched with expected event.
+        All of them are requested at once. Returns None if there are no such events."""
+        waiting = [exp_event for exp_event in self._events_to_listen
+                   if not (exp_event['first_event'] and len(exp_event['matched_events']))]
+        if not waiting:
+            return None
 
-        Returns None if there is no matched events."""
-        evt.process_id()
+        for exp_event in waiting:
+            evt = exp_event['event']
+            if 'target_name' in evt.event_attrs and 'target_id' not in evt.event_attrs:
+                evt.process_id()
+                if 'target_id' in evt.event_attrs:
+                    self._events_to_listen.reindex(exp_event)
 
         q = Q('id', '>', self._last_processed_id)  # ensure we get only new events
 
-        used_filters = set(self.FILTER_ATTRS).intersection(set(evt.event_attrs))
-        for filter_attr in used_filters:
-            evt_attr = evt.event_attrs[filter_attr]
-            if evt_attr.value:
-                q &= Q(filter_attr, '=', evt_attr.value)
+        # filter[] can't group conditions, so only filter by values all expected events share
+        for filter_attr in self.FILTER_ATTRS:
+            values = {ExpectedEvents.indexed_value(exp_event['event'], filter_attr)
+                      for exp_event in waiting}
+            if len(values) == 1 and None not in values:
+                q &= Q(filter_attr, '=', values.pop())
         result = self.event_streams.filter(q)
 
         if len(result):
@@ -267,7 +349,7 @@ class RestEventListener(Thread):
         return self._events_to_listen
 
     def reset_events(self):
-        self._events_to_listen = []
+        self._events_to_listen = ExpectedEvents()
 
     def check_expected_events(self):
         """ Checks that all expected events has arrived."""
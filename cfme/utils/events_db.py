@@ -8,14 +8,44 @@ from contextlib import contextmanager
 from collections import Iterable
 from datetime import datetime
 from numbers import Number
+from select import select
 from sqlalchemy.sql.expression import func
-from time import sleep
+from time import sleep, time
 from threading import Thread, Event as ThreadEvent
 
+from cfme.utils.events import ExpectedEvents
 from cfme.utils.log import create_sublogger
 
 logger = create_sublogger('events')
 
+# Seconds between queries of event_streams when polling
+POLL_INTERVAL = 0.2
+# Seconds between checks whether the listener was stopped while waiting for a notification
+NOTIFY_WAIT = 1
+# Seconds after which event_streams is queried even though no notification came
+NOTIFY_FALLBACK_INTERVAL = 10
+NOTIFY_CHANNEL = 'cfme_tests_event_streams'
+# Notifies the channel once per statement inserting into event_streams. The trigger is created
+# unless some listener has created it already. It's left in place, as other listeners may still
+# be using it, and it's a no-op for the appliance when nobody listens.
+NOTIFY_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION {channel}() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{channel}', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                   WHERE tgname = '{channel}' AND tgrelid = 'event_streams'::regclass) THEN
+        CREATE TRIGGER {channel} AFTER INSERT ON event_streams
+            FOR EACH STATEMENT EXECUTE PROCEDURE {channel}();
+    END IF;
+END;
+$$;
+""".format(channel=NOTIFY_CHANNEL)
+
 
 class EventTool(object):
     """EventTool serves as a wrapper to getting the events from the database.
@@ -281,17 +311,77 @@ class Event(object):
         return self
 
 
+class EventStreamsNotifier(object):
+    """
+    waits for new rows in event_streams using PostgreSQL's LISTEN/NOTIFY.
+
+    Args:
+        connection: psycopg2 connection of its own, it is switched to autocommit
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.autocommit = True
+
+    @classmethod
+    def from_engine(cls, engine):
+        """creates the notifier with a connection taken out of the engine's pool"""
+        connection = engine.raw_connection()
+        # LISTEN lasts as long as the connection, so it must not go back to the pool
+        connection.detach()
+        return cls(connection.connection)
+
+    def listen(self):
+        """installs the trigger notifying about new events and starts listening to it"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(NOTIFY_TRIGGER_SQL)
+            cursor.execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+        finally:
+            cursor.close()
+
+    def wait(self, timeout):
+        """
+        waits for notifications about new events.
+        Returns True if any arrived since the last call, False on timeout
+        """
+        if not self.connection.notifies:
+            readable, _, _ = select([self.connection], [], [], timeout)
+            if readable:
+                self.connection.poll()
+        notified = bool(self.connection.notifies)
+        del self.connection.notifies[:]
+        return notified
+
+    def close(self):
+        """stops listening and closes the connection"""
+        try:
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute('UNLISTEN {}'.format(NOTIFY_CHANNEL))
+            finally:
+                cursor.close()
+        except Exception:
+            logger.exception('Could not stop listening to notifications about new events')
+        finally:
+            self.connection.close()
+
+
 class DbEventListener(Thread):
     """
      accepts "expected" events, listens to db events and compares showed up events with expected
      events. Runs callback function if expected events have it.
+
+     With notify=True, it queries event_streams only when the database notifies about new events
+     (see :py:class:`EventStreamsNotifier`), falling back to polling if that can't be set up.
     """
-    def __init__(self, appliance):
+    def __init__(self, appliance, notify=False):
         super(DbEventListener, self).__init__()
         self._appliance = appliance
         self._tool = EventTool(self._appliance)
+        self._notify = notify
+        self._notifier = None
 
-        self._events_to_listen = []
+        self._events_to_listen = ExpectedEvents()
         # last_id is used to ignore already arrived messages the database
         # When database is "cleared" the id of the last event is placed here. That is then used
         # in queries to prevent events of this id and earlier to get in.
@@ -367,6 +457,9 @@ class DbEventListener(Thread):
 
     def start(self):
         logger.info('Event Listener has been started')
+        if self._notify and self._notifier is None:
+            self._notifier = self._listen()
+        # listening first, so no event slips in between
         self.set_last_record()
         self._stop_event.clear()
         super(DbEventListener, self).start()
@@ -376,7 +469,38 @@ class DbEventListener(Thread):
         self._stop_event.set()
 
     def run(self):
-        self.process_events()
+        try:
+            self.process_events()
+        finally:
+            if self._notifier is not None:
+                self._notifier.close()
+                self._notifier = None
+
+    def _listen(self):
+        try:
+            notifier = EventStreamsNotifier.from_engine(self._appliance.db.client.engine)
+        except Exception:
+            logger.exception('Could not connect for notifications, polling for events instead')
+            return None
+        try:
+            notifier.listen()
+        except Exception:
+            logger.exception('Could not listen to notifications, polling for events instead')
+            notifier.close()
+            return None
+        return notifier
+
+    def _wait_for_events(self):
+        if self._notifier is None:
+            sleep(POLL_INTERVAL)
+            return
+        started = time()
+        while not self._stop_event.is_set():
+            if self._notifier.wait(NOTIFY_WAIT):
+                return
+            if time() - started > NOTIFY_FALLBACK_INTERVAL:
+                # just in case a notification got lost
+                return
 
     @property
     def started(self):
@@ -390,12 +514,12 @@ class DbEventListener(Thread):
         while not self._stop_event.is_set():
             events = self.get_next_portion()
             if len(events) == 0:
-                sleep(0.2)
+                self._wait_for_events()
                 continue
             for got_event in events:
                 logger.debug("processing event id {}".format(got_event.id))
                 got_event = Event(event_tool=self._tool).build_from_raw_event(got_event)
-                for exp_event in self._events_to_listen:
+                for exp_event in self._events_to_listen.candidates(got_event):
                     if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
                         continue
 
@@ -422,7 +546,7 @@ class DbEventListener(Thread):
             event['matched_events'] = []
 
     def reset_events(self):
-        self._events_to_listen = []
+        self._events_to_listen = ExpectedEvents()
 
     def get_next_portion(self):
         logger.debug("obtaining next portion of events")
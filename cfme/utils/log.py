@@ -134,9 +134,12 @@ import inspect
 import logging
 import sys
 import warnings
+from threading import Lock, Thread
 from time import time
 from traceback import extract_tb, format_tb
 
+from six.moves.queue import Empty, Queue
+
 from cfme.utils import conf, safe_string
 from cfme.utils.path import get_rel_path, log_path, project_path
 
@@ -144,6 +147,12 @@ import os
 
 MARKER_LEN = 80
 
+# Records shipped to the artifactor in one hook, and the seconds to wait for a batch to fill up
+ARTIFACTOR_BATCH_SIZE = 500
+ARTIFACTOR_BATCH_INTERVAL = 0.5
+# Records waiting to be shipped to the artifactor before logging blocks
+ARTIFACTOR_QUEUE_SIZE = 10000
+
 # set logging defaults
 _default_conf = {
     'level': 'INFO',
@@ -431,22 +440,102 @@ def nth_frame_info(n):
     return inspect.getframeinfo(inspect.stack(1)[n][0])
 
 
+# Put on the queue of the ArtifactorHandler to ship what's waiting right away
+_FLUSH = object()
+
+
 class ArtifactorHandler(logging.Handler):
-    """Logger handler that hands messages off to the artifactor"""
+    """Logger handler that hands messages off to the artifactor
+
+    The records are shipped in batches by a background thread, in a ``log_messages`` hook every
+    ``batch_size`` records or ``batch_interval`` seconds, whichever comes first. At most
+    ``queue_size`` records wait to be shipped, logging blocks until there is room again.
+
+    Call :py:meth:`flush` to wait for the records logged so far to reach the artifactor.
+    """
 
     slaveid = artifactor = None
 
+    def __init__(self, batch_size=ARTIFACTOR_BATCH_SIZE, batch_interval=ARTIFACTOR_BATCH_INTERVAL,
+                 queue_size=ARTIFACTOR_QUEUE_SIZE):
+        logging.Handler.__init__(self)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.queue_size = queue_size
+        self._start_lock = Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
     def createLock(self):  # NOQA: false positive, base class override
-        # opt out of locking since artifactor hook calling is threadsave
+        # opt out of locking since the queue is threadsafe
         self.lock = None
 
+    def _ensure_thread(self):
+        # a forked slave doesn't get the thread of its parent
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = Queue(self.queue_size)
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._ship, name='ArtifactorHandler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _ship(self):
+        queue = self._queue
+        while True:
+            records = []
+            taken = 1
+            item = queue.get()
+            deadline = time() + self.batch_interval
+            # a flush cuts the batch short
+            while item is not _FLUSH:
+                records.append(item)
+                timeout = deadline - time()
+                if len(records) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    item = queue.get(timeout=timeout)
+                except Empty:
+                    break
+                taken += 1
+            try:
+                if records and self.artifactor:
+                    self.artifactor.fire_hook(
+                        'log_messages', log_records=records, slaveid=self.slaveid)
+            finally:
+                for _ in range(taken):
+                    queue.task_done()
+
+    def prepare(self, record):
+        """Returns the record as a dict that survives the json transport"""
+        log_record = dict(record.__dict__)
+        # the arguments can change or not serialize until the record gets shipped
+        log_record['msg'] = record.getMessage()
+        log_record['args'] = None
+        if record.exc_info:
+            log_record['exc_text'] = record.exc_text or logging.Formatter().formatException(
+                record.exc_info)
+        log_record['exc_info'] = None
+        return log_record
+
     def emit(self, record):
         if self.artifactor:
-            self.artifactor.fire_hook(
-                'log_message',
-                log_record=record.__dict__,
-                slaveid=self.slaveid,
-            )
+            try:
+                log_record = self.prepare(record)
+            except Exception:
+                self.handleError(record)
+                return
+            self._ensure_thread()
+            self._queue.put(log_record)
+
+    def flush(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(_FLUSH)
+            self._queue.join()
 
 
 logger = setup_logger(logging.getLogger('cfme'))
@@ -5,6 +5,58 @@ from .ssh import SSHTail
 from cfme.utils.log import logger
 
 
+# Backreferences count groups, which change once the pattern is a part of another regex
+_backreference = re.compile(r'\\[1-9]|\(\?P=')
+
+
+class PatternMatcher(object):
+    """Matches a line against many regex patterns (like ``re.match``) in a single pass
+
+    The patterns are combined into one alternation, each of them in its own named group, so the
+    group that matched tells which pattern it was. Patterns which can't be combined (they refer
+    to their own groups by number) are matched one by one after the combined ones.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        combined = [p for p in self.patterns if not _backreference.search(p)]
+        self._separate = [(p, re.compile(p)) for p in self.patterns if p not in combined]
+        self._combined = None
+        if combined:
+            try:
+                self._combined = re.compile('|'.join(
+                    '(?P<p{}>{})'.format(i, p) for i, p in enumerate(combined)))
+                self._combined_patterns = combined
+            except re.error:
+                # e.g. a pattern with global flags or a group name used by another one
+                self._separate = [(p, re.compile(p)) for p in self.patterns]
+
+    def __nonzero__(self):
+        return bool(self.patterns)
+
+    __bool__ = __nonzero__
+
+    def match(self, line):
+        """Returns the first pattern matching the line, or None"""
+        if self._combined is not None:
+            match = self._combined.match(line)
+            if match is not None:
+                # the outermost group of the pattern closes last
+                return self._combined_patterns[int(match.lastgroup[1:])]
+        for pattern, regex in self._separate:
+            if regex.match(line):
+                return pattern
+        return None
+
+    def match_all(self, line):
+        """Returns all of the patterns matching the line"""
+        pattern = self.match(line)
+        if pattern is None:
+            return []
+        # an alternation only finds the first matching pattern, check the rest one by one
+        return [pattern] + [
+            p for p in self.patterns if p != pattern and re.match(p, line)]
+
+
 class LogValidator(object):
     """
     Log content validator class provides methods
@@ -22,6 +74,10 @@ class LogValidator(object):
     to be possible to skip particular ERROR log,
     but fail for wider range of other ERRORs.
 
+    Each set of patterns is compiled into a single regex, so a line is checked against all of
+    them at once. ``validate_logs`` only checks the lines logged since it was called last,
+    so it can be called repeatedly while the test runs.
+
     Args:
         remote_filename: path to the remote log file
         skip_patterns: array of skip regex patterns
@@ -45,36 +101,54 @@ class LogValidator(object):
 
         self._remote_file_tail = SSHTail(remote_filename, **kwargs)
         self.matches = {}
+        self._skip_matcher = PatternMatcher(self.skip_patterns)
+        self._failure_matcher = PatternMatcher(self.failure_patterns)
+        self._match_matcher = PatternMatcher(self.matched_patterns)
 
     def fix_before_start(self):
         self._remote_file_tail.set_initial_file_end()
 
-    def validate_logs(self):
+    def validate_logs(self, verify_matches=True):
+        """Check the lines logged since the last call
+
+        Args:
+            verify_matches: Fail if any of the matched patterns has not been matched yet
+        Returns:
+            Whether all of the matched patterns have been matched
+        """
         for line in self._remote_file_tail:
             if self._check_skip_logs(line):
                 continue
             self._check_fail_logs(line)
             self._check_match_logs(line)
-        self._verify_match_logs()
+        if verify_matches:
+            self._verify_match_logs()
+        return len(self.matches) == len(set(self.matched_patterns))
 
     def _check_skip_logs(self, line):
-        for pattern in self.skip_patterns:
-            if re.match(pattern, line):
-                logger.info('Skip pattern {} was matched on line {},\
-                            so skipping this line'.format(pattern, line))
-                return True
+        pattern = self._skip_matcher.match(line)
+        if pattern is not None:
+            logger.debug('Skip pattern {} was matched on line {},\
+                         so skipping this line'.format(pattern, line))
+            return True
         return False
 
     def _check_fail_logs(self, line):
-        for pattern in self.failure_patterns:
-            if re.match(pattern, line):
-                pytest.fail('Failure pattern {} was matched on line {}'.format(pattern, line))
+        pattern = self._failure_matcher.match(line)
+        if pattern is not None:
+            pytest.fail('Failure pattern {} was matched on line {}'.format(pattern, line))
 
     def _check_match_logs(self, line):
-        for pattern in self.matched_patterns:
-            if re.match(pattern, line):
-                logger.info('Expected pattern {} was matched on line {}'.format(pattern, line))
-                self.matches[pattern] = True
+        if not self._match_matcher:
+            return
+        patterns = self._match_matcher.match_all(line)
+        for pattern in patterns:
+            logger.info('Expected pattern {} was matched on line {}'.format(pattern, line))
+            self.matches[pattern] = True
+        if patterns:
+            # There is no need to look for them anymore
+            self._match_matcher = PatternMatcher(
+                [p for p in self.matched_patterns if p not in self.matches])
 
     def _verify_match_logs(self):
         for pattern in self.matched_patterns:
@@ -8,38 +8,39 @@ from cfme.utils.ssh import SSHClient, SSHTail
 
 def collect_log(ssh_client, log_prefix, local_file_name, strip_whitespace=False):
     """Collects all of the logs associated with a single log prefix (ex. evm or top_output) and
-    combines to single gzip log file.  The log file is then scp-ed back to the host.
+    combines to single log file. The log file is then copied back to the host, compressed on the
+    fly and only the part the local file doesn't have yet, see
+    :py:meth:`cfme.utils.ssh.SSHClient.get_file_delta`.
+
+    The rotated logs are decompressed concurrently, see
+    :py:meth:`cfme.utils.ssh.SSHClient.run_commands`.
     """
     log_dir = '/var/www/miq/vmdb/log/'
 
     log_file = '{}{}.log'.format(log_dir, log_prefix)
     dest_file = '{}{}.perf.log'.format(log_dir, log_prefix)
-    dest_file_gz = '{}{}.perf.log.gz'.format(log_dir, log_prefix)
 
-    ssh_client.run_command('rm -f {}'.format(dest_file_gz))
+    ssh_client.run_command('rm -f {}'.format(dest_file))
 
+    strip = '; sed -i  \'s/^ *//; s/ *$//; /^$/d; /^\\s*$/d\' {0}-2' if strip_whitespace else ''
+    # Rotated logs first, in order, then the current one
+    lfiles = []
+    prepare_commands = []
     result = ssh_client.run_command('ls -1 {}-*'.format(log_file))
     if result.success:
-        files = result.output.strip().split('\n')
-        for lfile in sorted(files):
-            ssh_client.run_command('cp {} {}-2.gz'.format(lfile, lfile))
-            ssh_client.run_command('gunzip {}-2.gz'.format(lfile))
-            if strip_whitespace:
-                ssh_client.run_command('sed -i  \'s/^ *//; s/ *$//; /^$/d; /^\s*$/d\' '
-                    '{}-2'.format(lfile))
-            ssh_client.run_command('cat {}-2 >> {}'.format(lfile, dest_file))
-            ssh_client.run_command('rm {}-2'.format(lfile))
-
-    ssh_client.run_command('cp {} {}-2'.format(log_file, log_file))
-    if strip_whitespace:
-        ssh_client.run_command('sed -i  \'s/^ *//; s/ *$//; /^$/d; /^\s*$/d\' '
-            '{}-2'.format(log_file))
-    ssh_client.run_command('cat {}-2 >> {}'.format(log_file, dest_file))
-    ssh_client.run_command('rm {}-2'.format(log_file))
-    ssh_client.run_command('gzip {}{}.perf.log'.format(log_dir, log_prefix))
-
-    ssh_client.get_file(dest_file_gz, local_file_name)
-    ssh_client.run_command('rm -f {}'.format(dest_file_gz))
+        for lfile in sorted(result.output.strip().split('\n')):
+            lfiles.append(lfile)
+            prepare_commands.append(('cp {0} {0}-2.gz; gunzip {0}-2.gz' + strip).format(lfile))
+    lfiles.append(log_file)
+    prepare_commands.append(('cp {0} {0}-2' + strip).format(log_file))
+    ssh_client.run_commands(prepare_commands)
+
+    lfiles_2 = ' '.join('{}-2'.format(lfile) for lfile in lfiles)
+    ssh_client.run_command('cat {} >> {}; rm {}'.format(lfiles_2, dest_file, lfiles_2))
+
+    # the logs only grow, so what was collected before is mostly there already
+    ssh_client.get_file_delta(dest_file, local_file_name)
+    ssh_client.run_command('rm -f {}'.format(dest_file))
 
 
 def convert_top_mem_to_mib(top_mem):
@@ -54,7 +55,7 @@ def convert_top_mem_to_mib(top_mem):
 
 
 def generate_statistics(the_list, decimals=2):
-    """Returns comma seperated statistics over a list of numbers.
+    """Returns comma seperated statistics over a list (or numpy array) of numbers.
 
     Returns:  list of samples(runs), minimum, average, median, maximum,
               stddev, 90th(percentile),
@@ -67,16 +68,14 @@ def generate_statistics(the_list, decimals=2):
     if len(the_list) == 0:
         return [0, 0, 0, 0, 0, 0, 0, 0]
     else:
-        numpy_arr = numpy.array(the_list)
-        minimum = round(numpy.amin(numpy_arr), decimals)
-        average = round(numpy.average(numpy_arr), decimals)
-        median = round(numpy.median(numpy_arr), decimals)
-        maximum = round(numpy.amax(numpy_arr), decimals)
-        stddev = round(numpy.std(numpy_arr), decimals)
-        percentile90 = round(numpy.percentile(numpy_arr, 90), decimals)
-        percentile99 = round(numpy.percentile(numpy_arr, 99), decimals)
-        return [len(the_list), minimum, average, median, maximum, stddev, percentile90,
-            percentile99]
+        # arrays are used as they are, and the percentiles come out of a single sort
+        numpy_arr = numpy.asarray(the_list, dtype=float)
+        median, percentile90, percentile99 = numpy.percentile(numpy_arr, [50, 90, 99])
+        average = numpy.mean(numpy_arr)
+        stddev = numpy.std(numpy_arr)
+        return [len(the_list), round(numpy_arr.min(), decimals), round(average, decimals),
+            round(median, decimals), round(numpy_arr.max(), decimals), round(stddev, decimals),
+            round(percentile90, decimals), round(percentile99, decimals)]
 
 
 def get_worker_pid(worker_type):
@@ -104,7 +103,8 @@ def set_rails_loglevel(level, validate_against_worker='MiqUiWorker'):
     yaml = store.current_appliance.advanced_settings
     if not str(yaml['log']['level_rails']).lower() == level.lower():
         logger.info('Opening /var/www/miq/vmdb/log/evm.log for tail')
-        evm_tail = SSHTail('/var/www/miq/vmdb/log/evm.log')
+        evm_tail = SSHTail('/var/www/miq/vmdb/log/evm.log',
+            filters=['Log level for production.log has been changed to'])
         evm_tail.set_initial_file_end()
 
         log_yaml = yaml.get('log', {})
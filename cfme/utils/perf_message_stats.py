@@ -3,15 +3,21 @@
 appliance.
 """
 import csv
+import io
 import subprocess
 from datetime import datetime
 from datetime import timedelta
+from operator import attrgetter
+from multiprocessing import cpu_count
+from multiprocessing import Pool
 from time import time
 
 import dateutil.parser as du_parser
 import os
 import pygal
 import re
+import six
+from six.moves import intern
 
 from cfme.utils.log import logger
 from cfme.utils.path import log_path
@@ -43,6 +49,16 @@ miqwkr = re.compile(r'MIQ\(([A-Za-z]*)\)\sID\s\[([0-9]*)\],\sPID\s\[([0-9]*)\]')
 miqwkr_id = re.compile(r'with\sID:\s\[([0-9]*)\]')
 # For use with workers exiting, such as authentication failures:
 miqwkr_id_2 = re.compile(r'ID\s\[([0-9]*)\]')
+# Lines about workers, what used to be grepped out of evm.log for them:
+# Interrupt, MIQ(PriorityWorker) ID, "evm_worker_uptime_exceeded, "evm_worker_memory_exceeded,
+# "evm_worker_stop, Worker exiting.
+miqwkr_line = re.compile(r'Interrupt|MIQ\([A-Za-z]*\)\sID|"evm_worker_uptime_exceeded|'
+    r'"evm_worker_memory_exceeded|"evm_worker_stop|Worker\sexiting.')
+
+# The queue operation and message id of a MiqQueue line in one go:
+# [----] .* MIQ(MiqQueue.put) Message id: [ * ]
+miqmsg_queue = re.compile(
+    r'MIQ\(MiqQueue\.(put|get_via_drb|delivered)\).*?Message\sid:\s\[([0-9]*)\]')
 
 # top regular expressions
 # Cpu(s): 13.7%us,  1.2%sy,  2.1%ni, 80.0%id,  1.7%wa,  0.0%hi,  0.1%si,  1.3%st
@@ -59,183 +75,46 @@ miq_swap = re.compile(r'Swap:\s+([0-9]*)k\stotal,\s+([0-9]*)k\sused,\s+([0-9]*)k
 miq_top = re.compile(r'([0-9]+)\s+[0-9]+\s+[A-Za-z0-9]+\s+[0-9]+\s+[0-9\-]+\s+([0-9\.mg]+)\s+'
     r'([0-9\.mg]+)\s+([0-9\.mg]+)\s+[SRDZ]\s+([0-9\.]+)\s+([0-9\.]+)')
 
+# evm.log files smaller than this per process are not worth splitting up
+CHUNK_MIN_SIZE = 16 * 1024 * 1024
+
+
+def chunk_offsets(file_name, chunks, min_size=CHUNK_MIN_SIZE):
+    """Split a file into byte ranges starting and ending on line boundaries
+
+    Args:
+        file_name: the file to split
+        chunks: how many ranges to split the file into at most
+        min_size: the minimum size of a range, smaller files are split into fewer ranges
+    Returns:
+        list of (start, end) tuples covering the whole file
+    """
+    size = os.path.getsize(file_name)
+    chunks = max(1, min(chunks, size // min_size))
+    offsets = [0]
+    with io.open(file_name, 'rb') as chunked_file:
+        for chunk in range(1, chunks):
+            chunked_file.seek(max(size * chunk // chunks, offsets[-1]))
+            # the rest of the line belongs to the previous chunk
+            chunked_file.readline()
+            if chunked_file.tell() < size:
+                offsets.append(chunked_file.tell())
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
 
-def evm_to_messages(evm_file, filters):
-    test_start = ''
-    test_end = ''
-    line_count = 0
-    messages = {}
-    msg_cmds = {}
-
-    runningtime = time()
-    evmlogfile = open(evm_file, 'r')
-    evm_log_line = evmlogfile.readline()
-    while evm_log_line:
-        line_count += 1
-        evm_log_line = evm_log_line.strip()
-
-        miqmsg_result = miqmsg.search(evm_log_line)
-        if miqmsg_result:
-
-            # Obtains the first timestamp in the log file
-            if test_start == '':
-                ts, pid = get_msg_timestamp_pid(evm_log_line)
-                test_start = ts
-
-            # A message was first put on the queue, this starts its queuing time
-            if (miqmsg_result.group(1) == 'MiqQueue.put'):
-
-                msg_cmd = get_msg_cmd(evm_log_line)
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
-                    test_end = ts
-                    messages[msg_id] = MiqMsgStat()
-                    messages[msg_id].msg_id = msg_id
-                    messages[msg_id].msg_id = '\'' + msg_id + '\''
-                    messages[msg_id].msg_cmd = msg_cmd
-                    messages[msg_id].pid_put = pid
-                    messages[msg_id].puttime = ts
-                    msg_args = get_msg_args(evm_log_line)
-                    if msg_args is False:
-                        logger.debug('Could not obtain message args line #: %s', line_count)
-                    else:
-                        messages[msg_id].msg_args = msg_args
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-            elif (miqmsg_result.group(1) == 'MiqQueue.get_via_drb'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    if msg_id in messages:
-                        ts, pid = get_msg_timestamp_pid(evm_log_line)
-                        test_end = ts
-                        messages[msg_id].pid_get = pid
-                        messages[msg_id].gettime = ts
-                        messages[msg_id].deq_time = get_msg_deq(evm_log_line)
-                    else:
-                        logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-            elif (miqmsg_result.group(1) == 'MiqQueue.delivered'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
-                    test_end = ts
-                    if msg_id in messages:
-                        messages[msg_id].del_time = get_msg_del(evm_log_line)
-                        messages[msg_id].total_time = messages[msg_id].deq_time + \
-                            messages[msg_id].del_time
-                    else:
-                        logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-        if (line_count % 100000) == 0:
-            timediff = time() - runningtime
-            runningtime = time()
-            logger.info('Count {} : Parsed 100000 lines in %s', line_count, timediff)
-
-        evm_log_line = evmlogfile.readline()
-
-    # I tried to avoid two loops but this reduced the complexity of filtering on messages.
-    # By filtering over messages, we can better display what is occuring under the covers, as a
-    # daily rollup is picked up off the queue different than a hourly rollup, etc
-    for msg in sorted(messages.keys()):
-        msg_args = messages[msg].msg_args
-        # Determine if the pattern matches and append to the command if it does
-        for p_filter in filters:
-            results = filters[p_filter].search(msg_args.strip())
-            if results:
-                messages[msg].msg_cmd = '{}{}'.format(messages[msg].msg_cmd, p_filter)
-                break
-        msg_cmd = messages[msg].msg_cmd
-        if msg_cmd not in msg_cmds:
-            msg_cmds[msg_cmd] = {}
-            msg_cmds[msg_cmd]['total'] = []
-            msg_cmds[msg_cmd]['queue'] = []
-            msg_cmds[msg_cmd]['execute'] = []
-        if messages[msg].total_time != 0:
-            msg_cmds[msg_cmd]['total'].append(round(messages[msg].total_time, 2))
-            msg_cmds[msg_cmd]['queue'].append(round(messages[msg].deq_time, 2))
-            msg_cmds[msg_cmd]['execute'].append(round(messages[msg].del_time, 2))
 
-    return messages, msg_cmds, test_start, test_end, line_count
+def evm_to_messages(evm_file, filters):
+    parser = EvmLogParser(filters)
+    parser.parse_file(evm_file)
+    return (parser.messages, parser.msg_cmds(), parser.test_start, parser.test_end,
+        parser.line_count)
 
 
 def evm_to_workers(evm_file):
-    # Use grep to reduce # of lines to sort through
-    p = subprocess.Popen(['grep', 'Interrupt\\|MIQ([A-Za-z]*) ID\\|"evm_worker_uptime_exceeded\\|'
-            '"evm_worker_memory_exceeded\\|"evm_worker_stop\\|Worker exiting.', evm_file],
-            stdout=subprocess.PIPE)
-    greppedevmlog, err = p.communicate()
-    greppedevmlog = greppedevmlog.strip()
-
-    evmlines = greppedevmlog.split('\n')
-
-    workers = {}
-    wkr_upt_exc = 0
-    wkr_mem_exc = 0
-    wkr_stp = 0
-    wkr_int = 0
-    wkr_ext = 0
-    for evm_log_line in evmlines:
-        ts, pid = get_msg_timestamp_pid(evm_log_line)
-
-        miqwkr_result = miqwkr.search(evm_log_line)
-        if miqwkr_result:
-            workerid = int(miqwkr_result.group(2))
-            if workerid not in workers:
-                workers[workerid] = MiqWorker()
-                workers[workerid].worker_type = miqwkr_result.group(1)
-                workers[workerid].pid = miqwkr_result.group(3)
-                workers[workerid].worker_id = int(workerid)
-                workers[workerid].start_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_uptime_exceeded' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_upt_exc += 1
-                        workers[workerid].terminated = 'evm_worker_uptime_exceeded'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_memory_exceeded' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_mem_exc += 1
-                        workers[workerid].terminated = 'evm_worker_memory_exceeded'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_stop' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_stp += 1
-                        workers[workerid].terminated = 'evm_worker_stop'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'Interrupt' in evm_log_line:
-            for workerid in workers:
-                if not workers[workerid].end_ts:
-                    wkr_int += 1
-                    workers[workerid].terminated = 'Interrupted'
-                    workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'Worker exiting.' in evm_log_line:
-            miqwkr_id_2_result = miqwkr_id_2.search(evm_log_line)
-            if miqwkr_id_2_result:
-                workerid = int(miqwkr_id_2_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_ext += 1
-                        workers[workerid].terminated = 'Worker Exited'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-
-    return workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext, len(evmlines)
+    parser = EvmLogParser({})
+    parser.parse_file(evm_file)
+    return (parser.workers, parser.wkr_mem_exc, parser.wkr_upt_exc, parser.wkr_stp,
+        parser.wkr_int, parser.wkr_ext, parser.wkr_line_count)
 
 
 def split_appliance_charts(top_appliance, charts_dir):
@@ -479,75 +358,136 @@ def line_chart_render(title, xtitle, ytitle, x_labels, lines, fname, stacked=Fal
     line_chart.render_to_file(str(fname))
 
 
-def messages_to_hourly_buckets(messages, test_start, test_end):
+def columns_to_hourly_buckets(columns):
+    """Hourly buckets of the messages in ``columns``, see :py:func:`messages_to_columns`
+
+    The buckets are aggregated over the columns at once. Zero times are left out of the
+    minimums, a message which wasn't delivered counts only in the hour it was put in.
+    """
+    # Import here to allow perf to install numpy separately
+    import numpy
+
     hr_bkt = {}
-    # Hour buckets look like: hr_bkt[msg_cmd][msg_date][msg_hour] = MiqMsgBucket()
-    for msg in messages:
-        # put on queue, deals with queuing:
-        msg_cmd = messages[msg].msg_cmd
-        putdate = messages[msg].puttime[:10]
-        puthour = messages[msg].puttime[11:13]
-        if msg_cmd not in hr_bkt:
-            hr_bkt[msg_cmd] = provision_hour_buckets(test_start, test_end)
-
-        hr_bkt[msg_cmd][putdate][puthour].total_put += 1
-        hr_bkt[msg_cmd][putdate][puthour].sum_deq += messages[msg].deq_time
-        if (hr_bkt[msg_cmd][putdate][puthour].min_deq == 0 or
-                hr_bkt[msg_cmd][putdate][puthour].min_deq > messages[msg].deq_time):
-            hr_bkt[msg_cmd][putdate][puthour].min_deq = messages[msg].deq_time
-        if (hr_bkt[msg_cmd][putdate][puthour].max_deq == 0 or
-                hr_bkt[msg_cmd][putdate][puthour].max_deq < messages[msg].deq_time):
-            hr_bkt[msg_cmd][putdate][puthour].max_deq = messages[msg].deq_time
-        hr_bkt[msg_cmd][putdate][puthour].avg_deq = \
-            hr_bkt[msg_cmd][putdate][puthour].sum_deq / hr_bkt[msg_cmd][putdate][puthour].total_put
-
-        # Get time is when the message is delivered
-        getdate = messages[msg].gettime[:10]
-        gethour = messages[msg].gettime[11:13]
-
-        hr_bkt[msg_cmd][getdate][gethour].total_get += 1
-        hr_bkt[msg_cmd][getdate][gethour].sum_del += messages[msg].del_time
-        if (hr_bkt[msg_cmd][getdate][gethour].min_del == 0 or
-                hr_bkt[msg_cmd][getdate][gethour].min_del > messages[msg].del_time):
-            hr_bkt[msg_cmd][getdate][gethour].min_del = messages[msg].del_time
-        if (hr_bkt[msg_cmd][getdate][gethour].max_del == 0 or
-                hr_bkt[msg_cmd][getdate][gethour].max_del < messages[msg].del_time):
-            hr_bkt[msg_cmd][getdate][gethour].max_del = messages[msg].del_time
-
-        hr_bkt[msg_cmd][getdate][gethour].avg_del = \
-            hr_bkt[msg_cmd][getdate][gethour].sum_del / hr_bkt[msg_cmd][getdate][gethour].total_get
+    msg_cmds, hours = columns['msg_cmds'], columns['hours']
+    for hour_column, time_column in (('put_hour', 'deq_time'), ('get_hour', 'del_time')):
+        # a group per command and hour, of the messages with the time
+        known = columns[hour_column] >= 0
+        groups = (columns['msg_cmd'][known].astype(numpy.int64) * len(hours) +
+                  columns[hour_column][known])
+        order, starts = group_starts(groups)
+        if not len(starts):
+            continue
+        times = columns[time_column][known][order]
+        totals = numpy.diff(numpy.append(starts, len(order)))
+        sums = numpy.add.reduceat(times, starts)
+        maxs = numpy.maximum.reduceat(times, starts)
+        mins = numpy.minimum.reduceat(numpy.where(times == 0, numpy.inf, times), starts)
+        mins[numpy.isinf(mins)] = 0
+        for group, start in enumerate(starts):
+            msg_cmd, hour = divmod(int(groups[order[start]]), len(hours))
+            msg_cmd, hour = msg_cmds[msg_cmd], hours[hour]
+            # Hour buckets look like: hr_bkt[msg_cmd][msg_date][msg_hour] = MiqMsgBucket()
+            date_bkt = hr_bkt.setdefault(msg_cmd, {}).setdefault(hour[:10], {})
+            bk = date_bkt.get(hour[11:13])
+            if bk is None:
+                bk = date_bkt[hour[11:13]] = MiqMsgBucket()
+            total, total_sum = int(totals[group]), float(sums[group])
+            if hour_column == 'put_hour':
+                bk.total_put, bk.sum_deq, bk.avg_deq = total, total_sum, total_sum / total
+                bk.min_deq, bk.max_deq = float(mins[group]), float(maxs[group])
+            else:
+                bk.total_get, bk.sum_del, bk.avg_del = total, total_sum, total_sum / total
+                bk.min_del, bk.max_del = float(mins[group]), float(maxs[group])
+    return hr_bkt
+
+
+def group_starts(groups):
+    """Sort an array of group numbers
+
+    Returns:
+        the stable sort order of ``groups`` and the index in that order where each group starts
+    """
+    # Import here to allow perf to install numpy separately
+    import numpy
+
+    order = numpy.argsort(groups, kind='mergesort')
+    groups = groups[order]
+    starts = numpy.flatnonzero(groups[1:] != groups[:-1]) + 1
+    if len(groups):
+        starts = numpy.insert(starts, 0, 0)
+    return order, starts
+
+
+def messages_to_columns(messages):
+    """Compact columns of the queue messages, in the order of their sorted ids
+
+    Commands and hours (like ``2015-01-26 08``) are stored as indexes into the ``msg_cmds``
+    and ``hours`` lists, times as floats. ``get_hour`` is -1 for the messages not delivered.
+
+    Returns:
+        dict of the numpy arrays ``msg_cmd``, ``put_hour``, ``get_hour``, ``deq_time``,
+        ``del_time`` and ``total_time``, and of the lists ``msg_cmds`` and ``hours``
+    """
+    # Import here to allow perf to install numpy separately
+    import numpy
+
+    row_getter = attrgetter('msg_cmd', 'puttime', 'gettime', 'deq_time', 'del_time', 'total_time')
+    rows = [row_getter(messages[msg_id]) for msg_id in sorted(messages)]
+    msg_cmd, puttime, gettime, deq_time, del_time, total_time = zip(*rows) if rows else [()] * 6
+    msg_cmds = {}
+    columns = {
+        'msg_cmd': numpy.array([msg_cmds.setdefault(cmd, len(msg_cmds)) for cmd in msg_cmd],
+            numpy.int32),
+        'deq_time': numpy.array(deq_time, numpy.float64),
+        'del_time': numpy.array(del_time, numpy.float64),
+        'total_time': numpy.array(total_time, numpy.float64),
+        'msg_cmds': sorted(msg_cmds, key=msg_cmds.get),
+    }
+    # timestamps truncated to the hour, -1 for the messages not delivered
+    stamps = numpy.array(puttime + gettime, 'U13')
+    known = stamps != ''
+    hours, known_index = numpy.unique(stamps[known], return_inverse=True)
+    hour_index = numpy.full(len(stamps), -1, numpy.int32)
+    hour_index[known] = known_index
+    columns['put_hour'], columns['get_hour'] = numpy.split(hour_index, 2)
+    columns['hours'] = [str(hour) for hour in hours]
+    return columns
+
+
+def provision_missing_hour_buckets(hr_bkt, test_start, test_end):
+    """Add empty buckets for every hour of the test without messages of a command"""
+    for msg_cmd in hr_bkt:
+        buckets = provision_hour_buckets(test_start, test_end)
+        for date in hr_bkt[msg_cmd]:
+            buckets.setdefault(date, {}).update(hr_bkt[msg_cmd][date])
+        hr_bkt[msg_cmd] = buckets
+
+
+def messages_to_hourly_buckets(messages, test_start, test_end):
+    hr_bkt = columns_to_hourly_buckets(messages_to_columns(messages))
+    provision_missing_hour_buckets(hr_bkt, test_start, test_end)
     return hr_bkt
 
 
 def messages_to_statistics_csv(messages, statistics_file_name):
-    all_statistics = []
-    for msg_id in messages:
-        msg = messages[msg_id]
-
-        added = False
-        if len(all_statistics) > 0:
-            for msg_statistics in all_statistics:
-                if msg_statistics.cmd == msg.msg_cmd:
-
-                    if msg.del_time > 0:
-                        msg_statistics.delivertimes.append(float(msg.del_time))
-                        msg_statistics.gets += 1
-                    msg_statistics.dequeuetimes.append(float(msg.deq_time))
-                    msg_statistics.totaltimes.append(float(msg.total_time))
-                    msg_statistics.puts += 1
-                    added = True
-                    break
+    # Import here to allow perf to install numpy separately
+    import numpy
 
-        if not added:
-            msg_statistics = MiqMsgLists()
-            msg_statistics.cmd = msg.msg_cmd
-            if msg.del_time > 0:
-                msg_statistics.delivertimes.append(float(msg.del_time))
-                msg_statistics.gets = 1
-            msg_statistics.dequeuetimes.append(float(msg.deq_time))
-            msg_statistics.totaltimes.append(float(msg.total_time))
-            msg_statistics.puts = 1
-            all_statistics.append(msg_statistics)
+    columns = messages_to_columns(messages)
+    order, starts = group_starts(columns['msg_cmd'])
+    all_statistics = []
+    for start, end in zip(starts, numpy.append(starts[1:], len(order))):
+        # the time columns are sliced by command, rather than copied into lists
+        cmd_order = order[start:end]
+        msg_statistics = MiqMsgLists()
+        msg_statistics.cmd = columns['msg_cmds'][columns['msg_cmd'][cmd_order[0]]]
+        msg_statistics.dequeuetimes = columns['deq_time'][cmd_order]
+        msg_statistics.totaltimes = columns['total_time'][cmd_order]
+        delivertimes = columns['del_time'][cmd_order]
+        msg_statistics.delivertimes = delivertimes[delivertimes > 0]
+        msg_statistics.puts = len(cmd_order)
+        msg_statistics.gets = len(msg_statistics.delivertimes)
+        all_statistics.append(msg_statistics)
 
     csvdata_path = log_path.join('csv_output', statistics_file_name)
     outputfile = csvdata_path.open('w', ensure=True)
@@ -563,9 +503,6 @@ def messages_to_statistics_csv(messages, statistics_file_name):
 
         csvfile.writerow(headers)
 
-        # Import here to allow perf to install numpy separately
-        import numpy
-
         # Contents of CSV
         for msg_statistics in sorted(all_statistics, key=lambda x: x.cmd):
             if msg_statistics.gets > 1:
@@ -584,6 +521,33 @@ def messages_to_statistics_csv(messages, statistics_file_name):
         outputfile.close()
 
 
+def parse_evm_chunk(evm_file, filters, start, end):
+    """Parse the lines of evm.log between two byte offsets, see :py:meth:`EvmLogParser.merge`"""
+    parser = EvmLogParser(filters, chunk=True)
+    parser.parse_file(evm_file, start, end)
+    return parser
+
+
+def parse_evm_log(evm_file, filters, pool=None, chunks=1):
+    """Parse evm.log, split into up to ``chunks`` chunks parsed in ``pool``
+
+    Returns:
+        a :py:class:`EvmLogParser` holding the results for the whole file
+    """
+    parser = EvmLogParser(filters)
+    offsets = chunk_offsets(evm_file, chunks)
+    if pool is None or len(offsets) == 1:
+        parser.parse_file(evm_file)
+        return parser
+    logger.info('Parsing evm log file in %d chunks', len(offsets))
+    results = [pool.apply_async(parse_evm_chunk, (evm_file, filters, start, end))
+        for start, end in offsets]
+    # chunks are merged in order, each one reconciles what the previous ones left open
+    for result in results:
+        parser.merge(result.get())
+    return parser
+
+
 def provision_hour_buckets(test_start, test_end, init=True):
     buckets = {}
     start_date = datetime.strptime(test_start[:10], '%Y-%m-%d')
@@ -617,6 +581,18 @@ def provision_hour_buckets(test_start, test_end, init=True):
     return buckets
 
 
+def read_lines(file_name, start=0, end=None):
+    """Iterate over the lines of a file starting between two byte offsets"""
+    with io.open(file_name, 'rb') as read_file:
+        read_file.seek(start)
+        position = start
+        for line in read_file:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line if six.PY2 else line.decode('utf-8', 'replace')
+
+
 def top_to_appliance(top_file):
     # Find first miqtop log line
     miqtop_time, timezone_offset = get_first_miqtop(top_file)
@@ -799,7 +775,16 @@ def top_to_workers(workers, top_file):
     return top_workers, len(top_lines)
 
 
-def perf_process_evm(evm_file, top_file):
+def perf_process_evm(evm_file, top_file, processes=None):
+    """Parse evm.log and top_output.log and generate the perf report
+
+    Args:
+        evm_file: path to evm.log
+        top_file: path to top_output.log
+        processes: size of the process pool the logs are parsed in, defaults to the number of
+            cpus. evm.log is split into a chunk per process, top_output.log is parsed for
+            the appliance metrics meanwhile.
+    """
     msg_filters = {
         '-hourly': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"hourly\"'),
         '-daily': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"daily\"'),
@@ -811,23 +796,31 @@ def perf_process_evm(evm_file, top_file):
 
     starttime = time()
     initialtime = starttime
+    processes = processes or cpu_count()
+    pool = Pool(processes)
 
-    logger.info('----------- Parsing evm log file for messages -----------')
-    messages, msg_cmds, test_start, test_end, msg_lc = evm_to_messages(evm_file, msg_filters)
+    logger.info('----------- Parsing evm log file for messages and workers -----------')
+    top_appliance_result = pool.apply_async(top_to_appliance, (top_file,))
+    try:
+        parser = parse_evm_log(evm_file, msg_filters, pool, processes)
+    except Exception:
+        pool.terminate()
+        raise
+    messages, test_start, test_end = parser.messages, parser.test_start, parser.test_end
+    msg_cmds = parser.msg_cmds()
+    hr_bkt = messages_to_hourly_buckets(messages, test_start, test_end)
+    msg_lc = parser.line_count
+    workers, wkr_lc = parser.workers, parser.wkr_line_count
+    wkr_mem_exc, wkr_upt_exc, wkr_stp = parser.wkr_mem_exc, parser.wkr_upt_exc, parser.wkr_stp
+    wkr_int, wkr_ext = parser.wkr_int, parser.wkr_ext
     timediff = time() - starttime
     logger.info('----------- Completed Parsing evm log file -----------')
-    logger.info('Parsed %s lines of evm log file for messages in %s', msg_lc, timediff)
+    logger.info('Parsed %s lines of evm log file in %s', msg_lc, timediff)
     logger.info('Total # of Messages: %d', len(messages))
     logger.info('Total # of Commands: %d', len(msg_cmds))
     logger.info('Start Time: %s', test_start)
     logger.info('End Time: %s', test_end)
-
-    logger.info('----------- Parsing evm log file for workers -----------')
-    starttime = time()
-    workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext, wkr_lc = evm_to_workers(evm_file)
-    timediff = time() - starttime
-    logger.info('----------- Completed Parsing evm log for workers -----------')
-    logger.info('Parsed %s lines of evm log file for workers in %s', wkr_lc, timediff)
+    logger.info('Found %s lines about workers', wkr_lc)
     logger.info('Total # of Workers: %d', len(workers))
     logger.info('# Workers Memory Exceeded: %s', wkr_mem_exc)
     logger.info('# Workers Uptime Exceeded: %s', wkr_upt_exc)
@@ -837,10 +830,14 @@ def perf_process_evm(evm_file, top_file):
 
     logger.info('----------- Parsing top_output log file for Appliance Metrics -----------')
     starttime = time()
-    top_appliance, tp_lc = top_to_appliance(top_file)
+    try:
+        top_appliance, tp_lc = top_appliance_result.get()
+    finally:
+        pool.close()
+        pool.join()
     timediff = time() - starttime
     logger.info('----------- Completed Parsing top_output log -----------')
-    logger.info('Parsed %s lines of top_output file for Appliance Metrics in %s', tp_lc,
+    logger.info('Parsed %s lines of top_output file for Appliance Metrics, waited %s', tp_lc,
         timediff)
 
     logger.info('----------- Parsing top_output log file for worker CPU/Mem -----------')
@@ -861,12 +858,6 @@ def perf_process_evm(evm_file, top_file):
     timediff = time() - starttime
     logger.info('Generated Raw Data csv files in: %s', timediff)
 
-    logger.info('----------- Generating Hourly Buckets -----------')
-    starttime = time()
-    hr_bkt = messages_to_hourly_buckets(messages, test_start, test_end)
-    timediff = time() - starttime
-    logger.info('Generated Hourly Buckets in: %s', timediff)
-
     logger.info('----------- Generating Hourly Charts and csvs -----------')
     starttime = time()
     generate_hourly_charts_and_csvs(hr_bkt, charts_dir)
@@ -1032,11 +1023,222 @@ def perf_process_evm(evm_file, top_file):
     logger.info('Total time processing evm log file and generating report: %s', timediff)
 
 
+class EvmLogParser(object):
+    """Single pass evm.log parser for queue messages and workers
+
+    Lines are only matched against regular expressions once a cheap substring check shows
+    they can be relevant, and all fields of a queue message line are extracted in one
+    scan. The hourly buckets are aggregated over all the messages once the log is parsed, see
+    :py:func:`messages_to_hourly_buckets`.
+
+    A parser with ``chunk`` set parses only part of the log. It keeps the queue operations on
+    messages put before its chunk in ``orphans`` and the lines about workers in
+    ``worker_lines``, for :py:meth:`merge` to reconcile with the chunks before it.
+
+    Args:
+        filters: dict of suffix -> compiled regular expression, the suffix of the first
+            expression matching the args of a message is appended to its command
+        chunk: whether only a chunk of the log is parsed
+    """
+    def __init__(self, filters, chunk=False):
+        self.filters = filters
+        self.chunk = chunk
+        # (queue_op, msg_id, ts, pid, deq_time or del_time) of messages not put in the chunk
+        self.orphans = []
+        self.worker_lines = []
+        self.line_count = 0
+        self.test_start = ''
+        self.test_end = ''
+        self.messages = {}
+        self.workers = {}
+        self.wkr_line_count = 0
+        self.wkr_upt_exc = 0
+        self.wkr_mem_exc = 0
+        self.wkr_stp = 0
+        self.wkr_int = 0
+        self.wkr_ext = 0
+
+    def parse_file(self, evm_file, start=0, end=None):
+        runningtime = time()
+        for evm_log_line in read_lines(evm_file, start, end):
+            self.feed(evm_log_line)
+            if (self.line_count % 100000) == 0:
+                timediff = time() - runningtime
+                runningtime = time()
+                logger.info('Count %s : Parsed 100000 lines in %s', self.line_count, timediff)
+
+    def feed(self, evm_log_line):
+        self.line_count += 1
+        # Cheap substring checks first, the bulk of the log is neither about queue messages
+        # nor about workers
+        if self.test_start == '' and 'MIQ(' in evm_log_line and miqmsg.search(evm_log_line):
+            # Obtains the first timestamp in the log file
+            self.test_start, pid = get_msg_timestamp_pid(evm_log_line)
+        if 'MIQ(MiqQueue.' in evm_log_line:
+            self._feed_message(evm_log_line.strip())
+        if ('Interrupt' in evm_log_line or ') ID' in evm_log_line or
+                '"evm_worker_' in evm_log_line or 'Worker exiting' in evm_log_line):
+            if miqwkr_line.search(evm_log_line):
+                if self.chunk:
+                    # workers are few, they are replayed in order once chunks are merged
+                    self.worker_lines.append(evm_log_line.strip())
+                else:
+                    self._feed_worker(evm_log_line.strip())
+
+    def _feed_message(self, evm_log_line):
+        miqmsg_result = miqmsg_queue.search(evm_log_line)
+        if not miqmsg_result or not miqmsg_result.group(2):
+            if 'MIQ(MiqQueue.put)' in evm_log_line or 'MIQ(MiqQueue.get_via_drb)' in \
+                    evm_log_line or 'MIQ(MiqQueue.delivered)' in evm_log_line:
+                logger.error('Could not obtain message id, line #: %s', self.line_count)
+            return
+        queue_op, msg_id = miqmsg_result.groups()
+        ts, pid = get_msg_timestamp_pid(evm_log_line)
+        messages = self.messages
+
+        # A message was first put on the queue, this starts its queuing time
+        if queue_op == 'put':
+            self.test_end = ts
+            msg = messages[msg_id] = MiqMsgStat()
+            msg.msg_id = '\'' + msg_id + '\''
+            msg.msg_cmd = get_msg_cmd(evm_log_line)
+            msg.pid_put = intern(pid)
+            msg.puttime = ts
+            msg_args = get_msg_args(evm_log_line)
+            if msg_args is False:
+                logger.debug('Could not obtain message args line #: %s', self.line_count)
+            else:
+                msg.msg_args = msg_args
+            # By filtering over messages, we can better display what is occuring under the
+            # covers, as a daily rollup is picked up off the queue different than a hourly
+            # rollup, etc
+            for p_filter in self.filters:
+                if self.filters[p_filter].search(msg.msg_args.strip()):
+                    msg.msg_cmd = '{}{}'.format(msg.msg_cmd, p_filter)
+                    break
+            if msg.msg_cmd:
+                # commands repeat over all the messages, share the strings
+                msg.msg_cmd = intern(msg.msg_cmd)
+
+        elif queue_op == 'get_via_drb':
+            if msg_id in messages:
+                self.test_end = ts
+                msg = messages[msg_id]
+                msg.pid_get = intern(pid)
+                msg.gettime = ts
+                msg.deq_time = get_msg_deq(evm_log_line)
+            elif self.chunk:
+                self.orphans.append((queue_op, msg_id, ts, pid, get_msg_deq(evm_log_line)))
+            else:
+                logger.error('Message ID not in dictionary: %s', msg_id)
+
+        else:
+            self.test_end = ts
+            if msg_id in messages:
+                msg = messages[msg_id]
+                msg.del_time = get_msg_del(evm_log_line)
+                msg.total_time = msg.deq_time + msg.del_time
+            elif self.chunk:
+                self.orphans.append((queue_op, msg_id, ts, pid, get_msg_del(evm_log_line)))
+            else:
+                logger.error('Message ID not in dictionary: %s', msg_id)
+
+    def _terminate_worker(self, workerid_re, evm_log_line, ts, reason):
+        miqwkr_id_result = workerid_re.search(evm_log_line)
+        if miqwkr_id_result:
+            workerid = int(miqwkr_id_result.group(1))
+            if workerid in self.workers:
+                if not self.workers[workerid].terminated:
+                    self.workers[workerid].terminated = reason
+                    self.workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+                    return True
+        return False
+
+    def _feed_worker(self, evm_log_line):
+        self.wkr_line_count += 1
+        workers = self.workers
+        ts, pid = get_msg_timestamp_pid(evm_log_line)
+
+        miqwkr_result = miqwkr.search(evm_log_line)
+        if miqwkr_result:
+            workerid = int(miqwkr_result.group(2))
+            if workerid not in workers:
+                workers[workerid] = MiqWorker()
+                workers[workerid].worker_type = miqwkr_result.group(1)
+                workers[workerid].pid = miqwkr_result.group(3)
+                workers[workerid].worker_id = int(workerid)
+                workers[workerid].start_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'evm_worker_uptime_exceeded' in evm_log_line:
+            if self._terminate_worker(miqwkr_id, evm_log_line, ts, 'evm_worker_uptime_exceeded'):
+                self.wkr_upt_exc += 1
+        elif 'evm_worker_memory_exceeded' in evm_log_line:
+            if self._terminate_worker(miqwkr_id, evm_log_line, ts, 'evm_worker_memory_exceeded'):
+                self.wkr_mem_exc += 1
+        elif 'evm_worker_stop' in evm_log_line:
+            if self._terminate_worker(miqwkr_id, evm_log_line, ts, 'evm_worker_stop'):
+                self.wkr_stp += 1
+        elif 'Interrupt' in evm_log_line:
+            for workerid in workers:
+                if not workers[workerid].end_ts:
+                    self.wkr_int += 1
+                    workers[workerid].terminated = 'Interrupted'
+                    workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'Worker exiting.' in evm_log_line:
+            if self._terminate_worker(miqwkr_id_2, evm_log_line, ts, 'Worker Exited'):
+                self.wkr_ext += 1
+
+    def merge(self, chunk):
+        """Merge the parser of the next chunk of the log into this one
+
+        The queue operations on messages put before the chunk are applied to the messages put
+        in the previous chunks first, then the messages of the chunk are added.
+        Lines about workers are replayed, as workers are terminated by lines in later chunks.
+        """
+        messages = self.messages
+        for queue_op, msg_id, ts, pid, op_time in chunk.orphans:
+            if msg_id not in messages:
+                logger.error('Message ID not in dictionary: %s', msg_id)
+                continue
+            msg = messages[msg_id]
+            if queue_op == 'get_via_drb':
+                self.test_end = max(self.test_end, ts)
+                msg.pid_get = intern(pid)
+                msg.gettime = ts
+                msg.deq_time = op_time
+            else:
+                msg.del_time = op_time
+                msg.total_time = msg.deq_time + msg.del_time
+        # messages put again in the chunk replace the previous ones, like a single pass does
+        messages.update(chunk.messages)
+
+        self.line_count += chunk.line_count
+        if not self.test_start:
+            self.test_start = chunk.test_start
+        self.test_end = max(self.test_end, chunk.test_end)
+        for evm_log_line in chunk.worker_lines:
+            self._feed_worker(evm_log_line)
+
+    def msg_cmds(self):
+        """Total, queue and execution times of the delivered messages, by command"""
+        msg_cmds = {}
+        for msg in sorted(self.messages.keys()):
+            msg = self.messages[msg]
+            if msg.msg_cmd not in msg_cmds:
+                msg_cmds[msg.msg_cmd] = {'total': [], 'queue': [], 'execute': []}
+            if msg.total_time != 0:
+                msg_cmds[msg.msg_cmd]['total'].append(round(msg.total_time, 2))
+                msg_cmds[msg.msg_cmd]['queue'].append(round(msg.deq_time, 2))
+                msg_cmds[msg.msg_cmd]['execute'].append(round(msg.del_time, 2))
+        return msg_cmds
+
+
 class MiqMsgStat(object):
+    # There is one per queue message, keep them small
+    headers = ['msg_id', 'msg_cmd', 'msg_args', 'pid_put', 'pid_get', 'puttime', 'gettime',
+        'deq_time', 'del_time', 'total_time']
+    __slots__ = headers
 
     def __init__(self):
-        self.headers = ['msg_id', 'msg_cmd', 'msg_args', 'pid_put', 'pid_get', 'puttime', 'gettime',
-            'deq_time', 'del_time', 'total_time']
         self.msg_id = ''
         self.msg_cmd = ''
         self.msg_args = ''
@@ -1070,9 +1272,11 @@ class MiqMsgLists(object):
 
 
 class MiqMsgBucket(object):
+    headers = ['date', 'hour', 'total_put', 'total_get', 'sum_deq', 'min_deq', 'max_deq',
+        'avg_deq', 'sum_del', 'min_del', 'max_del', 'avg_del']
+    __slots__ = headers
+
     def __init__(self):
-        self.headers = ['date', 'hour', 'total_put', 'total_get', 'sum_deq', 'min_deq', 'max_deq',
-            'avg_deq', 'sum_del', 'min_del', 'max_del', 'avg_del']
         self.date = ''
         self.hour = ''
         self.total_put = 0
@@ -1098,9 +1302,10 @@ class MiqMsgBucket(object):
 
 
 class MiqWorker(object):
+    headers = ['worker_id', 'worker_type', 'pid', 'start_ts', 'end_ts', 'terminated']
+    __slots__ = headers
 
     def __init__(self):
-        self.headers = ['worker_id', 'worker_type', 'pid', 'start_ts', 'end_ts', 'terminated']
         self.worker_id = 0
         self.worker_type = ''
         self.pid = ''
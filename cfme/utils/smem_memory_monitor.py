@@ -1,5 +1,6 @@
 """Monitor Memory on a CFME/Miq appliance and builds report&graphs displaying usage per process."""
 import json
+import socket
 import time
 import traceback
 from collections import OrderedDict
@@ -134,12 +135,69 @@ test_ts = time.strftime('%Y%m%d%H%M%S')
 # 10s sample interval (occasionally sampling can take almost 4s on an appliance doing a lot of work)
 SAMPLE_INTERVAL = 10
 
+# Collector streaming samples from the appliance, a json object per line holding the raw output
+# of what the monitor runs over ssh for a sample otherwise, and the appliance's time of the sample
+COLLECTOR_PATH = '/tmp/smem_collector.py'
+# Bytes read from the stream of samples at once
+STREAM_CHUNK = 65536
+COLLECTOR_SCRIPT = '''
+import json
+import subprocess
+import sys
+import time
+
+interval, miq_server_id = float(sys.argv[1]), sys.argv[2]
+workers_command = ['psql', '-t', '-q', '-d', 'vmdb_production', '-c',
+    "select pid,type from miq_workers where miq_server_id = '{}'".format(miq_server_id)]
+smem_command = ['smem', '-c', 'pid rss pss uss vss swap name command']
+
+
+def output(command):
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    return process.communicate()[0]
+
+
+while True:
+    started = time.time()
+    with open('/proc/meminfo') as meminfo:
+        sample = {'time': started, 'meminfo': meminfo.read()}
+    sample['workers'] = output(workers_command)
+    # without the header line
+    sample['smem'] = output(smem_command).partition('\\n')[2]
+    sample['duration'] = time.time() - started
+    # the write fails once the monitor closes the channel, which ends the collector
+    sys.stdout.write(json.dumps(sample) + '\\n')
+    sys.stdout.flush()
+    time.sleep(max(0, interval - (time.time() - started)))
+'''
+
 
 class SmemMemoryMonitor(Thread):
-    def __init__(self, ssh_client, scenario_data):
+    """Samples the memory of an appliance and its processes in a thread, until ``signal`` is
+    cleared, then creates the report
+
+    Args:
+        ssh_client: :py:class:`cfme.utils.ssh.SSHClient` of the appliance
+        scenario_data: the scenario, for the report
+        sample_interval: seconds between samples
+        stream: push a collector to the appliance, which streams the samples back over a single
+            ssh channel, instead of running the sampling commands over ssh for every sample.
+            Sampling then costs milliseconds here, which allows for short sample intervals.
+
+    ``sample_interval`` and ``stream`` default to the ``sample_interval`` and ``stream`` of
+    ``tools/memory_monitor`` in cfme_performance, then to every 10s and polling.
+    """
+    def __init__(self, ssh_client, scenario_data, sample_interval=None, stream=None):
         super(SmemMemoryMonitor, self).__init__()
+        monitor_conf = cfme_performance.get('tools', {}).get('memory_monitor', {})
+        if sample_interval is None:
+            sample_interval = monitor_conf.get('sample_interval', SAMPLE_INTERVAL)
+        if stream is None:
+            stream = monitor_conf.get('stream', False)
         self.ssh_client = ssh_client
         self.scenario_data = scenario_data
+        self.sample_interval = sample_interval
+        self.stream = stream
         self.grafana_urls = {}
         self.miq_server_id = ''
         self.use_slab = False
@@ -174,41 +232,45 @@ class SmemMemoryMonitor(Thread):
         # 5.4 - RHEL 6 / Centos 6
         # Application Memory Used : MemTotal - (MemFree + Buffers + Cached)
         # Available memory could potentially be better metric
-        appliance_results[plottime] = {}
-
         result = self.ssh_client.run_command('cat /proc/meminfo')
         if result.failed:
             logger.error('Exit_status nonzero in get_appliance_memory: {}, {}'
                          .format(result.rc, result.output))
-            del appliance_results[plottime]
         else:
-            meminfo_raw = result.output.replace('kB', '').strip()
-            meminfo = OrderedDict((k.strip(), v.strip()) for k, v in
-                (value.strip().split(':') for value in meminfo_raw.split('\n')))
-            appliance_results[plottime]['total'] = float(meminfo['MemTotal']) / 1024
-            appliance_results[plottime]['free'] = float(meminfo['MemFree']) / 1024
-            if 'MemAvailable' in meminfo:  # 5.5, RHEL 7/Centos 7
-                self.use_slab = True
-                mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
-                    meminfo['Slab']) + float(meminfo['Cached']))) / 1024
-            else:  # 5.4, RHEL 6/Centos 6
-                mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
-                    meminfo['Buffers']) + float(meminfo['Cached']))) / 1024
-            appliance_results[plottime]['used'] = mem_used
-            appliance_results[plottime]['buffers'] = float(meminfo['Buffers']) / 1024
-            appliance_results[plottime]['cached'] = float(meminfo['Cached']) / 1024
-            appliance_results[plottime]['slab'] = float(meminfo['Slab']) / 1024
-            appliance_results[plottime]['swap_total'] = float(meminfo['SwapTotal']) / 1024
-            appliance_results[plottime]['swap_free'] = float(meminfo['SwapFree']) / 1024
+            self.parse_appliance_memory(appliance_results, plottime, result.output)
+
+    def parse_appliance_memory(self, appliance_results, plottime, meminfo_output):
+        appliance_results[plottime] = {}
+        meminfo_raw = meminfo_output.replace('kB', '').strip()
+        meminfo = OrderedDict((k.strip(), v.strip()) for k, v in
+            (value.strip().split(':') for value in meminfo_raw.split('\n')))
+        appliance_results[plottime]['total'] = float(meminfo['MemTotal']) / 1024
+        appliance_results[plottime]['free'] = float(meminfo['MemFree']) / 1024
+        if 'MemAvailable' in meminfo:  # 5.5, RHEL 7/Centos 7
+            self.use_slab = True
+            mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
+                meminfo['Slab']) + float(meminfo['Cached']))) / 1024
+        else:  # 5.4, RHEL 6/Centos 6
+            mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
+                meminfo['Buffers']) + float(meminfo['Cached']))) / 1024
+        appliance_results[plottime]['used'] = mem_used
+        appliance_results[plottime]['buffers'] = float(meminfo['Buffers']) / 1024
+        appliance_results[plottime]['cached'] = float(meminfo['Cached']) / 1024
+        appliance_results[plottime]['slab'] = float(meminfo['Slab']) / 1024
+        appliance_results[plottime]['swap_total'] = float(meminfo['SwapTotal']) / 1024
+        appliance_results[plottime]['swap_free'] = float(meminfo['SwapFree']) / 1024
 
     def get_evm_workers(self):
         result = self.ssh_client.run_command(
             'psql -t -q -d vmdb_production -c '
             '\"select pid,type from miq_workers where miq_server_id = \'{}\'\"'.format(
                 self.miq_server_id))
-        if result.output.strip():
+        return self.parse_evm_workers(result.output)
+
+    def parse_evm_workers(self, psql_output):
+        if psql_output.strip():
             workers = {}
-            for worker in result.output.strip().split('\n'):
+            for worker in psql_output.strip().split('\n'):
                 pid_worker = worker.strip().split('|')
                 if len(pid_worker) == 2:
                     workers[pid_worker[0].strip()] = pid_worker[1].strip()
@@ -248,7 +310,10 @@ class SmemMemoryMonitor(Thread):
     def get_pids_memory(self):
         result = self.ssh_client.run_command(
             'smem -c \'pid rss pss uss vss swap name command\' | sed 1d')
-        pids_memory = result.output.strip().split('\n')
+        return self.parse_pids_memory(result.output)
+
+    def parse_pids_memory(self, smem_output):
+        pids_memory = smem_output.strip().split('\n')
         memory_by_pid = {}
         for line in pids_memory:
             if line.strip():
@@ -267,9 +332,106 @@ class SmemMemoryMonitor(Thread):
                 except Exception as e:
                     logger.error('Processing smem output error: {}'.format(e.__class__.__name__, e))
                     logger.error('Issue with pid: {} line: {}'.format(pid, line))
-                    logger.error('Complete smem output: {}'.format(result.output))
+                    logger.error('Complete smem output: {}'.format(smem_output))
         return memory_by_pid
 
+    def samples(self, appliance_results):
+        """Sample until ``signal`` is cleared
+
+        The appliance memory is put into ``appliance_results``.
+
+        Yields:
+            the time of the sample, the evm workers by pid and the memory by pid
+        """
+        if self.stream:
+            if self.ssh_client.is_container or self.ssh_client.is_pod or \
+                    self.ssh_client.username != 'root':
+                logger.warning('Streaming samples needs root ssh to the appliance, polling')
+            else:
+                return self.stream_samples(appliance_results)
+        return self.poll_samples(appliance_results)
+
+    def poll_samples(self, appliance_results):
+        while self.signal:
+            starttime = time.time()
+            plottime = datetime.now()
+
+            self.get_appliance_memory(appliance_results, plottime)
+            workers = self.get_evm_workers()
+            memory_by_pid = self.get_pids_memory()
+            yield plottime, workers, memory_by_pid
+
+            timediff = time.time() - starttime
+            logger.debug('Monitoring sampled in {}s'.format(round(timediff, 4)))
+
+            # Sleep Monitoring interval
+            # Roughly 10s samples, accounts for collection of memory measurements
+            time_to_sleep = abs(self.sample_interval - timediff)
+            time.sleep(time_to_sleep)
+
+    def appliance_clock_offset(self):
+        """Seconds to add to the appliance's time to get the time here"""
+        before = time.time()
+        result = self.ssh_client.run_command('date +%s.%N')
+        after = time.time()
+        try:
+            return (before + after) / 2 - float(result.output.strip())
+        except ValueError:
+            logger.warning('Could not get the time of the appliance: {}'.format(result.output))
+            return 0
+
+    def stream_samples(self, appliance_results):
+        # the samples are plotted at the time they were taken, which is this far off here
+        clock_offset = self.appliance_clock_offset()
+        sftp = self.ssh_client.open_sftp()
+        try:
+            with sftp.open(COLLECTOR_PATH, 'w') as collector:
+                collector.write(COLLECTOR_SCRIPT)
+        finally:
+            sftp.close()
+        session = self.ssh_client.get_transport().open_session()
+        # wake up now and then to check the signal, even if the collector is slow
+        session.settimeout(self.sample_interval * 2)
+        session.exec_command('exec python {} {} {}'.format(
+            COLLECTOR_PATH, self.sample_interval, self.miq_server_id))
+        logger.info('Streaming samples from {}'.format(COLLECTOR_PATH))
+        # what was read of the next line, kept across the timeouts
+        partial = b''
+        try:
+            while self.signal:
+                try:
+                    data = session.recv(STREAM_CHUNK)
+                except socket.timeout:
+                    logger.warning('No sample streamed in {}s'.format(self.sample_interval * 2))
+                    continue
+                if not data:
+                    logger.error('Sample collector exited: {}'.format(
+                        session.makefile_stderr().read()))
+                    break
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
+                for line in lines:
+                    starttime = time.time()
+                    # the appliance memory goes into the results once all of the sample parsed
+                    appliance_memory = {}
+                    try:
+                        sample = json.loads(line.decode('utf-8'))
+                        plottime = datetime.fromtimestamp(sample['time'] + clock_offset)
+                        self.parse_appliance_memory(appliance_memory, plottime, sample['meminfo'])
+                        workers = self.parse_evm_workers(sample['workers'])
+                        memory_by_pid = self.parse_pids_memory(sample['smem'])
+                    except ValueError:
+                        logger.exception('Skipping the sample which could not be parsed')
+                        continue
+                    appliance_results.update(appliance_memory)
+                    yield plottime, workers, memory_by_pid
+
+                    logger.debug('Monitoring sampled in {}s, {}s on the appliance'.format(
+                        round(time.time() - starttime, 4), round(sample['duration'], 4)))
+        finally:
+            # the collector dies on its next write
+            session.close()
+
     def _real_run(self):
         """ Result dictionaries:
         appliance_results[timestamp][measurement] = value
@@ -294,14 +456,7 @@ class SmemMemoryMonitor(Thread):
         install_smem(self.ssh_client)
         self.get_miq_server_id()
         logger.info('Starting Monitoring Thread.')
-        while self.signal:
-            starttime = time.time()
-            plottime = datetime.now()
-
-            self.get_appliance_memory(appliance_results, plottime)
-            workers = self.get_evm_workers()
-            memory_by_pid = self.get_pids_memory()
-
+        for plottime, workers, memory_by_pid in self.samples(appliance_results):
             for worker_pid in workers:
                 self.create_process_result(process_results, plottime, worker_pid,
                     workers[worker_pid], memory_by_pid)
@@ -340,14 +495,6 @@ class SmemMemoryMonitor(Thread):
                             'evm:dbsync:replicate', memory_by_pid)
                     else:
                         logger.debug('Unaccounted for ruby pid: {}'.format(pid))
-
-            timediff = time.time() - starttime
-            logger.debug('Monitoring sampled in {}s'.format(round(timediff, 4)))
-
-            # Sleep Monitoring interval
-            # Roughly 10s samples, accounts for collection of memory measurements
-            time_to_sleep = abs(SAMPLE_INTERVAL - timediff)
-            time.sleep(time_to_sleep)
         logger.info('Monitoring CFME Memory Terminating')
 
         create_report(self.scenario_data, appliance_results, process_results, self.use_slab,
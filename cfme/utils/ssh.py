@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import os
+import select
 import socket
 import sys
+import time
+import zlib
+from collections import deque
+from collections import OrderedDict
 from subprocess import check_call
+from threading import Lock
 
 import attr
 import diaper
@@ -10,6 +18,7 @@ import iso8601
 import paramiko
 import re
 from cached_property import cached_property
+from concurrent import futures
 from os import path as os_path
 from scp import SCPClient
 
@@ -27,6 +36,18 @@ import six
 # in seconds (float)
 RUNCMD_TIMEOUT = 1200.0
 
+# Longest wait for output of a command before checking on it again, in seconds
+CHANNEL_WAIT = 0.1
+# Commands run at once over a single connection, sshd allows 10 sessions per connection by default
+MAX_SESSIONS = 8
+# Bytes read at once by delta transfers
+TRANSFER_CHUNK = 1024 * 1024
+# Hosts connected to at once by run_on_hosts
+FLEET_WORKERS = 20
+# Return codes of run_on_hosts for hosts which failed before the command finished
+RC_TIMEOUT = 124
+RC_SSH_ERROR = 255
+
 
 @attr.s(frozen=True)
 class SSHResult(object):
@@ -95,6 +116,28 @@ _ssh_pubkey_file = project_path.join('.generated_ssh_key.pub')
 
 _client_session = []
 
+# connect kwargs -> SSHClient shared by everything connecting with them
+_shared_clients = {}
+_shared_clients_lock = Lock()
+
+
+def shared_client(**connect_kwargs):
+    """Get the :py:class:`SSHClient` shared by everything connecting with the same kwargs
+
+    Every command run with the shared client goes over its one connection, on channels of its
+    own. The client is created on first use and reconnects when its connection went away.
+
+    Returns:
+        A tuple of the shared client and whether it was just created
+    """
+    key = tuple(sorted(connect_kwargs.items()))
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is not None and client in _client_session:
+            return client, False
+        client = _shared_clients[key] = SSHClient(**connect_kwargs)
+        return client, True
+
 
 class SSHClient(paramiko.SSHClient):
     """paramiko.SSHClient wrapper
@@ -276,31 +319,7 @@ class SSHClient(paramiko.SSHClient):
         Returns:
             A :py:class:`SSHResult` instance.
         """
-        if isinstance(command, dict):
-            command = version.pick(command, active_version=self.vmdb_version)
-        original_command = command
-        uses_sudo = False
-        logger.info("Running command %r", command)
-        container = container or self._container
-        if self.is_pod and not ensure_host:
-            # This command will be executed in the context of the host provider
-            command_to_run = '[[ -f /etc/default/evm ]] && source /etc/default/evm; ' + command
-            oc_cmd = 'oc exec --namespace={proj} {pod} -- bash -c {cmd}'.format(
-                proj=self._project, pod=container, cmd=quote(command_to_run))
-            command = oc_cmd
-            ensure_host = True
-        elif self.is_container and not ensure_host:
-            command = 'docker exec {} bash -c {}'.format(container, quote(
-                'source /etc/default/evm; ' + command))
-
-        if self.username != 'root' and not ensure_user:
-            # We need sudo
-            command = 'sudo -i bash -c {command}'.format(command=quote(command))
-            uses_sudo = True
-
-        if command != original_command:
-            logger.info("> Actually running command %r", command)
-        command += '\n'
+        command, uses_sudo = self._prepare_command(command, ensure_host, ensure_user, container)
 
         output = []
         try:
@@ -320,9 +339,18 @@ class SSHClient(paramiko.SSHClient):
                 if self._streaming:
                     file.write(line)
 
+            started = time.time()
             while True:
                 if session.exit_status_ready():
                     break
+                if timeout and time.time() - started > timeout:
+                    session.close()
+                    raise socket.timeout('Command did not finish in {}s'.format(timeout))
+
+                # Sleep until there is output or the program finishes, rather than spinning.
+                # Only stdout wakes the channel up, stderr is checked after a short wait.
+                if not session.recv_ready() and not session.recv_stderr_ready():
+                    select.select([session], [], [], CHANNEL_WAIT)
 
                 # While the program is running loop through collecting line by line so that we don't
                 # fill the buffers up without a newline.
@@ -341,7 +369,7 @@ class SSHClient(paramiko.SSHClient):
 
                 if session.recv_stderr_ready():
                     try:
-                        line = next(stdout)
+                        line = next(stderr)
                         write_output(line, self.f_stderr)
                     except StopIteration:
                         pass
@@ -375,6 +403,115 @@ class SSHClient(paramiko.SSHClient):
         # Return whatever we have in the output
         return SSHResult(rc=1, output=''.join(output), command=command)
 
+    def run_commands(
+            self, commands, timeout=RUNCMD_TIMEOUT, ensure_host=False, ensure_user=False,
+            container=None, max_sessions=MAX_SESSIONS):
+        """Run commands concurrently over SSH, each on its own channel of the one connection.
+
+        Args:
+            commands: The commands, like for :py:meth:`run_command`.
+            timeout: Timeout after which the commands still running fail.
+            ensure_host: See :py:meth:`run_command`.
+            ensure_user: See :py:meth:`run_command`.
+            container: See :py:meth:`run_command`.
+            max_sessions: How many of the commands run at once at most.
+        Returns:
+            A list of :py:class:`SSHResult` instances, in the order of the commands. Output of
+            stdout and stderr is interleaved like it arrived.
+        """
+        commands = list(commands)
+        pending = deque(enumerate(commands))
+        results = [None] * len(commands)
+        # channel -> index of the command, command and its output
+        running = {}
+        started = time.time()
+        try:
+            while pending or running:
+                while pending and len(running) < max_sessions:
+                    index, command = pending.popleft()
+                    command, uses_sudo = self._prepare_command(
+                        command, ensure_host, ensure_user, container)
+                    channel = self.get_transport().open_session()
+                    if uses_sudo:
+                        # We need a pseudo-tty for sudo
+                        channel.get_pty()
+                    channel.exec_command(command)
+                    running[channel] = index, command, []
+
+                # Sleep until any of the channels has output or finished
+                select.select(list(running), [], [], CHANNEL_WAIT)
+                for channel in list(running):
+                    index, command, output = running[channel]
+                    # All the output arrives before the exit status, read it after checking
+                    finished = channel.exit_status_ready()
+                    while channel.recv_ready():
+                        output.append(channel.recv(32768))
+                    while channel.recv_stderr_ready():
+                        output.append(channel.recv_stderr(32768))
+                    if finished:
+                        del running[channel]
+                        exit_status = channel.recv_exit_status()
+                        channel.close()
+                        if exit_status != 0:
+                            logger.warning('Exit code %d of %r!', exit_status, command)
+                        results[index] = SSHResult(
+                            rc=exit_status, output=_decode_output(output), command=command)
+
+                if timeout and running and time.time() - started > timeout:
+                    for channel, (index, command, output) in running.items():
+                        logger.error(
+                            "Command %r timed out. Output before it failed was:\n%r",
+                            command, _decode_output(output))
+                        results[index] = SSHResult(
+                            rc=1, output=_decode_output(output), command=command)
+                    break
+        except paramiko.SSHException:
+            logger.exception('Exception happened during SSH call')
+        finally:
+            for channel in running:
+                channel.close()
+
+        # Commands which never ran or failed in paramiko
+        return [
+            SSHResult(rc=1, output='', command=commands[index]) if result is None else result
+            for index, result in enumerate(results)]
+
+    def _prepare_command(self, command, ensure_host, ensure_user, container, stdin=False):
+        """Wrap the command for the container, pod and sudo, see :py:meth:`run_command`
+
+        With ``stdin``, the container or pod gets the stdin of the command.
+
+        Returns:
+            The command to run and whether it uses sudo
+        """
+        if isinstance(command, dict):
+            command = version.pick(command, active_version=self.vmdb_version)
+        original_command = command
+        uses_sudo = False
+        logger.info("Running command %r", command)
+        container = container or self._container
+        if self.is_pod and not ensure_host:
+            # This command will be executed in the context of the host provider
+            command_to_run = '[[ -f /etc/default/evm ]] && source /etc/default/evm; ' + command
+            oc_cmd = 'oc exec {i}--namespace={proj} {pod} -- bash -c {cmd}'.format(
+                i='-i ' if stdin else '', proj=self._project, pod=container,
+                cmd=quote(command_to_run))
+            command = oc_cmd
+            ensure_host = True
+        elif self.is_container and not ensure_host:
+            command = 'docker exec {}{} bash -c {}'.format(
+                '-i ' if stdin else '', container, quote('source /etc/default/evm; ' + command))
+
+        if self.username != 'root' and not ensure_user:
+            # We need sudo
+            command = 'sudo -i bash -c {command}'.format(command=quote(command))
+            uses_sudo = True
+
+        if command != original_command:
+            logger.info("> Actually running command %r", command)
+        command += '\n'
+        return command, uses_sudo
+
     def cpu_spike(self, seconds=60, cpus=2, **kwargs):
         """Creates a CPU spike of specific length and processes.
 
@@ -413,8 +550,16 @@ class SSHClient(paramiko.SSHClient):
             'cd /var/www/miq/vmdb; {pre}bin/rake -f /var/www/miq/vmdb/Rakefile {command}'.format(
                 command=command, pre=prefix), timeout=timeout, **kwargs)
 
-    def put_file(self, local_file, remote_file='.', **kwargs):
+    def put_file(self, local_file, remote_file='.', delta=False, **kwargs):
+        """Copy a local file to the appliance
+
+        With ``delta``, see :py:meth:`put_file_delta`.
+        """
         logger.info("Transferring local file %r to remote %r", local_file, remote_file)
+        if delta:
+            if self.username == 'root':
+                return self.put_file_delta(local_file, remote_file)
+            logger.warning('Delta transfers need root, sudo mangles the stream, using scp')
         if self.is_container:
             tempfilename = '/share/temp_{}'.format(fauxfactory.gen_alpha())
             logger.info('For this purpose, temporary file name is %r', tempfilename)
@@ -457,8 +602,16 @@ class SSHClient(paramiko.SSHClient):
                                                                    remote_file=remote_file))
             return scp
 
-    def get_file(self, remote_file, local_path='', **kwargs):
+    def get_file(self, remote_file, local_path='', delta=False, **kwargs):
+        """Copy a file from the appliance
+
+        With ``delta``, see :py:meth:`get_file_delta`.
+        """
         logger.info("Transferring remote file %r to local %r", remote_file, local_path)
+        if delta:
+            if self.username == 'root':
+                return self.get_file_delta(remote_file, local_path)
+            logger.warning('Delta transfers need root, sudo mangles the stream, using scp')
         base_name = os_path.basename(remote_file)
         if self.is_container:
             tmp_file_name = 'temp_{}'.format(fauxfactory.gen_alpha())
@@ -502,6 +655,123 @@ class SSHClient(paramiko.SSHClient):
             return SCPClient(self.get_transport(), progress=self._progress_callback).get(
                 remote_file, local_path, **kwargs)
 
+    def put_file_delta(self, local_file, remote_file='.'):
+        """Copy a local file to the appliance, compressed and skipping what is already there
+
+        The file is gzipped on the fly and streamed over a channel, straight into the container
+        or pod if there is one. An unchanged remote file is left alone. The transfer resumes
+        after the remote file's ``.part``, or after the remote file itself if the local one
+        has only grown since, as long as the MD5 sums of what is there match.
+
+        Returns:
+            The path of the remote file
+        """
+        if self.run_command('test -d {}'.format(quote(remote_file))).success:
+            remote_file = os_path.join(remote_file, os_path.basename(local_file))
+        part_file = '{}.part'.format(remote_file)
+        local_size = os_path.getsize(local_file)
+        remote_size = self._remote_size(remote_file)
+        offset = self._remote_size(part_file)
+        if offset is None and remote_size is not None:
+            if remote_size == local_size and self._same_prefix(local_file, remote_file, local_size):
+                logger.info('Remote %r is up to date', remote_file)
+                return remote_file
+            self.run_command('mv {} {}'.format(quote(remote_file), quote(part_file)))
+            offset = remote_size
+        if offset and (offset > local_size or not self._same_prefix(local_file, part_file, offset)):
+            offset = 0
+        logger.info('Streaming %r to %r from byte %s', local_file, remote_file, offset or 0)
+
+        channel = self._open_stream(
+            'gunzip -c {} {}'.format('>>' if offset else '>', quote(part_file)), stdin=True)
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        with open(local_file, 'rb') as local:
+            local.seek(offset or 0)
+            for chunk in iter(lambda: local.read(TRANSFER_CHUNK), b''):
+                channel.sendall(compressor.compress(chunk))
+        channel.sendall(compressor.flush())
+        channel.shutdown_write()
+        self._close_stream(channel, remote_file)
+        self.run_command('mv {} {}'.format(quote(part_file), quote(remote_file)))
+        return remote_file
+
+    def get_file_delta(self, remote_file, local_path=''):
+        """Copy a file from the appliance, compressed and skipping what is already here
+
+        The file is gzipped on the fly and streamed over a channel, straight out of the container
+        or pod if there is one. An unchanged local file is left alone. The transfer resumes
+        after the local file's ``.part``, or after the local file itself if the remote one has
+        only grown since (like logs do), as long as the MD5 sums of what is here match.
+
+        Returns:
+            The path of the local file
+        """
+        local_file = local_path
+        if not local_file or os_path.isdir(local_file):
+            local_file = os_path.join(local_file, os_path.basename(remote_file))
+        part_file = '{}.part'.format(local_file)
+        remote_size = self._remote_size(remote_file)
+        if remote_size is None:
+            raise IOError('Remote file {} not found'.format(remote_file))
+        if os_path.exists(local_file) and not os_path.exists(part_file):
+            local_size = os_path.getsize(local_file)
+            if local_size == remote_size and self._same_prefix(local_file, remote_file, local_size):
+                logger.info('Local %r is up to date', local_file)
+                return local_file
+            os.rename(local_file, part_file)
+        offset = os_path.getsize(part_file) if os_path.exists(part_file) else 0
+        if offset and (offset > remote_size or
+                not self._same_prefix(part_file, remote_file, offset)):
+            offset = 0
+        logger.info('Streaming %r to %r from byte %s', remote_file, local_file, offset)
+
+        # without pipefail, a tail failing would go unnoticed behind gzip's exit code
+        channel = self._open_stream('set -o pipefail; tail -c +{} {} | gzip -c -1'.format(
+            offset + 1, quote(remote_file)))
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        with open(part_file, 'r+b' if offset else 'wb') as local:
+            local.seek(offset)
+            local.truncate()
+            for chunk in iter(lambda: channel.recv(TRANSFER_CHUNK), b''):
+                local.write(decompressor.decompress(chunk))
+            local.write(decompressor.flush())
+        self._close_stream(channel, remote_file)
+        os.rename(part_file, local_file)
+        return local_file
+
+    def _open_stream(self, command, stdin=False):
+        """Start a command streaming binary data, without a pty"""
+        command, uses_sudo = self._prepare_command(command, False, False, None, stdin=stdin)
+        channel = self.get_transport().open_session()
+        channel.exec_command(command)
+        return channel
+
+    def _close_stream(self, channel, remote_file):
+        # drained first, the command could block on a full stderr before exiting otherwise
+        errors = _decode_output(iter(lambda: channel.recv_stderr(TRANSFER_CHUNK), b''))
+        exit_status = channel.recv_exit_status()
+        channel.close()
+        if exit_status != 0:
+            raise IOError('Transfer of {} failed with exit code {}: {}'.format(
+                remote_file, exit_status, errors))
+
+    def _remote_size(self, remote_file):
+        result = self.run_command('stat -c %s {}'.format(quote(remote_file)))
+        return int(result.output.strip()) if result.success else None
+
+    def _same_prefix(self, local_file, remote_file, size):
+        """Whether the first ``size`` bytes of a local and a remote file are the same"""
+        result = self.run_command('head -c {} {} | md5sum'.format(size, quote(remote_file)))
+        local_md5 = hashlib.md5()
+        with open(local_file, 'rb') as local:
+            while size > 0:
+                chunk = local.read(min(size, TRANSFER_CHUNK))
+                if not chunk:
+                    return False
+                local_md5.update(chunk)
+                size -= len(chunk)
+        return result.success and result.output.split()[0] == local_md5.hexdigest()
+
     def patch_file(self, local_path, remote_path, md5=None):
         """ Patches a single file on the appliance
 
@@ -667,45 +937,174 @@ class SSHClient(paramiko.SSHClient):
         return {"servers": servers, "workers": workers}
 
 
+class _HostOutput(object):
+    """Stream for the output of commands of a host, prefixing lines with the hostname"""
+    lock = Lock()
+
+    def __init__(self, hostname, stream):
+        self.hostname = hostname
+        self.stream = stream
+
+    def write(self, line):
+        with self.lock:
+            self.stream.write('[{}] {}'.format(self.hostname, line))
+
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+
+
+def _run_on_host(hostname, command, script, timeout, stream_output, connect_kwargs):
+    client = SSHClient(
+        stream_output=stream_output, hostname=hostname, stdout=_HostOutput(hostname, sys.stdout),
+        stderr=_HostOutput(hostname, sys.stderr), **connect_kwargs)
+    try:
+        if script is not None:
+            remote_script = '/tmp/{}'.format(os_path.basename(script))
+            client.put_file(script, remote_script)
+            command = 'bash {}'.format(remote_script)
+        return client.run_command(command, timeout=timeout, reraise=True)
+    except socket.timeout as e:
+        return SSHResult(rc=RC_TIMEOUT, output=str(e), command=command)
+    except Exception as e:
+        logger.exception('Failed to run %r on %s', command, hostname)
+        return SSHResult(rc=RC_SSH_ERROR, output=str(e), command=command)
+    finally:
+        client.close()
+
+
+def run_on_hosts(hosts, command=None, script=None, timeout=RUNCMD_TIMEOUT, stream_output=False,
+                 max_workers=FLEET_WORKERS, **connect_kwargs):
+    """Run a command or a script on many hosts at once, with a connection per host
+
+    Args:
+        hosts: Hostnames or IP addresses.
+        command: The command to run, like for :py:meth:`SSHClient.run_command`.
+        script: Path to a local shell script to copy to the hosts and run instead of a command.
+        timeout: Timeout for each host, after which its command fails.
+        stream_output: Stream the output of the commands, each line prefixed with its host.
+        max_workers: How many hosts to run the command on at once at most.
+        connect_kwargs: Passed to :py:class:`SSHClient`, the credentials default to those found
+            under ``ssh`` key in ``credentials.yaml``.
+    Returns:
+        An :py:class:`collections.OrderedDict` of hostname -> :py:class:`SSHResult`, in the
+        order of ``hosts``. The return code is :py:data:`RC_TIMEOUT` for hosts which timed out
+        and :py:data:`RC_SSH_ERROR` for hosts which could not be reached.
+    """
+    if (command is None) == (script is None):
+        raise ValueError('Pass either a command or a script')
+    connect_kwargs.setdefault('username', conf.credentials['ssh']['username'])
+    connect_kwargs.setdefault('password', conf.credentials['ssh']['password'])
+    connect_kwargs.setdefault('timeout', 10)
+    hosts = list(hosts)
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        host_futures = [
+            executor.submit(
+                _run_on_host, hostname, command, script, timeout, stream_output, connect_kwargs)
+            for hostname in hosts]
+    return OrderedDict(
+        (hostname, future.result()) for hostname, future in zip(hosts, host_futures))
+
+
+def _decode_output(output):
+    output = b''.join(output)
+    return output if six.PY2 else output.decode('utf-8', 'replace')
+
+
 class SSHTail(SSHClient):
+    """Tail a remote file, yielding the lines appended since the last iteration
 
-    def __init__(self, remote_filename, **connect_kwargs):
+    Every iteration runs one command over the connection, which is kept open in between. The
+    command reads the new part of the file in blocks and only sends back complete lines, a line
+    still being written is picked up by the next iteration. When the file was rotated (it got
+    a new inode or shrank), the tail starts over at the beginning of the new file.
+
+    Args:
+        remote_filename: The file to tail.
+        filters: Extended regular expressions (as with ``grep -E``), only the lines matching any
+            of them are sent over, the rest is skipped on the appliance.
+    """
+    def __init__(self, remote_filename, filters=None, **connect_kwargs):
         super(SSHTail, self).__init__(stream_output=False, **connect_kwargs)
         self._remote_filename = remote_filename
-        self._sftp_client = None
+        self._filter = '|'.join('({})'.format(pattern) for pattern in filters or [])
         self._remote_file_size = None
+        self._remote_inode = None
 
     def __iter__(self):
         for line in self.raw_lines():
             yield line.rstrip()
 
+    def _tail_command(self):
+        # Prints the inode and the offset the tail starts at, then the new complete lines
+        # (matching the filter) and lastly how many bytes of the file were consumed
+        return (
+            "stat=$(stat -L -c '%s %i' {file}) || exit; set -- $stat; "
+            "if [ \"$2\" = {inode} ] && [ \"$1\" -ge {offset} ]; "
+            "then start={offset}; else start=0; fi; "
+            "echo \"$2 $start\"; "
+            "tail -c +$((start + 1)) {file} | head -c $(($1 - start)) | "
+            "TAIL_FILTER={filter} LC_ALL=C awk -v size=$(($1 - start)) "
+            "'p + length($0) + 1 > size {{exit}} "
+            "{{p += length($0) + 1}} "
+            "{match}{{print}} "
+            "END {{print p + 0}}'".format(
+                file=quote(self._remote_filename), inode=self._remote_inode or 0,
+                offset=self._remote_file_size, filter=quote(self._filter or '.'),
+                match='$0 ~ ENVIRON["TAIL_FILTER"] ' if self._filter else ''))
+
     def raw_lines(self):
-        with self as sshtail:
-            fstat = sshtail._sftp_client.stat(self._remote_filename)
-            if self._remote_file_size is not None:
-                if self._remote_file_size < fstat.st_size:
-                    remote_file = self._sftp_client.open(self._remote_filename, 'r')
-                    remote_file.seek(self._remote_file_size, 0)
-                    while (remote_file.tell() < fstat.st_size):
-                        line = remote_file.readline()  # Note the  missing rstrip() here!
-                        yield line
-            self._remote_file_size = fstat.st_size
+        if self._remote_file_size is None:
+            # Nothing to compare the file to yet, the next iteration starts at its current end
+            self.set_initial_file_end()
+            return
+        command, uses_sudo = self._prepare_command(self._tail_command(), False, False, None)
+        channel = self.get_transport().open_session()
+        try:
+            if uses_sudo:
+                # We need a pseudo-tty for sudo
+                channel.get_pty()
+            channel.exec_command(command)
+            header = last = None
+            pending = b''
+            for block in iter(lambda: channel.recv(TRANSFER_CHUNK), b''):
+                lines = (pending + block).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    if header is None:
+                        header = line
+                        continue
+                    # The last line is the byte count, hold every line back until the next one
+                    if last is not None:
+                        yield _decode_output([last, b'\n'])
+                    last = line
+            exit_status = channel.recv_exit_status()
+        finally:
+            channel.close()
+        if exit_status != 0 or last is None:
+            logger.warning('Could not tail %r, exit code %d', self._remote_filename, exit_status)
+            return
+        inode, start = header.split()
+        if int(start) == 0 and self._remote_file_size:
+            logger.info('%r was rotated, tailing it from the start', self._remote_filename)
+        self._remote_inode = int(inode)
+        self._remote_file_size = int(start) + int(last)
 
     def raw_string(self):
         return ''.join(self)
 
     def __enter__(self):
-        self.connect(**self._connect_kwargs)
-        self._sftp_client = self.open_sftp()
+        self.connect()
         return self
 
-    def __exit__(self, *args, **kwargs):
-        self._sftp_client.close()
-
     def set_initial_file_end(self):
-        with self as sshtail:
-            fstat = sshtail._sftp_client.stat(self._remote_filename)
-            self._remote_file_size = fstat.st_size  # Seed initial size of file
+        result = self.run_command("stat -L -c '%s %i' {}".format(quote(self._remote_filename)))
+        if result.success:
+            size, inode = result.output.split()
+            self._remote_file_size, self._remote_inode = int(size), int(inode)
+        else:
+            # Whatever appears at the path is new
+            self._remote_file_size, self._remote_inode = 0, None
 
     def lines_as_list(self):
         """Return lines as list"""
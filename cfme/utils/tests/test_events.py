@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from cfme.utils.events import Event, EventAttr, ExpectedEvents
+
+
+def event(**attrs):
+    return Event(None, *[EventAttr(**{name: value}) for name, value in attrs.items()])
+
+
+@pytest.fixture
+def expected():
+    expected = ExpectedEvents()
+    for evt in [
+            event(event_type='vm_create', target_type='VmOrTemplate', target_id=1),
+            event(event_type='vm_create', target_type='VmOrTemplate', target_id=2),
+            event(event_type='vm_create'),
+            event(event_type='vm_start', target_type='VmOrTemplate', target_id=1),
+            event(target_type='VmOrTemplate', target_name='my_vm'),
+            Event(None, EventAttr(event_type='vm', cmp_func=lambda a, b: b.startswith(a)))]:
+        expected.append({'event': evt, 'matched_events': [], 'first_event': False})
+    return expected
+
+
+def candidates(expected, got_event):
+    positions = {id(exp_event): i for i, exp_event in enumerate(expected)}
+    return [positions[id(exp_event)] for exp_event in expected.candidates(got_event)]
+
+
+@pytest.mark.parametrize(('got_event', 'result'), [
+    (event(event_type='vm_create', target_type='VmOrTemplate', target_id=1), [0, 2, 4, 5]),
+    (event(event_type='vm_start', target_type='VmOrTemplate', target_id=1), [3, 4, 5]),
+    (event(event_type='host_add', target_type='Host', target_id=1), [5]),
+    (event(event_type='vm_create', target_type=None, target_id=None), [2, 5]),
+    # without the indexed attributes, it can't be narrowed down
+    (event(event_type='vm_create'), [0, 1, 2, 3, 4, 5]),
+])
+def test_expected_events_candidates(expected, got_event, result):
+    assert candidates(expected, got_event) == result
+    # the candidates are all the expected events which may match
+    matching = [i for i, exp_event in enumerate(expected) if exp_event['event'].matches(got_event)]
+    assert set(matching) <= set(result)
+
+
+def test_expected_events_reindex(expected):
+    got_event = event(event_type='vm_create', target_type='VmOrTemplate', target_id=3)
+    assert candidates(expected, got_event) == [2, 4, 5]
+    exp_event = list(expected)[4]
+    exp_event['event'].add_attrs(EventAttr(target_id=4))
+    expected.reindex(exp_event)
+    assert candidates(expected, got_event) == [2, 5]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from cfme.utils.events_db import EventStreamsNotifier, NOTIFY_CHANNEL
+
+
+class FakeCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql):
+        self.connection.executed.append(sql)
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    """Stands in for a psycopg2 connection, a notification is a byte written to the pipe"""
+    def __init__(self):
+        self.autocommit = False
+        self.executed = []
+        self.notifies = []
+        self.reader, self.writer = os.pipe()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def fileno(self):
+        return self.reader
+
+    def poll(self):
+        for _ in os.read(self.reader, 1024):
+            self.notifies.append(NOTIFY_CHANNEL)
+
+    def notify(self):
+        os.write(self.writer, b'x')
+
+    def close(self):
+        os.close(self.reader)
+        os.close(self.writer)
+
+
+@pytest.fixture
+def notifier():
+    notifier = EventStreamsNotifier(FakeConnection())
+    yield notifier
+    notifier.close()
+
+
+def test_notifier_listens(notifier):
+    notifier.listen()
+    assert notifier.connection.autocommit
+    assert 'CREATE TRIGGER {}'.format(NOTIFY_CHANNEL) in notifier.connection.executed[0]
+    assert notifier.connection.executed[1] == 'LISTEN {}'.format(NOTIFY_CHANNEL)
+
+
+def test_notifier_wait(notifier):
+    assert not notifier.wait(0.01)
+    notifier.connection.notify()
+    notifier.connection.notify()
+    assert notifier.wait(0.01)
+    # both notifications were consumed at once
+    assert not notifier.wait(0.01)
+
+
+def test_notifier_close_leaves_trigger():
+    # other listeners on the appliance may still be using the trigger
+    connection = FakeConnection()
+    notifier = EventStreamsNotifier(connection)
+    notifier.listen()
+    notifier.close()
+    assert connection.executed[-1] == 'UNLISTEN {}'.format(NOTIFY_CHANNEL)
+    assert not any('DROP TRIGGER' in sql for sql in connection.executed)
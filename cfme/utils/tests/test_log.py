@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from cfme.utils.log import ArtifactorHandler
+
+
+class FakeArtifactor(object):
+    def __init__(self):
+        self.hooks = []
+
+    def fire_hook(self, hook_name, **kwargs):
+        self.hooks.append((hook_name, kwargs))
+
+
+def test_artifactor_handler_batches():
+    handler = ArtifactorHandler(batch_size=3, batch_interval=0.1)
+    handler.artifactor = FakeArtifactor()
+    handler.slaveid = 'gw0'
+    log = logging.getLogger('test_artifactor_handler_batches')
+    log.propagate = False
+    log.addHandler(handler)
+    try:
+        for i in range(7):
+            log.warning('message %s', i)
+        try:
+            raise ValueError('oops')
+        except ValueError:
+            log.exception('failed')
+        handler.flush()
+    finally:
+        log.removeHandler(handler)
+    hooks = handler.artifactor.hooks
+    assert set(hook_name for hook_name, _ in hooks) == {'log_messages'}
+    assert all(len(kwargs['log_records']) <= 3 for _, kwargs in hooks)
+    assert all(kwargs['slaveid'] == 'gw0' for _, kwargs in hooks)
+    records = [record for _, kwargs in hooks for record in kwargs['log_records']]
+    assert [record['msg'] for record in records] == (
+        ['message {}'.format(i) for i in range(7)] + ['failed'])
+    assert all(record['args'] is None and record['exc_info'] is None for record in records)
+    assert 'ValueError: oops' in records[-1]['exc_text']
+
+
+def test_artifactor_handler_flush_ships_now():
+    handler = ArtifactorHandler(batch_interval=30)
+    handler.artifactor = FakeArtifactor()
+    record = logging.LogRecord('cfme', logging.INFO, __file__, 1, 'message', None, None)
+    for _ in range(10):
+        handler.handle(record)
+        started = time.time()
+        handler.flush()
+        assert time.time() - started < 1
+    assert len(handler.artifactor.hooks) == 10
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from cfme.utils.log_validator import PatternMatcher
+
+
+@pytest.mark.parametrize(('line', 'expected'), [
+    ('[----] E, ERROR -- : failed', '.*ERROR.*'),
+    ('[----] I, INFO -- : MIQ(MiqServer#start) started', r'.*MIQ\((\w+)#start\)'),
+    ('[----] W, WARN -- : again again', r'.*(again) \1'),
+    ('[----] I, INFO -- : nothing', None),
+])
+def test_pattern_matcher_match(line, expected):
+    matcher = PatternMatcher(
+        ['.*ERROR.*', r'.*MIQ\((\w+)#start\)', r'.*(again) \1', 'INFO'])
+    assert matcher.match(line) == expected
+
+
+def test_pattern_matcher_match_all():
+    matcher = PatternMatcher(['.*ERROR.*', '.*failed', '(?P<name>.*)ERROR', 'INFO'])
+    assert matcher.match_all('ERROR failed') == ['.*ERROR.*', '.*failed', '(?P<name>.*)ERROR']
+    assert matcher.match_all('WARN') == []
+    assert not PatternMatcher([])
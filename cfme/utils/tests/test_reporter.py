@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import json
+
+from artifactor.plugins.reporter import (
+    Reporter, cluster_tracebacks, minhash, traceback_signature, write_tb_clusters)
+
+TIMEOUT_TB = """Traceback (most recent call last):
+  File "cfme/tests/infrastructure/test_vm_power_control.py", line {line}, in test_power_off
+    vm.wait_for_vm_state_change(desired_state='off', timeout={timeout})
+  File "cfme/common/vm.py", line 1021, in wait_for_vm_state_change
+    wait_for(_looking_for_state_change, num_sec=timeout)
+TimedOutError: Could not do 'vm {vm_id} to be off' at 0x{address} in time ({took}s)"""
+
+KEY_ERROR_TB = """Traceback (most recent call last):
+  File "cfme/fixtures/provider.py", line 211, in setup_one_or_skip
+    provider = list_providers(filters)[0]
+IndexError: list index out of range"""
+
+
+def test_finish_session_renders_report(tmpdir, monkeypatch):
+    reporter = Reporter('reporter', {'report_interval': 3600}, None)
+    reporter.configure()
+    provider_reports = []
+    monkeypatch.setattr(
+        reporter, '_run_provider_report', lambda *args: provider_reports.append(args))
+    artifacts = {'cfme/tests/test_a.py/test_first': {
+        'statuses': {'call': ('passed', False)}, 'start_time': 1, 'finish_time': 2}}
+    reporter.run_report(artifacts, tmpdir.strpath)
+    artifacts['cfme/tests/test_a.py/test_last'] = {
+        'statuses': {'call': ('failed', False)}, 'start_time': 2, 'finish_time': 3}
+    # within the report interval, so not rendered
+    reporter.run_report(artifacts, tmpdir.strpath)
+    assert 'test_last' not in tmpdir.join('report.html').read()
+
+    # what the artifactor calls at the end of the session
+    reporter.callbacks['finish_session']['func'](artifacts, tmpdir.strpath)
+    assert 'test_last' in tmpdir.join('report.html').read()
+    assert tmpdir.join('tracebacks.json').check()
+    assert len(provider_reports) == 1
+
+
+def test_traceback_signature_hides_ids_and_numbers():
+    first = TIMEOUT_TB.format(
+        line=52, timeout=600, vm_id='3f2b6c1e-0d4a-4b8e-9c7f-1a2b3c4d5e6f', address='7f3a2c',
+        took=601.2)
+    second = TIMEOUT_TB.format(
+        line=60, timeout=900, vm_id='0a1b2c3d-4e5f-6071-8293-a4b5c6d7e8f9', address='7f9e10',
+        took=905.8)
+    assert traceback_signature(first) == traceback_signature(second)
+    assert '\n' not in traceback_signature(first)
+
+
+def test_minhash_splits_on_whitespace():
+    assert minhash('a b\nc  d') == minhash('a b c d')
+
+
+def test_cluster_tracebacks():
+    timeouts = [
+        (TIMEOUT_TB.format(line=52 + i, timeout=600, vm_id='{:032x}'.format(i * 7919),
+                           address='{:x}'.format(0x7f0000 + i), took=600 + i),
+         'test_timeout_{}'.format(i))
+        for i in range(5)]
+    key_errors = [(KEY_ERROR_TB, 'test_key_error_{}'.format(i)) for i in range(2)]
+    clusters = cluster_tracebacks([timeouts[0], key_errors[0]] + timeouts[1:] + key_errors[1:])
+    assert [sorted(test for _, test in cluster) for cluster in clusters] == [
+        sorted(test for _, test in timeouts), sorted(test for _, test in key_errors)]
+
+
+def test_cluster_tracebacks_merges_similar():
+    frames = ''.join(
+        '  File "cfme/utils/mod{0}.py", line 1{0}, in func_{0}\n'
+        '    return func_{1}(arg_{0}, key=value_{0})\n'.format(i, i + 1) for i in range(12))
+    deep = 'Traceback (most recent call last):\n' + frames + 'ValueError: bad value'
+    # the same failure, through another function in the middle of the stack
+    other = deep.replace('func_5(', 'other_func(')
+    clusters = cluster_tracebacks([(deep, 'test_a'), (KEY_ERROR_TB, 'test_b'), (other, 'test_c')])
+    assert [[test for _, test in cluster] for cluster in clusters] == [
+        ['test_a', 'test_c'], ['test_b']]
+
+
+def test_write_tb_clusters(tmpdir):
+    tb_errors = [(KEY_ERROR_TB, 'test_a'), (KEY_ERROR_TB, 'test_b')]
+    write_tb_clusters(cluster_tracebacks(tb_errors), tmpdir.strpath)
+    data = json.loads(tmpdir.join('tracebacks.json').read())
+    assert data == [{
+        'signature': traceback_signature(KEY_ERROR_TB),
+        'count': 2,
+        'traceback': KEY_ERROR_TB,
+        'tests': ['test_a', 'test_b'],
+    }]
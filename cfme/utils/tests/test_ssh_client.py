@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import pytest
 from cfme.utils.appliance import DummyAppliance
+from cfme.utils.ssh import SSHTail
 pytestmark = [
     pytest.mark.nondestructive,
     pytest.mark.skip_selenium,
@@ -20,6 +21,32 @@ def test_ssh_client_run_command(appliance):
     assert 'Testing!' in result.output
 
 
+def test_ssh_client_run_commands(appliance):
+    # Make sure commands run at once over one connection keep their order and exit codes
+    results = appliance.ssh_client.run_commands(
+        ['sleep 1; echo {}; exit {}'.format(i, i % 2) for i in range(12)], max_sessions=4)
+    assert [result.rc for result in results] == [i % 2 for i in range(12)]
+    assert [result.output.strip() for result in results] == [str(i) for i in range(12)]
+
+
+def test_ssh_tail(appliance):
+    # Make sure only complete new lines matching the filters come through, across rotations
+    log = '/tmp/test_ssh_tail.log'
+    appliance.ssh_client.run_command('echo old > {}'.format(log))
+    tail = SSHTail(log, filters=['ERROR', 'done$'])
+    tail.set_initial_file_end()
+    appliance.ssh_client.run_command(
+        r'printf "INFO a\nERROR b\nERROR partial" >> {}'.format(log))
+    assert list(tail) == ['ERROR b']
+    appliance.ssh_client.run_command(r'printf " done\n" >> {}'.format(log))
+    assert list(tail) == ['ERROR partial done']
+    appliance.ssh_client.run_command(
+        r'mv {0} {0}.1; printf "ERROR rotated\n" > {0}'.format(log))
+    assert list(tail) == ['ERROR rotated']
+    tail.close()
+    appliance.ssh_client.run_command('rm -f {0} {0}.1'.format(log))
+
+
 def test_scp_client_can_put_a_file(appliance, tmpdir):
     # Make sure we can put a file, get a file, and they all match
     tmpfile = tmpdir.mkdir("sub").join("temp.txt")
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Tests of the delta transfers of SSHClient, with the "appliance" being a local bash"""
+import os
+import subprocess
+
+import pytest
+
+from cfme.utils.ssh import SSHClient, SSHResult
+
+
+class FakeChannel(object):
+    """Stands in for a paramiko channel, running the command locally"""
+    def __init__(self, command):
+        self.process = subprocess.Popen(
+            ['bash', '-c', command],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def recv(self, size):
+        return os.read(self.process.stdout.fileno(), size)
+
+    def recv_stderr(self, size):
+        return os.read(self.process.stderr.fileno(), size)
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+
+    def shutdown_write(self):
+        self.process.stdin.close()
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def close(self):
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.commands = []
+
+    def open_session(self):
+        return self
+
+    def exec_command(self, command):
+        self.commands.append(command)
+        self.channel = FakeChannel(command)
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
+
+
+class LocalSSHClient(SSHClient):
+    def __init__(self):
+        super(LocalSSHClient, self).__init__(hostname='localhost', username='root')
+        self.transport = FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def run_command(self, command, **kwargs):
+        process = subprocess.Popen(
+            ['bash', '-c', command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0].decode('utf-8')
+        return SSHResult(command, process.returncode, output)
+
+    @property
+    def streamed_from(self):
+        """The offsets the file was streamed from, by the ``tail`` of the streams"""
+        return [int(command.split()[5].lstrip('+')) - 1 for command in self.transport.commands]
+
+
+@pytest.fixture
+def client():
+    client = LocalSSHClient()
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def remote(tmpdir):
+    remote = tmpdir.mkdir('remote').join('evm.log')
+    remote.write_binary(b''.join(b'line %d\n' % i for i in range(10000)))
+    return remote
+
+
+@pytest.fixture
+def local(tmpdir):
+    return tmpdir.mkdir('local').join('evm.log')
+
+
+def test_get_file_delta_up_to_date(client, remote, local):
+    assert client.get_file_delta(remote.strpath, local.strpath) == local.strpath
+    assert local.read_binary() == remote.read_binary()
+    client.get_file_delta(remote.strpath, local.strpath)
+    assert client.streamed_from == [0]
+
+
+def test_get_file_delta_resumes_grown_file(client, remote, local):
+    local.write_binary(remote.read_binary())
+    remote.write(b'more\n', mode='ab')
+    client.get_file_delta(remote.strpath, local.strpath)
+    assert local.read_binary() == remote.read_binary()
+    assert client.streamed_from == [remote.size() - 5]
+
+
+def test_get_file_delta_resumes_part(client, remote, local):
+    part = local.new(basename='evm.log.part')
+    part.write_binary(remote.read_binary()[:1000])
+    client.get_file_delta(remote.strpath, local.dirname)
+    assert local.read_binary() == remote.read_binary()
+    assert not part.exists()
+    assert client.streamed_from == [1000]
+
+
+def test_get_file_delta_restarts_on_prefix_mismatch(client, remote, local):
+    local.write_binary(b'rotated' + remote.read_binary()[7:1000])
+    client.get_file_delta(remote.strpath, local.strpath)
+    assert local.read_binary() == remote.read_binary()
+    assert client.streamed_from == [0]
+
+
+def test_put_file_delta_resumes_part(client, remote, local):
+    local.write_binary(remote.read_binary() + b'more\n')
+    remote.new(basename='evm.log.part').write_binary(remote.read_binary())
+    remote.remove()
+    assert client.put_file_delta(local.strpath, remote.dirname) == remote.strpath
+    assert remote.read_binary() == local.read_binary()
+    assert 'gunzip -c >>' in client.transport.commands[0]
+
+
+def test_get_file_delta_failure_raises(client, local, tmpdir):
+    # tail fails on a directory, behind gzip which doesn't
+    with pytest.raises(IOError):
+        client.get_file_delta(tmpdir.mkdir('directory').strpath, local.strpath)
+    assert not local.exists()
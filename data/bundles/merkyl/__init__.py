@@ -1,4 +1,6 @@
-from bottle import request, route, run, template
+from bottle import request, route, run, template, ServerAdapter
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer
 import os
 import subprocess
 import tempfile
@@ -46,6 +48,9 @@ class Log(object):
         with open(self.f.name, "rb") as infile:
             return infile.read()
 
+    def open(self):
+        return open(self.f.name, "rb")
+
     def size(self):
         if self.running:
             return os.path.getsize(self.f.name)
@@ -128,7 +133,13 @@ def lister():
 
 @route('/get/<name>')
 def get(name):
-    return Loggers[name].get()
+    # bottle streams the file
+    return Loggers[name].open()
+
+
+@route('/sizes')
+def sizes():
+    return dict((name, logger.size()) for name, logger in Loggers.items())
 
 
 @route('/reset/<name>')
@@ -173,8 +184,18 @@ def quit():
     sys.stderr.close()
 
 
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class ThreadingWSGIRefServer(ServerAdapter):
+    """wsgiref serving each request in a thread, so the logs of a test are fetched at once"""
+    def run(self, app):
+        make_server(self.host, self.port, app, ThreadingWSGIServer).serve_forever()
+
+
 def main():
-    run(host='0.0.0.0', port=sys.argv[1])
+    run(host='0.0.0.0', port=sys.argv[1], server=ThreadingWSGIRefServer)
 
 
 if __name__ == "__main__":
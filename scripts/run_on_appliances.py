@@ -0,0 +1,69 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Run a shell command or script on appliance(s) given their IPs, all at once
+
+See :py:func:`cfme.utils.ssh.run_on_hosts`.
+
+Example usage:
+
+    ``scripts/run_on_appliances.py 'systemctl restart evmserverd' 1.2.3.4 2.3.4.5``
+
+    ``scripts/run_on_appliances.py --script cleanup.sh --timeout 600 1.2.3.4 2.3.4.5``
+
+The output of the commands is streamed to the stdout as it comes, each line prefixed with the
+appliance, unless ``--quiet``. A summary of the return codes follows.
+
+Returns 0 if the command succeeded on all of the appliances.
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+
+from cfme.utils.conf import credentials
+from cfme.utils.ssh import run_on_hosts, RUNCMD_TIMEOUT, FLEET_WORKERS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(epilog=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', nargs='?', default=None,
+        help='Shell command to run, unless --script is given')
+    parser.add_argument('appliances', nargs='+',
+        help='Appliance IPs to run the command on')
+    parser.add_argument('--script', default=None,
+        help='Local shell script to copy to the appliances and run')
+    parser.add_argument('--timeout', type=float, default=RUNCMD_TIMEOUT,
+        help='Seconds after which the command fails on an appliance')
+    parser.add_argument('--workers', type=int, default=FLEET_WORKERS,
+        help='How many appliances to run the command on at once')
+    parser.add_argument('--username', default=credentials['ssh']['username'],
+        help='SSH username for the appliances')
+    parser.add_argument('--password', default=credentials['ssh']['password'],
+        help='SSH password for the appliances')
+    parser.add_argument('-q', '--quiet', action='store_true', default=False,
+        help='Do not print output of SSH commands')
+    args = parser.parse_args()
+    if args.script is not None and args.command is not None:
+        # With --script, the first positional argument is an appliance as well
+        args.appliances.insert(0, args.command)
+        args.command = None
+    return args
+
+
+def main(args):
+    results = run_on_hosts(
+        args.appliances, command=args.command, script=args.script, timeout=args.timeout,
+        stream_output=not args.quiet, max_workers=args.workers, username=args.username,
+        password=args.password)
+    print('=== Results:')
+    rc = 0
+    for appliance, result in results.items():
+        print('{}: {}'.format(appliance, result.rc))
+        if result.failed:
+            rc = 1
+    return rc
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))